@@ -0,0 +1,12 @@
+''' Benchmark delle viste: per ogni URL con nome (core/urls.py e il catalogo)
+latenza p50/p95, numero di query SQL e picco di memoria, misurati con il
+client di test su un dataset sintetico (core.dataset) in un database di
+test creato e distrutto dal comando.
+
+    python manage.py benchmark_viste                      # confronta con la baseline
+    python manage.py benchmark_viste --aggiorna-baseline  # riscrive benchmarks/baseline.json
+
+Il numero di query non dipende dalla macchina e ogni aumento è una
+regressione; latenza e memoria sono confrontate con una tolleranza, e
+hanno senso solo rispetto a una baseline registrata sulla stessa macchina.
+'''
@@ -0,0 +1,43 @@
+''' Documenti del benchmark: core.dataset genera catalogo, profili e
+prestiti, qui si aggiungono i documenti, con testo estratto e anteprime già
+presenti come dopo il lavoro dei job.
+'''
+import base64
+import os
+from django.core.files.base import ContentFile
+from core.anteprime import nomi_anteprime
+from core.counts import invalida_conteggi
+from core.models import Documento
+
+__all__ = ['crea_documenti']
+
+PDF = (b'%PDF-1.4\n1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n'
+       b'2 0 obj << /Type /Pages /Kids [] /Count 0 >> endobj\n'
+       b'trailer << /Root 1 0 R >>\n%%EOF\n')
+# PNG 1x1 trasparente
+PNG = base64.b64decode('iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR4nGNgYGBgAAAABQABpfZFQAAAAABJRU5ErkJggg==')
+
+# un documento su questi è riservato all'amministrazione
+OGNI_AMMINISTRAZIONE = 10
+
+
+def crea_documenti(utente, quanti, batch=500):
+    ''' `quanti` documenti dell'utente, tutti con lo stesso file (come i
+    duplicati di uno stesso contenuto).
+    '''
+    primo = Documento.objects.create(user=utente, nome='Documento 00000',
+                                     file=ContentFile(PDF, name='benchmark.pdf'))
+    storage = primo.file.storage
+    for nome in nomi_anteprime(storage, primo.file.name).values():
+        os.makedirs(os.path.dirname(storage.path(nome)), exist_ok=True)
+        with open(storage.path(nome), 'wb') as immagine:
+            immagine.write(PNG)
+    Documento.objects.bulk_create([
+        Documento(user=utente, nome='Documento {:05d}'.format(indice), file=primo.file.name,
+                  descrizione='Documento generato per il benchmark',
+                  is_amministrazione=indice % OGNI_AMMINISTRAZIONE == 0)
+        for indice in range(1, quanti)], batch_size=batch)
+    Documento.objects.update(testo='Verbale della riunione del consiglio di biblioteca',
+                             stato_testo=Documento.TESTO_ESTRATTO,
+                             stato_anteprima=Documento.ANTEPRIMA_GENERATA)
+    invalida_conteggi(Documento)
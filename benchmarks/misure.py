@@ -0,0 +1,97 @@
+''' Misura degli scenari con il client di test e confronto con la baseline. '''
+import gc
+import math
+import os
+import time
+import tracemalloc
+from collections import namedtuple
+from django.contrib import messages
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.test.utils import CaptureQueriesContext
+from .scenari import ScenarioNonEseguibile, richiesta
+
+__all__ = ['BASELINE', 'Regressione', 'confronta', 'misura', 'percentile']
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+Regressione = namedtuple('Regressione', 'scenario metrica baseline attuale')
+
+# sotto queste soglie una differenza è rumore, qualunque sia la tolleranza
+MARGINE_MS = 2.0
+MARGINE_KB = 64
+
+
+def percentile(valori, p):
+    ''' Percentile con il metodo nearest-rank. '''
+    ordinati = sorted(valori)
+    return ordinati[max(0, math.ceil(p / 100 * len(ordinati)) - 1)]
+
+
+def _esegui(client, scenario, contesto):
+    metodo, url, dati = richiesta(scenario, contesto)
+    risposta = getattr(client, metodo)(url, dati)
+    if risposta.streaming:
+        # una risposta in streaming lavora mentre viene letta
+        for _ in risposta.streaming_content:
+            pass
+        risposta.close()
+    if risposta.status_code != scenario.codice:
+        raise ScenarioNonEseguibile('{} {}: stato {} invece di {}'.format(
+            metodo.upper(), url, risposta.status_code, scenario.codice))
+    # le transizioni negate rispondono con lo stesso redirect di quelle riuscite
+    errori = [str(messaggio) for messaggio in getattr(risposta.wsgi_request, '_messages', [])
+              if messaggio.level == messages.ERROR]
+    if errori:
+        raise ScenarioNonEseguibile('{} {}: {}'.format(metodo.upper(), url, '; '.join(errori)))
+    return risposta
+
+
+def misura(client, scenario, contesto, ripetizioni, riscaldamento=3, using=DEFAULT_DB_ALIAS):
+    ''' Latenze delle `ripetizioni` richieste dopo il riscaldamento, poi una
+    richiesta strumentata per il numero di query e il picco di memoria
+    (tracemalloc rallenta, quindi non entra nelle latenze).
+    '''
+    # gli oggetti lasciati da generazione e scenari precedenti non pesano sulle latenze
+    gc.collect()
+    latenze = []
+    for indice in range(riscaldamento + ripetizioni):
+        inizio = time.perf_counter()
+        _esegui(client, scenario, contesto)
+        if indice >= riscaldamento:
+            latenze.append((time.perf_counter() - inizio) * 1000)
+    with CaptureQueriesContext(connections[using]) as query:
+        tracemalloc.start()
+        try:
+            _esegui(client, scenario, contesto)
+            picco = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {
+        'url': scenario.url,
+        'metodo': 'GET' if scenario.dati is None else 'POST',
+        'p50_ms': round(percentile(latenze, 50), 2),
+        'p95_ms': round(percentile(latenze, 95), 2),
+        'query': len(query),
+        'memoria_picco_kb': int(picco / 1024),
+    }
+
+
+def confronta(risultati, baseline, tolleranza=0.3, tolleranza_memoria=0.3):
+    ''' Regressioni dei risultati rispetto alla baseline: ogni query in più,
+    e latenza p95 o memoria oltre la tolleranza relativa (più un margine
+    fisso). Gli scenari senza baseline non sono confrontati.
+    '''
+    regressioni = []
+    for nome, attuale in risultati['scenari'].items():
+        base = baseline['scenari'].get(nome)
+        if base is None:
+            continue
+        if attuale['query'] > base['query']:
+            regressioni.append(Regressione(nome, 'query', base['query'], attuale['query']))
+        if attuale['p95_ms'] > base['p95_ms'] * (1 + tolleranza) + MARGINE_MS:
+            regressioni.append(Regressione(nome, 'p95_ms', base['p95_ms'], attuale['p95_ms']))
+        limite_kb = base['memoria_picco_kb'] * (1 + tolleranza_memoria) + MARGINE_KB
+        if attuale['memoria_picco_kb'] > limite_kb:
+            regressioni.append(Regressione(nome, 'memoria_picco_kb', base['memoria_picco_kb'],
+                                           attuale['memoria_picco_kb']))
+    return regressioni
@@ -0,0 +1,205 @@
+''' Scenari del benchmark: almeno uno per ogni URL con nome, più le varianti
+con i filtri usati più spesso. Le transizioni dei prestiti sono misurate
+con POST veri: ogni richiesta consuma un prestito o un libro, prelevato da
+riserve del Contesto disgiunte tra loro.
+'''
+import itertools
+from collections import namedtuple
+from django.urls import reverse
+from core.models import (Autore, Collana, Documento, Editore, Genere, Libro, Prestito, Profilo,
+                         SottoGenere)
+from core.settings import MAX_LIBRI_INPRESTITO
+from core.urls import urlpatterns
+
+__all__ = ['SCENARI', 'Contesto', 'Scenario', 'ScenarioNonEseguibile', 'richiesta', 'url_senza_scenario']
+
+# kwargs e dati (e i parametri non costanti): funzioni del Contesto, chiamate
+# a ogni richiesta
+Scenario = namedtuple('Scenario', 'nome url kwargs parametri dati codice')
+
+# prestiti restituiti insieme da operazioni_prestiti
+PRESTITI_PER_OPERAZIONE = 10
+
+
+class ScenarioNonEseguibile(Exception):
+    pass
+
+
+def get(nome, url, kwargs=None, codice=200, **parametri):
+    return Scenario(nome, url, kwargs, parametri, None, codice)
+
+
+def post(nome, url, dati, kwargs=None, codice=302):
+    return Scenario(nome, url, kwargs, {}, dati, codice)
+
+
+class Contesto:
+    ''' Oggetti del dataset su cui lavorano gli scenari. `richieste` è il
+    numero di richieste per scenario, e dà la dimensione delle riserve.
+    '''
+
+    def __init__(self, richieste):
+        self.richieste = richieste
+        self._primi = {}
+        self._riserve = {}
+        self._contatore = itertools.count(1)
+
+    def pk(self, modello, **filtri):
+        ''' Il primo oggetto (per pk) che soddisfa i filtri; sempre lo stesso. '''
+        chiave = (modello, tuple(sorted(filtri.items())))
+        if chiave not in self._primi:
+            pk = modello.objects.filter(**filtri).order_by('pk').values_list('pk', flat=True).first()
+            if pk is None:
+                raise ScenarioNonEseguibile('Nessun {} nel dataset ({})'.format(
+                    modello._meta.verbose_name, filtri))
+            self._primi[chiave] = pk
+        return self._primi[chiave]
+
+    def preleva(self, riserva, quanti=1):
+        if riserva not in self._riserve:
+            self._riserve[riserva] = getattr(self, '_riserva_' + riserva)(self.richieste * 20)
+        disponibili = self._riserve[riserva]
+        if len(disponibili) < quanti:
+            raise ScenarioNonEseguibile('Dataset troppo piccolo: riserva "{}" esaurita'.format(riserva))
+        prelevati = disponibili[-quanti:]
+        del disponibili[-quanti:]
+        return prelevati[0] if quanti == 1 else prelevati
+
+    def _riserva_richiesti(self, limite):
+        # al più un prestito per profilo: ogni consegna deve restare nel limite
+        profili = set()
+        pks = []
+        for pk, profilo in (Prestito.objects.filter(stato=Prestito.RICHIESTO,
+                                                    profilo__tot_libri__lt=MAX_LIBRI_INPRESTITO)
+                            .order_by('-pk').values_list('pk', 'profilo_id')):
+            if profilo not in profili:
+                profili.add(profilo)
+                pks.append(pk)
+                if len(pks) == limite:
+                    break
+        return pks[::-1]
+
+    def _riserva_in_corso(self, limite):
+        pks = Prestito.objects.filter(stato=Prestito.INCORSO).order_by('-pk').values_list('pk', flat=True)
+        return list(pks[:limite])[::-1]
+
+    def _riserva_libri_disponibili(self, limite):
+        # dalla fine: il primo libro disponibile resta agli scenari GET
+        pks = Libro.objects.filter(disponibile=True).order_by('-pk').values_list('pk', flat=True)
+        return list(pks[:limite])[::-1]
+
+    def _riserva_profili_liberi(self, limite):
+        pks = (Profilo.objects.filter(tot_richieste=0, data_fine_sospensione__isnull=True)
+               .order_by('-pk').values_list('pk', flat=True))
+        return list(pks[:limite])[::-1]
+
+    def nuovo_profilo(self):
+        numero = next(self._contatore)
+        return {
+            'nome': 'Benchmark',
+            'cognome': 'Profilo {}'.format(numero),
+            'codfisc': 'BNCPRF80A01H{:04d}'.format(numero % 10000),
+            'data_nascita': '01/01/1980',
+            'telefono': '0000000000',
+            'email': 'profilo{}@example.com'.format(numero),
+        }
+
+    def nuovo_bookmark(self):
+        return {'nome': 'Benchmark {}'.format(next(self._contatore)),
+                'urlname': 'elenco_prestiti', 'urlparams': 'stato=IC'}
+
+
+def _pk(modello, **filtri):
+    return lambda c: {'pk': c.pk(modello, **filtri)}
+
+
+def _libro_disponibile(c):
+    return {'libro_pk': c.pk(Libro, disponibile=True)}
+
+
+def _prestito(riserva):
+    return lambda c: {'pk': c.preleva(riserva)}
+
+
+def _richiesta_profilo_esistente(c):
+    return {'libro_pk': c.preleva('libri_disponibili')}
+
+
+SCENARI = [
+    # catalogo e dashboard
+    get('catalogo', 'catalogo'),
+    get('catalogo_ricerca', 'catalogo', titolo_isbn='mare'),
+    get('dashboard', 'dashboard'),
+    # prestiti
+    get('elenco_prestiti', 'elenco_prestiti'),
+    get('elenco_prestiti_richiesti', 'elenco_prestiti', stato=Prestito.RICHIESTO),
+    get('elenco_prestiti_scaduti', 'elenco_prestiti', scaduto='on'),
+    get('esporta_prestiti', 'esporta_prestiti', stato=Prestito.RICHIESTO),
+    get('dettaglio_prestito', 'dettaglio_prestito', _pk(Prestito, stato=Prestito.INCORSO)),
+    get('prestito_update_profilo', 'prestito_update_profilo', _libro_disponibile),
+    get('prestito_create_profilo', 'prestito_create_profilo', _libro_disponibile),
+    get('segnala_profilo', 'segnala_profilo', lambda c: {'profilo_pk': c.pk(Profilo)}),
+    # libri
+    get('elenco_libri', 'elenco_libri'),
+    get('elenco_libri_ricerca', 'elenco_libri', titolo_isbn='mare'),
+    get('esporta_libri', 'esporta_libri', genere=lambda c: c.pk(Genere, nome='Poesia')),
+    get('dettaglio_libro', 'dettaglio_libro', _pk(Libro)),
+    get('aggiungi_libro', 'aggiungi_libro'),
+    get('modifica_libro', 'modifica_libro', _pk(Libro)),
+    # documenti
+    get('elenco_documenti', 'elenco_documenti'),
+    get('esporta_documenti', 'esporta_documenti'),
+    get('aggiungi_documento', 'aggiungi_documento'),
+    get('dettaglio_documento', 'dettaglio_documento', _pk(Documento)),
+    get('scarica_documento', 'scarica_documento', _pk(Documento)),
+    get('anteprima_documento', 'anteprima_documento',
+        lambda c: {'pk': c.pk(Documento), 'formato': 'miniatura'}),
+    get('modifica_documento', 'modifica_documento', _pk(Documento)),
+    # anagrafiche
+    get('elenco_autori', 'elenco_autori'),
+    get('aggiungi_autore', 'aggiungi_autore'),
+    get('modifica_autore', 'modifica_autore', _pk(Autore)),
+    get('elenco_generi_sottogeneri', 'elenco_generi_sottogeneri'),
+    get('aggiungi_genere', 'aggiungi_genere'),
+    get('modifica_genere', 'modifica_genere', _pk(Genere)),
+    get('aggiungi_sottogenere', 'aggiungi_sottogenere'),
+    get('modifica_sottogenere', 'modifica_sottogenere', _pk(SottoGenere)),
+    get('elenco_editori_collane', 'elenco_editori_collane'),
+    get('aggiungi_editore', 'aggiungi_editore'),
+    get('modifica_editore', 'modifica_editore', _pk(Editore)),
+    get('aggiungi_collana', 'aggiungi_collana'),
+    get('modifica_collana', 'modifica_collana', _pk(Collana)),
+    # autocomplete
+    get('autore_dal', 'autore_dal', q='ro'),
+    get('editore_dal', 'editore_dal', q='ed'),
+    get('collana_dal', 'collana_dal', q='c'),
+    get('genere_dal', 'genere_dal', q='s'),
+    # transizioni dei prestiti, per ultime: cambiano il dataset
+    post('richiesta_prestito', 'prestito_update_profilo',
+         lambda c: {'profilo': c.preleva('profili_liberi')}, _richiesta_profilo_esistente),
+    post('richiesta_prestito_nuovo_profilo', 'prestito_create_profilo',
+         lambda c: c.nuovo_profilo(), _richiesta_profilo_esistente),
+    post('consegna_libro', 'consegna_libro', lambda c: {}, _prestito('richiesti')),
+    post('rifiuta_richiesta', 'rifiuta_richiesta', lambda c: {}, _prestito('richiesti')),
+    post('restituzione_libro', 'restituzione_libro', lambda c: {}, _prestito('in_corso')),
+    post('operazioni_prestiti', 'operazioni_prestiti',
+         lambda c: {'azione': 'restituzione',
+                    'prestiti': c.preleva('in_corso', PRESTITI_PER_OPERAZIONE)}, codice=200),
+    post('aggiungi_bookmark', 'aggiungi_bookmark', lambda c: c.nuovo_bookmark()),
+]
+
+
+def richiesta(scenario, contesto):
+    ''' (metodo, url, dati) della prossima richiesta dello scenario. '''
+    url = reverse(scenario.url, kwargs=scenario.kwargs(contesto) if scenario.kwargs else None)
+    if scenario.dati is None:
+        parametri = {chiave: valore(contesto) if callable(valore) else valore
+                     for chiave, valore in scenario.parametri.items()}
+        return 'get', url, parametri
+    return 'post', url, scenario.dati(contesto)
+
+
+def url_senza_scenario(scenari=SCENARI):
+    ''' URL con nome di core/urls.py (e il catalogo) non coperti da alcuno scenario. '''
+    nomi = {pattern.name for pattern in urlpatterns if pattern.name} | {'catalogo'}
+    return sorted(nomi - {scenario.url for scenario in scenari})
@@ -1,6 +1,9 @@
 from django.contrib import admin
+from django.utils import timezone
 from .models import (Libro, Autore, Genere, SottoGenere, Editore, Collana,
-                     Profilo, Segnalazione, Bookmark, Prestito, Documento)
+                     Profilo, Segnalazione, Bookmark, Prestito, Documento,
+                     StatisticheBiblioteca, Job)
+from .jobs import statistiche_coda
 
 
 @admin.register(Libro)
@@ -56,3 +59,31 @@ class PrestitoAdmin(admin.ModelAdmin):
 @admin.register(Documento)
 class DocumentoAdmin(admin.ModelAdmin):
     list_display = ('nome', 'data_upload', 'is_amministrazione')
+
+
+@admin.register(StatisticheBiblioteca)
+class StatisticheBibliotecaAdmin(admin.ModelAdmin):
+    list_display = ('prestiti_incorso', 'prestiti_richiesti', 'libri_disponibili',
+                    'libri_totali', 'data_riconciliazione')
+    readonly_fields = list_display
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'stato', 'priorita', 'tentativi', 'creato_at', 'iniziato_at',
+                    'completato_at', 'worker')
+    list_filter = ('stato', 'nome')
+    readonly_fields = ('nome', 'argomenti', 'tentativi', 'creato_at', 'iniziato_at',
+                       'completato_at', 'worker', 'errore')
+    actions = ['rimetti_in_coda']
+
+    def rimetti_in_coda(self, request, queryset):
+        n = (queryset.exclude(stato=Job.IN_CORSO)
+             .update(stato=Job.IN_CODA, tentativi=0, eseguire_dopo=timezone.now(), errore=''))
+        self.message_user(request, '{} job rimessi in coda.'.format(n))
+    rimetti_in_coda.short_description = 'Rimetti in coda i job selezionati'
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = extra_context or {}
+        extra_context['statistiche_coda'] = sorted(statistiche_coda().items())
+        return super().changelist_view(request, extra_context=extra_context)
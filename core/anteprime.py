@@ -0,0 +1,75 @@
+import multiprocessing
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from .counts import invalida_conteggi
+from .models import Documento
+from .renderizzatori import GENERATA, NON_DISPONIBILE, genera_anteprime
+from .settings import ANTEPRIMA_LATO, MINIATURA_LATO
+
+__all__ = ['nomi_anteprime', 'genera_in_attesa']
+
+STATI = {
+    GENERATA: Documento.ANTEPRIMA_GENERATA,
+    NON_DISPONIBILE: Documento.ANTEPRIMA_NON_DISPONIBILE,
+}
+LATI = {
+    'anteprima': ANTEPRIMA_LATO,
+    'miniatura': MINIATURA_LATO,
+}
+
+
+def nomi_anteprime(storage, nome):
+    ''' Nomi delle immagini generate dal file, per formato. '''
+    return OrderedDict((formato, storage.nome_derivato(nome, formato)) for formato in Documento.FORMATI_ANTEPRIMA)
+
+
+def genera_in_attesa(limite=100, processi=None, using=DEFAULT_DB_ALIAS):
+    ''' Genera su un pool di processi anteprima e miniatura di al massimo
+    `limite` documenti in attesa, una volta per file. Le immagini già
+    presenti accanto al file (stesso contenuto) non vengono rigenerate.
+    Restituisce il numero di documenti per stato finale.
+    '''
+    in_attesa = (Documento.objects.using(using)
+                 .filter(stato_anteprima=Documento.ANTEPRIMA_IN_ATTESA)
+                 .order_by('pk')
+                 .values_list('pk', 'file')[:limite])
+    per_file = OrderedDict()
+    for pk, nome in in_attesa:
+        per_file.setdefault(nome, []).append(pk)
+    esiti = Counter()
+    if not per_file:
+        return esiti
+
+    storage = Documento._meta.get_field('file').storage
+
+    def registra(nome, stato):
+        esiti[stato] += (Documento.objects.using(using)
+                         .filter(pk__in=per_file[nome], file=nome, stato_anteprima=Documento.ANTEPRIMA_IN_ATTESA)
+                         .update(stato_anteprima=stato, updated_at=timezone.now()))
+
+    da_generare = []
+    for nome in per_file:
+        if all(storage.exists(derivato) for derivato in nomi_anteprime(storage, nome).values()):
+            registra(nome, Documento.ANTEPRIMA_GENERATA)
+        else:
+            da_generare.append(nome)
+    if da_generare:
+        # spawn: il job gira nei thread di run_worker, e un fork copierebbe
+        # connessioni al database e lock tenuti dagli altri thread
+        with ProcessPoolExecutor(max_workers=processi, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futuri = {}
+            for nome in da_generare:
+                derivati = nomi_anteprime(storage, nome)
+                futuri[pool.submit(genera_anteprime, storage.path(nome),
+                                   storage.path(derivati['anteprima']), LATI['anteprima'],
+                                   storage.path(derivati['miniatura']), LATI['miniatura'])] = nome
+            for futuro in as_completed(futuri):
+                try:
+                    esito = futuro.result()
+                except Exception:
+                    esito = None
+                registra(futuri[futuro], STATI.get(esito, Documento.ANTEPRIMA_ERRORE))
+    invalida_conteggi(Documento)
+    return esiti
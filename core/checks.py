@@ -0,0 +1,16 @@
+from django.core.checks import Error, register
+from .prefix_index import indice_condiviso
+from .settings import INDICE_AUTOCOMPLETE, INDICE_AUTOCOMPLETE_CACHE
+
+
+@register()
+def controlla_indice_autocomplete(app_configs, **kwargs):
+    if INDICE_AUTOCOMPLETE and not indice_condiviso():
+        return [Error(
+            'La cache "{}" è nella memoria di ogni processo: le modifiche fatte in un processo '
+            'non invaliderebbero gli indici dell\'autocomplete degli altri.'.format(INDICE_AUTOCOMPLETE_CACHE),
+            hint='Impostare BIBLIOTECA_INDICE_AUTOCOMPLETE_CACHE su una cache condivisa '
+                 '(memcached, redis), oppure BIBLIOTECA_INDICE_AUTOCOMPLETE = False.',
+            id='core.E001',
+        )]
+    return []
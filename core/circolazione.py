@@ -0,0 +1,186 @@
+import time
+from collections import namedtuple, defaultdict, OrderedDict
+from datetime import date, timedelta
+from django.db import connection, transaction
+from django.db.models import F, Max, OuterRef, Q, Subquery
+from .counts import invalida_conteggi
+from .models import Libro, Prestito, Profilo, Segnalazione, StatisticheBiblioteca
+from .settings import GIORNI_PRESTITO, GIORNI_SOSPENSIONE, MAX_LIBRI_INPRESTITO
+
+__all__ = ['Esito', 'consegna_prestiti', 'restituisci_prestiti', 'sweep_scadenze']
+
+Esito = namedtuple('Esito', 'pk prestito riuscito messaggio')
+
+
+def _ids(valori):
+    ''' Identificativi univoci nell'ordine ricevuto; None se non numerici. '''
+    visti = []
+    for valore in valori:
+        try:
+            valore = int(valore)
+        except (TypeError, ValueError):
+            valore = None
+        if valore not in visti:
+            visti.append(valore)
+    return visti
+
+
+def _blocca(ids):
+    ''' Blocca i prestiti e, una volta sola, i rispettivi profili
+    (in ordine di pk, per non andare in deadlock con altre operazioni).
+    '''
+    prestiti = {p.pk: p for p in (Prestito.objects.select_for_update(nowait=True, of=('self',))
+                                  .select_related('libro', 'profilo')
+                                  .filter(pk__in=[pk for pk in ids if pk is not None]))}
+    profili = {p.pk: p for p in (Profilo.objects.select_for_update(nowait=True)
+                                 .filter(pk__in={p.profilo_id for p in prestiti.values()})
+                                 .order_by('pk'))}
+    return prestiti, profili
+
+
+def _esegui(ids, verifica):
+    ''' Applica verifica(prestito, profilo, gia_accettati) a ogni prestito;
+    restituisce gli esiti e i prestiti accettati raggruppati per profilo.
+    '''
+    prestiti, profili = _blocca(ids)
+    esiti = []
+    accettati = defaultdict(list)
+    for pk in ids:
+        prestito = prestiti.get(pk)
+        if prestito is None:
+            esiti.append(Esito(pk, None, False, 'Prestito inesistente.'))
+            continue
+        errore = verifica(prestito, profili[prestito.profilo_id], len(accettati[prestito.profilo_id]))
+        if errore:
+            esiti.append(Esito(pk, prestito, False, errore))
+        else:
+            accettati[prestito.profilo_id].append(prestito)
+            esiti.append(Esito(pk, prestito, True, None))
+    return esiti, accettati
+
+
+def _verifica_consegna(prestito, profilo, gia_accettati):
+    if not prestito.is_richiesto():
+        return 'Questo prestito non è in attesa di consegna.'
+    if profilo.tot_libri + gia_accettati >= MAX_LIBRI_INPRESTITO:
+        return "E' possibile avere in prestito al massimo {} libri alla volta".format(MAX_LIBRI_INPRESTITO)
+    if profilo.tot_richieste - gia_accettati <= 0:
+        return 'Questo profilo non ha richieste in atto.'
+    return None
+
+
+def _verifica_restituzione(prestito, profilo, gia_accettati):
+    if not prestito.is_incorso():
+        return 'Questo prestito non è in corso.'
+    if profilo.tot_libri - gia_accettati <= 0:
+        return 'Questo profilo non ha prestiti'
+    return None
+
+
+def consegna_prestiti(ids):
+    ''' Consegna più prestiti richiesti in una transazione: un UPDATE per i
+    prestiti e uno per ogni profilo, invece dei save() del singolo prestito.
+    '''
+    ids = _ids(ids)
+    with transaction.atomic():
+        esiti, accettati = _esegui(ids, _verifica_consegna)
+        prestiti = [p for lista in accettati.values() for p in lista]
+        if prestiti:
+            oggi = date.today()
+            Prestito.objects.filter(pk__in=[p.pk for p in prestiti]).incrementa_versione(
+                stato=Prestito.INCORSO, data_inizio=oggi, data_scadenza=oggi + timedelta(days=GIORNI_PRESTITO))
+            for profilo_pk, lista in accettati.items():
+                Profilo.objects.filter(pk=profilo_pk).update(
+                    tot_libri=F('tot_libri') + len(lista), tot_richieste=F('tot_richieste') - len(lista))
+            Libro.objects.filter(pk__in=[p.libro_id for p in prestiti]).incrementa_versione()
+            StatisticheBiblioteca.aggiorna(prestiti_richiesti=-len(prestiti), prestiti_incorso=len(prestiti))
+            invalida_conteggi(Prestito)
+    return esiti
+
+
+def restituisci_prestiti(ids):
+    ''' Conclude più prestiti in corso in una transazione e ricalcola in
+    blocco la disponibilità dei libri restituiti.
+    '''
+    ids = _ids(ids)
+    with transaction.atomic():
+        esiti, accettati = _esegui(ids, _verifica_restituzione)
+        prestiti = [p for lista in accettati.values() for p in lista]
+        if prestiti:
+            Prestito.objects.filter(pk__in=[p.pk for p in prestiti]).incrementa_versione(
+                stato=Prestito.CONCLUSO)
+            for profilo_pk, lista in accettati.items():
+                Profilo.objects.filter(pk=profilo_pk).update(tot_libri=F('tot_libri') - len(lista))
+            attivi = (Prestito.objects.filter(libro=OuterRef('pk'))
+                      .exclude(stato=Prestito.CONCLUSO)
+                      .order_by('-data_richiesta'))
+            libri = Libro.objects.filter(pk__in=[p.libro_id for p in prestiti])
+            libri.incrementa_versione(prestito_corrente=Subquery(attivi.values('pk')[:1]))
+            resi_disponibili = libri.filter(prestito_corrente__isnull=True, disponibile=False).update(disponibile=True)
+            StatisticheBiblioteca.aggiorna(prestiti_incorso=-len(prestiti), libri_disponibili=resi_disponibili)
+            invalida_conteggi(Prestito)
+            invalida_conteggi(Libro)
+    return esiti
+
+
+def _crea_in_blocco(model, oggetti):
+    ''' bulk_create che restituisce le pk anche dove il database non le
+    riporta (SQLite): dentro la transazione le nuove righe sono le ultime.
+    '''
+    features = connection.features
+    # can_return_rows_from_bulk_insert da Django 3.0
+    if getattr(features, 'can_return_rows_from_bulk_insert',
+               getattr(features, 'can_return_ids_from_bulk_insert', False)):
+        return [obj.pk for obj in model.objects.bulk_create(oggetti)]
+    ultima = model.objects.aggregate(ultima=Max('pk'))['ultima'] or 0
+    model.objects.bulk_create(oggetti)
+    return list(model.objects.filter(pk__gt=ultima).order_by('pk').values_list('pk', flat=True))
+
+
+def sweep_scadenze(oggi=None):
+    ''' Termina le sospensioni scadute, poi segnala per ritardo e sospende i
+    profili con prestiti in corso scaduti. Idempotente nella giornata: i
+    profili già sospesi (o sospesi oggi) non sono segnalati di nuovo.
+    Restituisce i conteggi e le durate in secondi di ogni fase.
+    '''
+    oggi = oggi or date.today()
+    resoconto = OrderedDict()
+    durate = OrderedDict()
+    with transaction.atomic():
+        inizio = time.monotonic()
+        resoconto['sospensioni_terminate'] = (Profilo.objects
+                                              .filter(data_fine_sospensione__lte=oggi)
+                                              .update(data_inizio_sospensione=None,
+                                                      data_fine_sospensione=None))
+        durate['sospensioni_terminate'] = time.monotonic() - inizio
+
+        inizio = time.monotonic()
+        # indice (stato, data_scadenza); is_scaduto: oggi >= data_scadenza
+        scaduti = (Prestito.objects
+                   .filter(stato=Prestito.INCORSO, data_scadenza__lte=oggi)
+                   .exclude(Q(profilo__data_fine_sospensione__gt=oggi) |
+                            Q(profilo__data_inizio_sospensione=oggi))
+                   .order_by('profilo_id', 'data_scadenza')
+                   .values_list('profilo_id', 'libro__titolo', 'data_scadenza'))
+        per_profilo = OrderedDict()
+        for profilo_id, titolo, scadenza in scaduti:
+            per_profilo.setdefault(profilo_id, []).append('"{}" (scaduto il {})'.format(titolo, scadenza))
+        resoconto['prestiti_scaduti'] = sum(len(libri) for libri in per_profilo.values())
+        durate['ricerca_scaduti'] = time.monotonic() - inizio
+
+        inizio = time.monotonic()
+        if per_profilo:
+            segnalazioni = _crea_in_blocco(Segnalazione, [
+                Segnalazione(tipo=Segnalazione.RITARDO,
+                             descrizione='Ritardo nella restituzione di: {}'.format(', '.join(libri)))
+                for libri in per_profilo.values()])
+            collegamento = Profilo.segnalazioni.through
+            collegamento.objects.bulk_create([
+                collegamento(profilo_id=profilo_id, segnalazione_id=segnalazione_id)
+                for profilo_id, segnalazione_id in zip(per_profilo, segnalazioni)])
+            Profilo.objects.filter(pk__in=list(per_profilo)).update(
+                data_inizio_sospensione=oggi,
+                data_fine_sospensione=oggi + timedelta(GIORNI_SOSPENSIONE))
+        resoconto['profili_sospesi'] = len(per_profilo)
+        durate['segnalazioni_sospensioni'] = time.monotonic() - inizio
+    return resoconto, durate
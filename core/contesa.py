@@ -0,0 +1,150 @@
+import functools
+import logging
+import random
+import time
+from django.contrib import messages
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DatabaseError, connections, DEFAULT_DB_ALIAS
+from django.http import HttpResponseRedirect
+from django.urls import reverse
+from .settings import CONTESA_CACHE, CONTESA_TENTATIVI, CONTESA_ATTESA_BASE, CONTESA_ATTESA_MAX
+
+__all__ = ['is_errore_contesa', 'riprova_su_contesa', 'RiprovaSuContesaMixin',
+           'metriche_contesa', 'metriche_condivise', 'azzera_metriche_contesa']
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL: lock_not_available (select_for_update nowait), deadlock_detected
+_PGCODE_CONTESA = {'55P03', '40P01'}
+# MySQL: ER_LOCK_WAIT_TIMEOUT, ER_LOCK_DEADLOCK, ER_LOCK_NOWAIT
+_MYSQL_CONTESA = {1205, 1213, 3572}
+_SQLITE_CONTESA = ('database is locked', 'database table is locked')
+
+EVENTI = ('tentativi', 'riprese', 'rinunce')
+_CHIAVE_NOMI = 'core:contesa:nomi'
+
+
+def is_errore_contesa(err):
+    ''' True se l'errore è dovuto a un lock tenuto da un'altra transazione,
+    cioè se ripetere l'operazione poco dopo può riuscire.
+    '''
+    if not isinstance(err, DatabaseError):
+        return False
+    causa = err.__cause__ or err
+    if getattr(causa, 'pgcode', None) in _PGCODE_CONTESA:
+        return True
+    if causa.args and causa.args[0] in _MYSQL_CONTESA:
+        return True
+    return any(messaggio in str(causa) for messaggio in _SQLITE_CONTESA)
+
+
+def _chiave(nome, evento):
+    return 'core:contesa:{}:{}'.format(nome, evento)
+
+
+def _cache():
+    return caches[CONTESA_CACHE]
+
+
+def metriche_condivise():
+    ''' False se i contatori restano nella memoria di ogni processo, e quindi
+    un altro processo (es. il comando metriche_contesa) non li vede.
+    '''
+    return not isinstance(_cache(), (LocMemCache, DummyCache))
+
+
+def _registra(nome, evento):
+    cache = _cache()
+    chiave = _chiave(nome, evento)
+    if not cache.add(chiave, 1, None):
+        try:
+            cache.incr(chiave)
+        except ValueError:
+            cache.set(chiave, 1, None)
+    nomi = cache.get(_CHIAVE_NOMI, set())
+    if nome not in nomi:
+        cache.set(_CHIAVE_NOMI, nomi | {nome}, None)
+
+
+def metriche_contesa():
+    ''' Contatori per operazione: esecuzioni, riprese dopo un lock e rinunce. '''
+    cache = _cache()
+    metriche = {}
+    for nome in sorted(cache.get(_CHIAVE_NOMI, set())):
+        valori = cache.get_many([_chiave(nome, evento) for evento in EVENTI])
+        metriche[nome] = {evento: valori.get(_chiave(nome, evento), 0) for evento in EVENTI}
+    return metriche
+
+
+def azzera_metriche_contesa():
+    cache = _cache()
+    nomi = cache.get(_CHIAVE_NOMI, set())
+    cache.delete_many([_chiave(nome, evento) for nome in nomi for evento in EVENTI] + [_CHIAVE_NOMI])
+
+
+def attesa(tentativo, base=CONTESA_ATTESA_BASE, massimo=CONTESA_ATTESA_MAX):
+    ''' Back-off esponenziale con jitter pieno: i client respinti dallo stesso
+    lock non si ripresentano tutti nello stesso istante.
+    '''
+    return random.uniform(0, min(massimo, base * 2 ** tentativo))
+
+
+def riprova_su_contesa(nome=None, tentativi=CONTESA_TENTATIVI, using=DEFAULT_DB_ALIAS):
+    ''' Ripete la funzione, fino a `tentativi` volte in tutto, quando fallisce
+    per un errore di contesa; all'ultimo fallimento l'errore viene rilanciato.
+    La funzione deve aprire da sé la propria transazione: dentro un blocco
+    atomic già aperto non si riprova, perché la transazione esterna è persa.
+    '''
+    def decorator(func):
+        metrica = nome or '{}.{}'.format(func.__module__, func.__qualname__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for tentativo in range(tentativi):
+                _registra(metrica, 'tentativi')
+                try:
+                    return func(*args, **kwargs)
+                except DatabaseError as err:
+                    if not is_errore_contesa(err) or connections[using].in_atomic_block:
+                        raise
+                    if tentativo == tentativi - 1:
+                        _registra(metrica, 'rinunce')
+                        logger.warning('%s: lock non ottenuto dopo %d tentativi (%s)', metrica, tentativi, err)
+                        raise
+                    _registra(metrica, 'riprese')
+                    time.sleep(attesa(tentativo))
+        return wrapper
+    return decorator
+
+
+class RiprovaSuContesaMixin:
+    ''' Ripete l'intera gestione della richiesta (metodi in `metodi_riprova`)
+    quando una transazione trova un lock occupato; se anche l'ultimo tentativo
+    fallisce mostra un messaggio e rimanda a `url_contesa`.
+    I messaggi di esito vanno aggiunti dopo il commit, altrimenti un tentativo
+    fallito in fase di commit li lascerebbe in coda.
+    '''
+    metodi_riprova = ('post',)
+    url_contesa = 'dashboard'
+    messaggio_contesa = "L'operazione è in conflitto con un'altra in corso, riprovare."
+
+    def get_nome_contesa(self):
+        return type(self).__name__
+
+    def get_url_contesa(self):
+        return reverse(self.url_contesa)
+
+    def dispatch(self, request, *args, **kwargs):
+        metodo = request.method.lower()
+        if metodo not in self.metodi_riprova or not hasattr(self, metodo):
+            return super().dispatch(request, *args, **kwargs)
+        handler = riprova_su_contesa(self.get_nome_contesa())(super().dispatch)
+        try:
+            return handler(request, *args, **kwargs)
+        except DatabaseError as err:
+            if not is_errore_contesa(err):
+                raise
+            messages.error(request, self.messaggio_contesa)
+            return HttpResponseRedirect(redirect_to=self.get_url_contesa())
@@ -0,0 +1,51 @@
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from .models import Bookmark, StatisticheBiblioteca
+from .settings import NAVIGAZIONE_TIMEOUT
+
+__all__ = ['navigazione', 'chiave_bookmark']
+
+
+def chiave_bookmark(user_pk):
+    return 'core:navigazione:bookmark:{}'.format(user_pk)
+
+
+class Navigazione:
+    ''' Dati di sidebar e menu dei bookmark per i frammenti in cache: le
+    chiavi costano una lettura dalla cache, il database viene interrogato
+    solo quando il frammento va rigenerato.
+    '''
+    timeout = NAVIGAZIONE_TIMEOUT
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def _versioni(self):
+        if not self.user.is_authenticated:
+            return {}
+        chiavi = [chiave_bookmark(self.user.pk), StatisticheBiblioteca.CHIAVE_VERSIONE]
+        return cache.get_many(chiavi)
+
+    @property
+    def chiave_bookmark(self):
+        return '{}:{}'.format(self.user.pk, self._versioni.get(chiave_bookmark(self.user.pk), 0))
+
+    @property
+    def chiave_sidebar(self):
+        return '{}:{}'.format(self.user.pk, self._versioni.get(StatisticheBiblioteca.CHIAVE_VERSIONE, 0))
+
+    @cached_property
+    def bookmark(self):
+        if not self.user.is_authenticated:
+            return []
+        return [(b.nome, b.get_bookmark_url(), b.get_esporta_url())
+                for b in Bookmark.objects.filter(user=self.user)]
+
+    @cached_property
+    def contatori(self):
+        return StatisticheBiblioteca.get()
+
+
+def navigazione(request):
+    return {'navigazione': Navigazione(request.user)}
@@ -0,0 +1,85 @@
+import hashlib
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from .settings import CONTEGGI_TIMEOUT, STIMA_CONTEGGI_SOGLIA
+
+__all__ = ['Conteggio', 'conta', 'invalida_conteggi', 'versione_conteggi', 'versione', 'incrementa_versione']
+
+
+class Conteggio(int):
+    ''' Numero di righe; se stimato viene mostrato come "~N". '''
+    stimato = False
+
+    def __new__(cls, valore, stimato=False):
+        obj = super().__new__(cls, valore)
+        obj.stimato = stimato
+        return obj
+
+    def __str__(self):
+        return '~{}'.format(int(self)) if self.stimato else str(int(self))
+
+
+def versione(chiave):
+    return cache.get(chiave, 0)
+
+
+def incrementa_versione(chiave):
+    ''' Le voci in cache che includono la versione diventano irraggiungibili. '''
+    if not cache.add(chiave, 1, None):
+        try:
+            cache.incr(chiave)
+        except ValueError:
+            cache.set(chiave, 1, None)
+
+
+def _chiave_versione(model):
+    return 'core:conteggi:versione:{}'.format(model._meta.label_lower)
+
+
+def invalida_conteggi(model):
+    incrementa_versione(_chiave_versione(model))
+
+
+def versione_conteggi(model):
+    ''' Cambia a ogni save/delete sul modello, vedi core.signals. '''
+    return versione(_chiave_versione(model))
+
+
+def stima_righe(queryset):
+    ''' Stima economica delle righe di una tabella senza filtri, o None. '''
+    connection = connections[queryset.db]
+    tabella = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [tabella])
+        elif connection.vendor == 'sqlite':
+            # rowid massimo: letto dall'indice della pk, sovrastima solo dopo cancellazioni
+            cursor.execute('SELECT max(rowid) FROM {}'.format(connection.ops.quote_name(tabella)))
+        else:
+            return None
+        riga = cursor.fetchone()
+    return riga[0] if riga and riga[0] is not None else None
+
+
+def conta(queryset, stima=True):
+    ''' count() in cache per modello e filtro. La chiave è la query compilata,
+    quindi parametri di filtro equivalenti (e visibilità diverse) sono
+    distinti correttamente; save/delete sul modello cambiano la versione.
+    '''
+    if stima and STIMA_CONTEGGI_SOGLIA is not None and not queryset.query.where:
+        stimato = stima_righe(queryset)
+        if stimato is not None and stimato >= STIMA_CONTEGGI_SOGLIA:
+            return Conteggio(stimato, stimato=True)
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return Conteggio(0)
+    impronta = hashlib.md5('{}|{!r}'.format(sql, params).encode()).hexdigest()
+    chiave = 'core:conteggi:{}:{}:{}'.format(
+        queryset.model._meta.label_lower, versione(_chiave_versione(queryset.model)), impronta)
+    valore = cache.get(chiave)
+    if valore is None:
+        valore = queryset.count()
+        cache.set(chiave, valore, CONTEGGI_TIMEOUT)
+    return Conteggio(valore)
@@ -0,0 +1,450 @@
+''' Dataset sintetico di grandi dimensioni per misure e benchmark (comando
+genera_dataset): catalogo, profili e storico dei prestiti.
+
+Con lo stesso seme il risultato è identico, a parte le date che sono
+relative al giorno della generazione. Le popolarità (libri, autori,
+editori, lettori) seguono una distribuzione di Zipf; i prestiti rispettano
+i vincoli dell'applicazione: un solo prestito attivo per libro, al più
+MAX_LIBRI_INPRESTITO richieste e altrettanti libri in corso per profilo,
+una sola riga per coppia (profilo, libro). I contatori dei profili, la
+disponibilità dei libri e le statistiche della dashboard sono coerenti
+con i prestiti generati.
+'''
+import itertools
+import random
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from django.core.management.color import no_style
+from django.db import connections, DEFAULT_DB_ALIAS, transaction
+from django.db.models import Max, OuterRef, Subquery
+from django.utils import timezone
+from .counts import invalida_conteggi
+from .models import (Autore, Collana, Editore, Genere, Libro, Prestito, Profilo, SottoGenere,
+                     StatisticheBiblioteca)
+from .prefix_index import INDICI, invalida_indice
+from .search import get_backend
+from .settings import GIORNI_PRESTITO, MAX_LIBRI_INPRESTITO
+
+__all__ = ['GeneratoreDataset']
+
+NOMI = [
+    'Alessandro', 'Andrea', 'Anna', 'Antonio', 'Beatrice', 'Carlo', 'Chiara', 'Claudia', 'Davide',
+    'Elena', 'Elisa', 'Emma', 'Federica', 'Federico', 'Francesca', 'Francesco', 'Gabriele', 'Giacomo',
+    'Giorgia', 'Giovanni', 'Giulia', 'Giuseppe', 'Laura', 'Leonardo', 'Lorenzo', 'Luca', 'Lucia',
+    'Marco', 'Maria', 'Martina', 'Matteo', 'Michele', 'Paola', 'Paolo', 'Riccardo', 'Roberta',
+    'Roberto', 'Sara', 'Silvia', 'Simone', 'Sofia', 'Stefano', 'Tommaso', 'Valentina',
+]
+COGNOMI = [
+    'Barbieri', 'Bianchi', 'Bruno', 'Caruso', 'Colombo', 'Conti', 'Costa', 'De Luca', 'Esposito',
+    'Fabbri', 'Ferrari', 'Ferraro', 'Fontana', 'Gallo', 'Giordano', 'Greco', 'Leone', 'Lombardi',
+    'Longo', 'Mancini', 'Marchetti', 'Mariani', 'Marino', 'Martini', 'Moretti', 'Morelli', 'Orlando',
+    'Pellegrini', 'Ricci', 'Rinaldi', 'Rizzi', 'Rizzo', 'Romano', 'Rossi', 'Russo', 'Santoro',
+    'Serra', 'Testa', 'Villa', 'Vitale',
+]
+# genere: (peso, sottogeneri)
+GENERI = OrderedDict([
+    ('Narrativa', (30, ['Romanzo storico', 'Romanzo di formazione', 'Racconti', 'Narrativa contemporanea'])),
+    ('Gialli e thriller', (14, ['Giallo classico', 'Noir', 'Thriller psicologico', 'Spionaggio'])),
+    ('Fantascienza', (6, ['Distopia', 'Space opera', 'Cyberpunk'])),
+    ('Fantasy', (6, ['High fantasy', 'Urban fantasy', 'Fiaba'])),
+    ('Ragazzi', (10, ['Prima infanzia', 'Albi illustrati', 'Avventura', 'Young adult'])),
+    ('Saggistica', (9, ['Divulgazione scientifica', 'Attualità', 'Filosofia', 'Psicologia'])),
+    ('Storia', (6, ['Storia antica', 'Medioevo', 'Storia contemporanea', 'Biografie'])),
+    ('Poesia', (3, ['Poesia italiana', 'Poesia straniera'])),
+    ('Teatro', (2, ['Tragedia', 'Commedia'])),
+    ('Arte', (3, ['Pittura', 'Architettura', 'Fotografia'])),
+    ('Viaggi', (4, ['Guide', 'Letteratura di viaggio'])),
+    ('Cucina', (3, ['Ricette regionali', 'Cucina internazionale'])),
+    ('Fumetti', (4, ['Graphic novel', 'Manga', 'Fumetto italiano'])),
+])
+SOGGETTI = [
+    'il mare', 'la luna', "l'isola", 'il vento', 'la notte', 'il giardino', 'la casa', 'il fiume',
+    'la città', 'il silenzio', 'la memoria', 'il ritorno', 'la strada', "l'estate", "l'inverno",
+    'il porto', 'la voce', 'il segreto', 'la pioggia', 'il tempo', 'la montagna', 'il sogno',
+    'la terra', 'il viaggio', "l'ombra", 'la guerra', 'il padre', 'la figlia', 'il confine', 'la luce',
+]
+FORME_TITOLO = [
+    '{soggetto}', '{soggetto} e {soggetto2}', '{soggetto} di {nome}', 'Dopo {soggetto}',
+    'Oltre {soggetto}', 'Verso {soggetto}', 'Tra {soggetto} e {soggetto2}', 'Lettere a {nome}',
+    'Storia di {nome} {cognome}', 'Per {soggetto}',
+]
+FORME_EDITORE = ['{} Editore', 'Edizioni {}', '{} & Figli', 'Casa editrice {}', '{} Libri']
+COLLANE = ['Narratori', 'Tascabili', 'Saggi', 'Classici', 'Ragazzi', 'Gialli', 'Universale',
+           'Contemporanea', 'Biblioteca', 'Le comete', 'I coralli', 'Grandi tascabili']
+MESI_CODFISC = 'ABCDEHLMPRST'
+# autori per libro: 1, 2 o 3
+PESI_NUMERO_AUTORI = [85, 12, 3]
+# ogni quanti libri un editore e un autore in più
+LIBRI_PER_EDITORE = 500
+LIBRI_PER_AUTORE = 3
+
+
+def _cumulativi_zipf(n, esponente):
+    return list(itertools.accumulate(1 / (rango + 1) ** esponente for rango in range(n)))
+
+
+def _base36(numero, cifre):
+    caratteri = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    risultato = ''
+    for _ in range(cifre):
+        numero, resto = divmod(numero, 36)
+        risultato = caratteri[resto] + risultato
+    return risultato
+
+
+def isbn13(numero):
+    ''' ISBN-13 valido con prefisso 978 e cifra di controllo. '''
+    base = '978{:09d}'.format(numero)
+    somma = sum(int(c) * (3 if i % 2 else 1) for i, c in enumerate(base))
+    return base + str(-somma % 10)
+
+
+@contextmanager
+def _cache_sqlite(connection, kib=256 * 1024):
+    ''' Con la cache di default (2 MB) gli inserimenti negli indici di una
+    tabella da milioni di righe diventano letture e scritture su disco.
+    '''
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA cache_size')
+        precedente = cursor.fetchone()[0]
+        cursor.execute('PRAGMA cache_size = -{:d}'.format(kib))
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size = {:d}'.format(precedente))
+
+
+class GeneratoreDataset:
+    ''' richiesti e in_corso sono le frazioni dei prestiti nei due stati
+    attivi (il resto è concluso); scaduti è la frazione dei prestiti in
+    corso oltre la data di scadenza. Le pk sono assegnate dal generatore,
+    a partire dalla massima esistente, per collegare le righe senza rileggerle.
+    '''
+    def __init__(self, libri, profili, prestiti, seme=0, richiesti=0.01, in_corso=0.05,
+                 scaduti=0.2, anni=5, batch=5000, using=DEFAULT_DB_ALIAS):
+        self.n_libri = libri
+        self.n_profili = profili
+        self.n_prestiti = prestiti
+        self.n_richiesti = round(prestiti * richiesti)
+        self.n_in_corso = round(prestiti * in_corso)
+        self.scaduti = scaduti
+        self.anni = anni
+        self.batch = batch
+        self.using = using
+        self.rng = random.Random(seme)
+        self.adesso = timezone.now().replace(microsecond=0)
+        self.oggi = timezone.localdate(self.adesso)
+        self._aperture = {}
+        self.durate = OrderedDict()
+        self.creati = OrderedDict()
+        self._verifica()
+
+    def _verifica(self):
+        attivi = self.n_richiesti + self.n_in_corso
+        if attivi > self.n_prestiti or not 0 <= self.scaduti <= 1:
+            raise ValueError('Le frazioni di prestiti richiesti, in corso e scaduti devono essere tra 0 e 1.')
+        if min(self.n_libri, self.n_profili, self.n_prestiti) < 0:
+            raise ValueError('Libri, profili e prestiti non possono essere negativi.')
+        if attivi > self.n_libri:
+            raise ValueError('{} prestiti attivi ma solo {} libri: un libro ha al più un prestito attivo.'
+                             .format(attivi, self.n_libri))
+        if max(self.n_richiesti, self.n_in_corso) > self.n_profili * MAX_LIBRI_INPRESTITO:
+            raise ValueError('Troppi prestiti attivi per {} profili (al più {} richieste e {} libri '
+                             'in corso ciascuno).'.format(self.n_profili, MAX_LIBRI_INPRESTITO,
+                                                          MAX_LIBRI_INPRESTITO))
+        if self.n_prestiti > self.n_libri * self.n_profili // 2:
+            raise ValueError('Troppi prestiti: al più uno per coppia (profilo, libro).')
+
+    def genera(self):
+        if any(model.objects.using(self.using).exists() for model in (Libro, Profilo, Prestito)):
+            raise ValueError('Il generatore richiede un database senza libri, profili e prestiti.')
+        with _cache_sqlite(connections[self.using]), transaction.atomic(using=self.using):
+            self._fase('lookup', self._genera_lookup)
+            self._fase('prestiti attivi', self._scegli_attivi)
+            self._fase('profili', self._genera_profili)
+            self._fase('libri', self._genera_libri)
+            self._fase('prestiti', self._genera_prestiti)
+            self._fase('disponibilità', self._collega_prestiti_correnti)
+            self._reimposta_sequenze()
+        self._fase('indice e statistiche', self._finalizza)
+        return self
+
+    def _fase(self, nome, funzione):
+        inizio = time.monotonic()
+        funzione()
+        self.durate[nome] = time.monotonic() - inizio
+
+    def _prossima_pk(self, model):
+        return (model.objects.using(self.using).aggregate(massimo=Max('pk'))['massimo'] or 0) + 1
+
+    def _inserisci(self, model, oggetti, date_esplicite=()):
+        ''' bulk_create a blocchi da un iterabile, senza tenerlo tutto in memoria.
+        bulk_create sovrascrive i campi auto_now_add con l'ora corrente: quelli
+        in `date_esplicite` sono riscritti con i valori degli oggetti.
+        '''
+        manager = model.objects.using(self.using)
+        totale = 0
+        oggetti = iter(oggetti)
+        while True:
+            blocco = list(itertools.islice(oggetti, self.batch))
+            if not blocco:
+                break
+            valori = [[getattr(oggetto, campo) for campo in date_esplicite] + [oggetto.pk]
+                      for oggetto in blocco]
+            manager.bulk_create(blocco)
+            if date_esplicite:
+                self._riscrivi(model, date_esplicite, valori)
+            totale += len(blocco)
+        self.creati[model._meta.verbose_name_plural] = (
+            self.creati.get(model._meta.verbose_name_plural, 0) + totale)
+        return totale
+
+    def _riscrivi(self, model, campi, valori):
+        ''' Un UPDATE per chiave primaria, eseguito con executemany. '''
+        connection = connections[self.using]
+        qn = connection.ops.quote_name
+        campi = [model._meta.get_field(campo) for campo in campi]
+        sql = 'UPDATE {} SET {} WHERE {} = %s'.format(
+            qn(model._meta.db_table),
+            ', '.join('{} = %s'.format(qn(campo.column)) for campo in campi),
+            qn(model._meta.pk.column))
+        parametri = [[campo.get_db_prep_value(valore, connection) for campo, valore in zip(campi, riga[:-1])]
+                     + [riga[-1]] for riga in valori]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, parametri)
+
+    def _nome(self):
+        return self.rng.choice(NOMI), self.rng.choice(COGNOMI)
+
+    # Catalogo
+
+    def _genera_lookup(self):
+        rng = self.rng
+        pk = self._prossima_pk(Genere)
+        self.generi = list(range(pk, pk + len(GENERI)))
+        self._inserisci(Genere, (Genere(pk=pk + i, nome=nome) for i, nome in enumerate(GENERI)))
+        self.pesi_generi = list(itertools.accumulate(peso for peso, _ in GENERI.values()))
+        self.sottogeneri = {}
+        sottogeneri = []
+        pk = self._prossima_pk(SottoGenere)
+        for genere_id, (_, nomi) in zip(self.generi, GENERI.values()):
+            self.sottogeneri[genere_id] = list(range(pk, pk + len(nomi)))
+            sottogeneri += [SottoGenere(pk=pk + i, nome=nome, padre_id=genere_id) for i, nome in enumerate(nomi)]
+            pk += len(nomi)
+        self._inserisci(SottoGenere, sottogeneri)
+
+        n_editori = max(10, self.n_libri // LIBRI_PER_EDITORE)
+        pk = self._prossima_pk(Editore)
+        self.editori = list(range(pk, pk + n_editori))
+        self.pesi_editori = _cumulativi_zipf(n_editori, 1.1)
+        nomi = set()
+        for i in range(n_editori):
+            nome = rng.choice(FORME_EDITORE).format(rng.choice(COGNOMI))
+            nomi.add(nome if nome not in nomi else '{} {}'.format(nome, i + 1))
+        self._inserisci(Editore, (Editore(pk=pk + i, nome=nome) for i, nome in enumerate(sorted(nomi))))
+        # i grandi editori hanno più collane
+        self.collane = {}
+        collane = []
+        pk = self._prossima_pk(Collana)
+        for rango, editore_id in enumerate(self.editori):
+            quante = rng.randint(2, 8) if rango < n_editori // 5 else rng.randint(0, 2)
+            self.collane[editore_id] = list(range(pk, pk + quante))
+            collane += [Collana(pk=pk + i, editore_id=editore_id, nome=nome)
+                        for i, nome in enumerate(rng.sample(COLLANE, quante))]
+            pk += quante
+        self._inserisci(Collana, collane)
+
+        n_autori = max(20, self.n_libri // LIBRI_PER_AUTORE)
+        pk = self._prossima_pk(Autore)
+        self.autori = list(range(pk, pk + n_autori))
+        self.pesi_autori = _cumulativi_zipf(n_autori, 1.0)
+        autori = []
+        for i in range(n_autori):
+            nome, cognome = self._nome()
+            autori.append(Autore(pk=pk + i, nome=nome, cognome=cognome))
+        self._inserisci(Autore, autori)
+
+    def _titolo(self):
+        rng = self.rng
+        soggetto, soggetto2 = rng.sample(SOGGETTI, 2)
+        nome, cognome = self._nome()
+        titolo = rng.choice(FORME_TITOLO).format(soggetto=soggetto, soggetto2=soggetto2,
+                                                  nome=nome, cognome=cognome)
+        return titolo[0].upper() + titolo[1:]
+
+    def _genera_libri(self):
+        rng = self.rng
+        pk = self.primo_libro
+        autori_libri = []
+        sottogeneri_libri = []
+
+        def libri():
+            for i in range(self.n_libri):
+                genere_id = rng.choices(self.generi, cum_weights=self.pesi_generi)[0]
+                editore_id = rng.choices(self.editori, cum_weights=self.pesi_editori)[0]
+                collane = self.collane[editore_id]
+                numero_autori = rng.choices((1, 2, 3), weights=PESI_NUMERO_AUTORI)[0]
+                for autore_id in set(rng.choices(self.autori, cum_weights=self.pesi_autori, k=numero_autori)):
+                    autori_libri.append(Libro.autori.through(libro_id=pk + i, autore_id=autore_id))
+                for sottogenere_id in set(rng.choices(self.sottogeneri[genere_id], k=rng.randint(0, 2))):
+                    sottogeneri_libri.append(Libro.sottogeneri.through(libro_id=pk + i,
+                                                                      sottogenere_id=sottogenere_id))
+                yield Libro(
+                    pk=pk + i,
+                    isbn=isbn13(pk + i),
+                    titolo=self._titolo(),
+                    descrizione='Un libro di {} pagine.'.format(rng.randint(80, 900)),
+                    editore_id=editore_id,
+                    genere_id=genere_id,
+                    collana_id=rng.choice(collane) if collane and rng.random() < 0.5 else None,
+                    disponibile=i not in self.libri_attivi,
+                )
+                # le righe delle M2M seguono il blocco dei libri
+                if len(autori_libri) >= self.batch:
+                    self._inserisci(Libro.autori.through, autori_libri)
+                    autori_libri.clear()
+                if len(sottogeneri_libri) >= self.batch:
+                    self._inserisci(Libro.sottogeneri.through, sottogeneri_libri)
+                    sottogeneri_libri.clear()
+        self._inserisci(Libro, libri())
+        self._inserisci(Libro.autori.through, autori_libri)
+        self._inserisci(Libro.sottogeneri.through, sottogeneri_libri)
+
+    # Profili e prestiti
+
+    def _scegli_attivi(self):
+        ''' Sceglie libro e profilo dei prestiti attivi, da cui dipendono i
+        contatori dei profili e la disponibilità dei libri.
+        '''
+        rng = self.rng
+        self.primo_libro = self._prossima_pk(Libro)
+        self.primo_profilo = self._prossima_pk(Profilo)
+        # lettori e libri forti: popolarità di Zipf su un ordine casuale
+        self.ordine_profili = list(range(self.n_profili))
+        rng.shuffle(self.ordine_profili)
+        self.pesi_profili = _cumulativi_zipf(self.n_profili, 0.7)
+        self.ordine_libri = list(range(self.n_libri))
+        rng.shuffle(self.ordine_libri)
+        self.pesi_libri = _cumulativi_zipf(self.n_libri, 0.8)
+
+        libri = rng.sample(range(self.n_libri), self.n_richiesti + self.n_in_corso)
+        self.libri_attivi = set(libri)
+        self.tot_richieste = [0] * self.n_profili
+        self.tot_libri = [0] * self.n_profili
+        self.coppie = set()
+        self.attivi = []
+        for posizione, libro in enumerate(libri):
+            stato = Prestito.RICHIESTO if posizione < self.n_richiesti else Prestito.INCORSO
+            contatore = self.tot_richieste if stato == Prestito.RICHIESTO else self.tot_libri
+            profilo = rng.choices(self.ordine_profili, cum_weights=self.pesi_profili)[0]
+            while contatore[profilo] >= MAX_LIBRI_INPRESTITO:
+                profilo = (profilo + 1) % self.n_profili
+            contatore[profilo] += 1
+            self.coppie.add(profilo * self.n_libri + libro)
+            self.attivi.append((profilo, libro, stato))
+
+    def _genera_profili(self):
+        rng = self.rng
+        pk = self.primo_profilo
+
+        def profili():
+            for i in range(self.n_profili):
+                nome, cognome = self._nome()
+                nascita = date(rng.randint(1940, 2012), rng.randint(1, 12), rng.randint(1, 28))
+                codfisc = '{}{}{:02d}{}{:02d}{}'.format(
+                    (cognome.replace(' ', '').upper() + 'XXX')[:3], (nome.upper() + 'XXX')[:3],
+                    nascita.year % 100, MESI_CODFISC[nascita.month - 1], nascita.day, _base36(i, 5))
+                yield Profilo(
+                    pk=pk + i, nome=nome, cognome=cognome, codfisc=codfisc, data_nascita=nascita,
+                    telefono='3{:09d}'.format(rng.randrange(10 ** 9)),
+                    email='{}.{}{}@example.com'.format(nome.lower(), cognome.replace(' ', '').lower(), i),
+                    tot_libri=self.tot_libri[i], tot_richieste=self.tot_richieste[i],
+                )
+        self._inserisci(Profilo, profili())
+
+    def _prestito_attivo(self, pk, profilo, libro, stato):
+        rng = self.rng
+        if stato == Prestito.RICHIESTO:
+            richiesta = self._data_ora(self.oggi - timedelta(days=rng.randrange(7)))
+            return Prestito(pk=pk, profilo_id=self.primo_profilo + profilo, libro_id=self.primo_libro + libro,
+                            stato=stato, data_richiesta=min(richiesta, self.adesso))
+        if rng.random() < self.scaduti:
+            # scaduto: data_scadenza <= oggi, come per is_scaduto
+            inizio = self.oggi - timedelta(days=GIORNI_PRESTITO + rng.randint(0, 60))
+        else:
+            inizio = self.oggi - timedelta(days=rng.randint(0, GIORNI_PRESTITO - 1))
+        return Prestito(pk=pk, profilo_id=self.primo_profilo + profilo, libro_id=self.primo_libro + libro,
+                        stato=stato, data_inizio=inizio, data_scadenza=inizio + timedelta(days=GIORNI_PRESTITO),
+                        data_richiesta=self._data_ora(inizio - timedelta(days=rng.randint(0, 3))))
+
+    def _data_ora(self, giorno):
+        ''' Un orario di apertura della biblioteca nel giorno. '''
+        apertura = self._aperture.get(giorno)
+        if apertura is None:
+            # localize di pytz costa quanto il resto del prestito: una volta per giorno
+            apertura = timezone.make_aware(datetime(giorno.year, giorno.month, giorno.day, 9)).astimezone(timezone.utc)
+            self._aperture[giorno] = apertura
+        return apertura + timedelta(seconds=self.rng.randrange(10 * 3600))
+
+    def _coppie_concluse(self, quante):
+        ''' Coppie (profilo, libro) nuove, estratte a blocchi con le popolarità. '''
+        rng = self.rng
+        while quante > 0:
+            blocco = min(quante, self.batch)
+            profili = rng.choices(self.ordine_profili, cum_weights=self.pesi_profili, k=blocco)
+            libri = rng.choices(self.ordine_libri, cum_weights=self.pesi_libri, k=blocco)
+            for profilo, libro in zip(profili, libri):
+                while profilo * self.n_libri + libro in self.coppie:
+                    libro = rng.randrange(self.n_libri)
+                self.coppie.add(profilo * self.n_libri + libro)
+                yield profilo, libro
+            quante -= blocco
+
+    def _genera_prestiti(self):
+        rng = self.rng
+        pk = self._prossima_pk(Prestito)
+        giorni_storico = self.anni * 365
+
+        def prestiti():
+            for i, (profilo, libro, stato) in enumerate(self.attivi):
+                yield self._prestito_attivo(pk + i, profilo, libro, stato)
+            primo = pk + len(self.attivi)
+            for i, (profilo, libro) in enumerate(self._coppie_concluse(self.n_prestiti - len(self.attivi))):
+                giorno = self.oggi - timedelta(days=1 + rng.randrange(giorni_storico))
+                inizio = giorno + timedelta(days=rng.randint(0, 3))
+                yield Prestito(pk=primo + i, profilo_id=self.primo_profilo + profilo,
+                               libro_id=self.primo_libro + libro, stato=Prestito.CONCLUSO,
+                               data_richiesta=self._data_ora(giorno), data_inizio=inizio,
+                               data_scadenza=inizio + timedelta(days=GIORNI_PRESTITO))
+        self._inserisci(Prestito, prestiti(), date_esplicite=('data_richiesta',))
+        self.coppie = None
+
+    def _collega_prestiti_correnti(self):
+        ''' Come ricalcola_disponibilita, sui soli libri in prestito. '''
+        attivi = (Prestito.objects.using(self.using).filter(libro=OuterRef('pk'))
+                  .exclude(stato=Prestito.CONCLUSO).order_by('-data_richiesta'))
+        (Libro.objects.using(self.using).filter(disponibile=False)
+         .update(prestito_corrente=Subquery(attivi.values('pk')[:1])))
+
+    def _reimposta_sequenze(self):
+        ''' Le pk esplicite non fanno avanzare le sequenze (PostgreSQL). '''
+        connection = connections[self.using]
+        modelli = [Genere, SottoGenere, Editore, Collana, Autore, Libro, Profilo, Prestito]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), modelli):
+                cursor.execute(sql)
+
+    def _finalizza(self):
+        # bulk_create non invia i segnali: indice, cache e statistiche a mano
+        get_backend(self.using).rebuild()
+        for model in (Genere, SottoGenere, Editore, Collana, Autore, Libro, Profilo, Prestito):
+            invalida_conteggi(model)
+            if model in INDICI:
+                invalida_indice(model)
+        StatisticheBiblioteca.ricalcola()
@@ -0,0 +1,69 @@
+import csv
+import itertools
+import zlib
+from datetime import date, datetime
+from django.utils import timezone
+
+__all__ = ['formatta', 'righe_csv', 'raggruppa', 'comprimi_gzip', 'a_blocchi']
+
+# dimensione indicativa dei blocchi inviati al client
+DIMENSIONE_BLOCCO = 64 * 1024
+
+
+class _Eco:
+    ''' File fittizio: csv.writer restituisce la riga invece di scriverla. '''
+    def write(self, valore):
+        return valore
+
+
+def formatta(valore):
+    if valore is None:
+        return ''
+    if isinstance(valore, bool):
+        return 'Sì' if valore else 'No'
+    if isinstance(valore, datetime):
+        if timezone.is_aware(valore):
+            valore = timezone.localtime(valore)
+        return valore.strftime('%Y-%m-%d %H:%M')
+    if isinstance(valore, date):
+        return valore.isoformat()
+    return valore
+
+
+def righe_csv(intestazioni, righe):
+    writer = csv.writer(_Eco())
+    # BOM: Excel riconosce la codifica UTF-8
+    yield '﻿' + writer.writerow(intestazioni)
+    for riga in righe:
+        yield writer.writerow([formatta(v) for v in riga])
+
+
+def raggruppa(righe, dimensione=DIMENSIONE_BLOCCO):
+    ''' Unisce le righe in blocchi di circa `dimensione` caratteri. '''
+    blocco, lunghezza = [], 0
+    for riga in righe:
+        blocco.append(riga)
+        lunghezza += len(riga)
+        if lunghezza >= dimensione:
+            yield ''.join(blocco)
+            blocco, lunghezza = [], 0
+    if blocco:
+        yield ''.join(blocco)
+
+
+def comprimi_gzip(blocchi, encoding='utf-8'):
+    compressore = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for blocco in blocchi:
+        dati = compressore.compress(blocco.encode(encoding))
+        if dati:
+            yield dati
+    yield compressore.flush()
+
+
+def a_blocchi(iterabile, dimensione):
+    iterabile = iter(iterabile)
+    while True:
+        blocco = list(itertools.islice(iterabile, dimensione))
+        if not blocco:
+            return
+        yield blocco
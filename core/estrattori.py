@@ -0,0 +1,116 @@
+''' Estrazione del testo dai file, eseguita nei processi del pool di
+core.estrazione: solo letture locali, nessuna rete e nessun accesso a Django.
+'''
+import os
+import re
+import zlib
+
+__all__ = ['ESTRATTO', 'NON_SUPPORTATO', 'ERRORE', 'estrai_testo']
+
+ESTRATTO = 'estratto'
+NON_SUPPORTATO = 'non_supportato'
+ERRORE = 'errore'
+
+ESTENSIONI_TESTO = ('.txt', '.csv', '.tsv', '.md', '.json', '.xml', '.html', '.htm')
+# oltre questa lunghezza il testo non migliora la ricerca, appesantisce l'indice
+MAX_CARATTERI = 500000
+
+_SPAZI_RE = re.compile(r'\s+')
+_STREAM_RE = re.compile(rb'stream\r?\n(.*?)endstream', re.S)
+_BLOCCO_TESTO_RE = re.compile(rb'\bBT\b(.*?)\bET\b', re.S)
+# in un blocco: stringa, array TJ oppure operatore di posizionamento
+_TOKEN_RE = re.compile(rb'\(((?:\\.|[^\\()])*)\)|\[(.*?)\]\s*TJ|\b(Td|TD|Tm|T\*)\b', re.S)
+_ARRAY_RE = re.compile(rb'\(((?:\\.|[^\\()])*)\)|(-?\d+(?:\.\d+)?)', re.S)
+# spaziatura in un array TJ (millesimi di em) che equivale a uno spazio
+SOGLIA_SPAZIO_TJ = 150
+_ESCAPE_RE = re.compile(rb'\\([0-7]{1,3}|.)', re.S)
+_ESCAPE = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+
+
+def _normalizza(testo):
+    return _SPAZI_RE.sub(' ', testo).strip()[:MAX_CARATTERI]
+
+
+def _testo_semplice(percorso):
+    with open(percorso, 'rb') as f:
+        contenuto = f.read(MAX_CARATTERI * 4)
+    try:
+        return contenuto.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return contenuto.decode('latin-1')
+
+
+def _sostituisci_escape(corrispondenza):
+    valore = corrispondenza.group(1)
+    if valore[:1].isdigit():
+        return bytes([int(valore, 8) & 0xff])
+    # \( \) \\ e le andate a capo spezzate con \
+    return _ESCAPE.get(valore, b'' if valore in b'\r\n' else valore)
+
+
+def _decodifica_stringa(grezza):
+    grezza = _ESCAPE_RE.sub(_sostituisci_escape, grezza)
+    if grezza.startswith(b'\xfe\xff'):
+        return grezza[2:].decode('utf-16-be', 'ignore')
+    return grezza.decode('latin-1')
+
+
+def _testo_blocco(blocco):
+    testo = []
+    for stringa, array, posizionamento in _TOKEN_RE.findall(blocco):
+        if posizionamento:
+            testo.append(' ')
+        elif array:
+            for elemento, spaziatura in _ARRAY_RE.findall(array):
+                if spaziatura:
+                    if -float(spaziatura) > SOGLIA_SPAZIO_TJ:
+                        testo.append(' ')
+                else:
+                    testo.append(_decodifica_stringa(elemento))
+        else:
+            testo.append(_decodifica_stringa(stringa))
+    return ''.join(testo)
+
+
+def _testo_pdf_interno(percorso):
+    ''' Estrattore minimo: stringhe letterali dei blocchi BT..ET negli stream,
+    decompressi se FlateDecode. Non interpreta le codifiche dei font: i PDF
+    con font incorporati a sottoinsiemi danno testo parziale.
+    '''
+    with open(percorso, 'rb') as f:
+        dati = f.read()
+    parti = []
+    for stream in _STREAM_RE.finditer(dati):
+        contenuto = stream.group(1)
+        try:
+            contenuto = zlib.decompressobj().decompress(contenuto)
+        except zlib.error:
+            pass
+        for blocco in _BLOCCO_TESTO_RE.finditer(contenuto):
+            parti.append(_testo_blocco(blocco.group(1)))
+        if sum(len(p) for p in parti) > MAX_CARATTERI:
+            break
+    return ' '.join(parti)
+
+
+def _testo_pdf(percorso):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return _testo_pdf_interno(percorso)
+    return ' '.join(pagina.extract_text() or '' for pagina in PdfReader(percorso).pages)
+
+
+def estrai_testo(percorso):
+    ''' Restituisce (esito, testo) con esito ESTRATTO, NON_SUPPORTATO o ERRORE. '''
+    estensione = os.path.splitext(percorso)[1].lower()
+    try:
+        if estensione == '.pdf':
+            testo = _testo_pdf(percorso)
+        elif estensione in ESTENSIONI_TESTO:
+            testo = _testo_semplice(percorso)
+        else:
+            return NON_SUPPORTATO, ''
+    except Exception:
+        return ERRORE, ''
+    return ESTRATTO, _normalizza(testo.replace('\x00', ''))
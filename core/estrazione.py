@@ -0,0 +1,60 @@
+import multiprocessing
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from .counts import conta, invalida_conteggi
+from .estrattori import ESTRATTO, NON_SUPPORTATO, estrai_testo
+from .models import Documento
+from .search import get_backend, DOCUMENTI
+
+__all__ = ['testi_in_attesa', 'estrai_in_attesa']
+
+STATI = {
+    ESTRATTO: Documento.TESTO_ESTRATTO,
+    NON_SUPPORTATO: Documento.TESTO_NON_SUPPORTATO,
+}
+
+
+def testi_in_attesa(using=DEFAULT_DB_ALIAS):
+    ''' Documenti il cui testo non è ancora stato estratto (in cache). '''
+    return conta(Documento.objects.using(using).filter(stato_testo=Documento.TESTO_IN_ATTESA), stima=False)
+
+
+def estrai_in_attesa(limite=100, processi=None, using=DEFAULT_DB_ALIAS):
+    ''' Estrae su un pool di processi il testo di al massimo `limite`
+    documenti in attesa, una volta per file (i documenti con lo stesso
+    contenuto condividono il file), e lo indicizza. Restituisce il numero
+    di documenti per stato finale.
+    '''
+    in_attesa = (Documento.objects.using(using)
+                 .filter(stato_testo=Documento.TESTO_IN_ATTESA)
+                 .order_by('pk')
+                 .values_list('pk', 'file')[:limite])
+    per_file = OrderedDict()
+    for pk, nome in in_attesa:
+        per_file.setdefault(nome, []).append(pk)
+    esiti = Counter()
+    if not per_file:
+        return esiti
+    storage = Documento._meta.get_field('file').storage
+    backend = get_backend(using, DOCUMENTI)
+    # spawn: il job gira nei thread di run_worker, e un fork copierebbe
+    # connessioni al database e lock tenuti dagli altri thread
+    with ProcessPoolExecutor(max_workers=processi, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futuri = {pool.submit(estrai_testo, storage.path(nome)): nome for nome in per_file}
+        for futuro in as_completed(futuri):
+            nome = futuri[futuro]
+            try:
+                esito, testo = futuro.result()
+            except Exception:
+                # processo terminato in modo anomalo (es. memoria esaurita)
+                esito, testo = None, ''
+            stato = STATI.get(esito, Documento.TESTO_ERRORE)
+            # nel frattempo il file di un documento può essere stato sostituito
+            esiti[stato] += (Documento.objects.using(using)
+                             .filter(pk__in=per_file[nome], file=nome, stato_testo=Documento.TESTO_IN_ATTESA)
+                             .update(testo=testo, stato_testo=stato, updated_at=timezone.now()))
+            backend.index(per_file[nome])
+    invalida_conteggi(Documento)
+    return esiti
@@ -0,0 +1,248 @@
+import csv
+import itertools
+import json
+import time
+from django.db import DEFAULT_DB_ALIAS, transaction
+from .counts import invalida_conteggi
+from .models import (Libro, Autore, Editore, Collana, Genere, SottoGenere,
+                     StatisticheBiblioteca)
+from .prefix_index import INDICI, invalida_indice
+from .search import get_backend
+
+__all__ = ['RecordNonValido', 'leggi_record', 'normalizza_record', 'ImportatoreLibri']
+
+# separatore dei valori multipli (autori, sottogeneri) nelle colonne CSV
+SEPARATORE = ';'
+
+
+class RecordNonValido(ValueError):
+    pass
+
+
+def leggi_record(percorso, formato=None):
+    ''' Legge un record alla volta da un CSV con intestazione o da un JSONL.
+    Le righe JSON non valide sono restituite come RecordNonValido.
+    '''
+    if formato is None:
+        formato = 'jsonl' if percorso.endswith(('.jsonl', '.json')) else 'csv'
+    with open(percorso, newline='', encoding='utf-8') as f:
+        if formato == 'csv':
+            yield from csv.DictReader(f)
+            return
+        for numero, riga in enumerate(f, 1):
+            if not riga.strip():
+                continue
+            try:
+                yield json.loads(riga)
+            except ValueError as err:
+                yield RecordNonValido('Riga {}: {}'.format(numero, err))
+
+
+def _testo(record, campo, obbligatorio=False):
+    valore = str(record.get(campo) or '').strip()
+    if obbligatorio and not valore:
+        raise RecordNonValido('Campo "{}" mancante'.format(campo))
+    return valore
+
+
+def _lista(valore):
+    if not valore:
+        return []
+    if isinstance(valore, str):
+        valore = valore.split(SEPARATORE)
+    elementi = (v if isinstance(v, dict) else str(v).strip() for v in valore)
+    return [v for v in elementi if v]
+
+
+def _autore(valore):
+    ''' "Nome Cognome", "Cognome, Nome" o {"nome": ..., "cognome": ...}. '''
+    if isinstance(valore, dict):
+        return (str(valore.get('nome') or '').strip(), str(valore.get('cognome') or '').strip())
+    if ',' in valore:
+        cognome, nome = valore.split(',', 1)
+    else:
+        nome, _, cognome = valore.rpartition(' ')
+    return nome.strip(), cognome.strip()
+
+
+def _max_length(model, campo, valore):
+    limite = model._meta.get_field(campo).max_length
+    if len(valore) > limite:
+        raise RecordNonValido('{}.{} supera {} caratteri: {!r}'.format(
+            model.__name__, campo, limite, valore))
+    return valore
+
+
+def normalizza_record(record):
+    isbn = _testo(record, 'isbn', obbligatorio=True).replace('-', '').replace(' ', '')
+    autori = [_autore(a) for a in _lista(record.get('autori'))]
+    for nome, cognome in autori:
+        _max_length(Autore, 'nome', nome)
+        _max_length(Autore, 'cognome', cognome)
+    return {
+        'isbn': _max_length(Libro, 'isbn', isbn),
+        'titolo': _max_length(Libro, 'titolo', _testo(record, 'titolo', obbligatorio=True)),
+        'descrizione': _testo(record, 'descrizione'),
+        'autori': autori,
+        'editore': _max_length(Editore, 'nome', _testo(record, 'editore', obbligatorio=True)),
+        'collana': _max_length(Collana, 'nome', _testo(record, 'collana')),
+        'genere': _max_length(Genere, 'nome', _testo(record, 'genere', obbligatorio=True)),
+        'sottogeneri': [_max_length(SottoGenere, 'nome', s) for s in _lista(record.get('sottogeneri'))],
+    }
+
+
+def _chiave(valori):
+    return tuple(v.strip().casefold() if isinstance(v, str) else v for v in valori)
+
+
+class Mappa:
+    ''' Valori dei campi (normalizzati) -> pk di un modello di lookup, caricata
+    una volta in memoria; i valori mancanti sono creati in blocco.
+    '''
+    def __init__(self, model, campi, using):
+        self.model = model
+        self.campi = campi
+        self.using = using
+        self.creati = 0
+        self._pk = {}
+        self._aggiungi(model.objects.using(using).order_by('pk').values_list('pk', *campi))
+
+    def _aggiungi(self, righe):
+        for pk, *valori in righe:
+            self._pk.setdefault(_chiave(valori), pk)
+
+    def risolvi(self, insieme):
+        mancanti = {}
+        for valori in insieme:
+            if _chiave(valori) not in self._pk:
+                mancanti.setdefault(_chiave(valori), valori)
+        if not mancanti:
+            return
+        self.model.objects.using(self.using).bulk_create(
+            [self.model(**dict(zip(self.campi, valori))) for valori in mancanti.values()])
+        # bulk_create non valorizza le pk su tutti i database: si rileggono
+        primi = {valori[0] for valori in mancanti.values()}
+        self._aggiungi(self.model.objects.using(self.using)
+                       .filter(**{'{}__in'.format(self.campi[0]): primi})
+                       .order_by('pk').values_list('pk', *self.campi))
+        self.creati += len(mancanti)
+
+    def __getitem__(self, valori):
+        return self._pk[_chiave(valori)]
+
+
+class ImportatoreLibri:
+    ''' Importa i libri a blocchi: per ogni blocco, in una transazione,
+    crea i lookup mancanti, inserisce Libro e righe delle M2M con
+    bulk_create e aggiorna indice di ricerca e statistiche.
+    '''
+    def __init__(self, using=DEFAULT_DB_ALIAS, batch=500):
+        self.using = using
+        self.batch = batch
+        self.letti = self.importati = self.esistenti = 0
+        self.scartati = []
+        self.autori = Mappa(Autore, ('nome', 'cognome'), using)
+        self.editori = Mappa(Editore, ('nome',), using)
+        self.collane = Mappa(Collana, ('editore_id', 'nome'), using)
+        self.generi = Mappa(Genere, ('nome',), using)
+        self.sottogeneri = Mappa(SottoGenere, ('padre_id', 'nome'), using)
+
+    def importa(self, records, salta=0, dopo_blocco=None):
+        ''' salta: record già importati (da un checkpoint); dopo_blocco(self)
+        è chiamata dopo il commit di ogni blocco.
+        '''
+        self.letti = salta
+        self.inizio = time.monotonic()
+        records = itertools.islice(records, salta, None)
+        try:
+            while True:
+                blocco = list(itertools.islice(records, self.batch))
+                if not blocco:
+                    break
+                self._importa_blocco(blocco)
+                self.letti += len(blocco)
+                if dopo_blocco is not None:
+                    dopo_blocco(self)
+        finally:
+            self._invalida()
+        return self
+
+    @property
+    def righe_al_secondo(self):
+        durata = time.monotonic() - self.inizio
+        return self.importati / durata if durata else 0
+
+    def _normalizza(self, blocco):
+        validi = {}
+        for posizione, record in enumerate(blocco, self.letti + 1):
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                libro = normalizza_record(record)
+            except RecordNonValido as err:
+                self.scartati.append((posizione, str(err)))
+                continue
+            if libro['isbn'] in validi:
+                self.esistenti += 1
+            else:
+                validi[libro['isbn']] = libro
+        return validi
+
+    def _importa_blocco(self, blocco):
+        validi = self._normalizza(blocco)
+        if not validi:
+            return
+        libri = Libro.objects.using(self.using)
+        with transaction.atomic(using=self.using):
+            presenti = set(libri.filter(isbn__in=list(validi)).values_list('isbn', flat=True))
+            self.esistenti += len(presenti)
+            nuovi = [r for isbn, r in validi.items() if isbn not in presenti]
+            if not nuovi:
+                return
+
+            self.editori.risolvi({(r['editore'],) for r in nuovi})
+            self.generi.risolvi({(r['genere'],) for r in nuovi})
+            self.collane.risolvi({(self.editori[(r['editore'],)], r['collana'])
+                                  for r in nuovi if r['collana']})
+            self.autori.risolvi({a for r in nuovi for a in r['autori']})
+            self.sottogeneri.risolvi({(self.generi[(r['genere'],)], s)
+                                      for r in nuovi for s in r['sottogeneri']})
+
+            libri.bulk_create([self._libro(r) for r in nuovi])
+            pks = dict(libri.filter(isbn__in=[r['isbn'] for r in nuovi]).values_list('isbn', 'pk'))
+
+            autori = Libro.autori.through
+            autori.objects.using(self.using).bulk_create([
+                autori(libro_id=pks[r['isbn']], autore_id=autore_id)
+                for r in nuovi for autore_id in {self.autori[a] for a in r['autori']}])
+            sottogeneri = Libro.sottogeneri.through
+            sottogeneri.objects.using(self.using).bulk_create([
+                sottogeneri(libro_id=pks[r['isbn']], sottogenere_id=sottogenere_id)
+                for r in nuovi
+                for sottogenere_id in {self.sottogeneri[(self.generi[(r['genere'],)], s)]
+                                       for s in r['sottogeneri']}])
+
+            # bulk_create non invia i segnali: indice e statistiche a mano
+            get_backend(self.using).index(pks.values())
+            StatisticheBiblioteca.aggiorna(libri_totali=len(nuovi), libri_disponibili=len(nuovi))
+        self.importati += len(nuovi)
+
+    def _libro(self, r):
+        editore_id = self.editori[(r['editore'],)]
+        return Libro(
+            isbn=r['isbn'],
+            titolo=r['titolo'],
+            descrizione=r['descrizione'],
+            editore_id=editore_id,
+            genere_id=self.generi[(r['genere'],)],
+            collana_id=self.collane[(editore_id, r['collana'])] if r['collana'] else None,
+        )
+
+    def _invalida(self):
+        if self.importati:
+            invalida_conteggi(Libro)
+        for mappa in (self.autori, self.editori, self.collane, self.generi, self.sottogeneri):
+            if mappa.creati:
+                invalida_conteggi(mappa.model)
+                if mappa.model in INDICI:
+                    invalida_indice(mappa.model)
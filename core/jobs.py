@@ -0,0 +1,221 @@
+''' Coda di job su tabella del database, senza servizi esterni.
+
+Le funzioni registrate con @job si accodano con funzione.accoda(...) e
+vengono eseguite dal comando run_worker. Il prelievo usa SELECT ... FOR
+UPDATE SKIP LOCKED dove il database lo supporta, altrimenti un solo UPDATE
+condizionato allo stato; in ogni caso due worker non eseguono mai lo
+stesso job.
+'''
+import json
+import os
+import socket
+import traceback
+from datetime import datetime, timedelta
+from django.db import connection, transaction
+from django.db.models import Count, F, Min, Subquery
+from django.utils import timezone
+from .anteprime import genera_in_attesa, nomi_anteprime
+from .circolazione import sweep_scadenze
+from .contesa import riprova_su_contesa
+from .estrazione import estrai_in_attesa
+from .importazione import ImportatoreLibri, leggi_record
+from .models import Documento, Job
+from .settings import CONTENUTI_GRAZIA, JOB_ATTESA_RIPROVA, JOB_TIMEOUT
+
+__all__ = ['job', 'accoda', 'preleva', 'esegui_funzione', 'registra_esito',
+           'recupera_persi', 'statistiche_coda',
+           'estrai_testi', 'genera_anteprime', 'rilascia_contenuto', 'sweep', 'importa_libri']
+
+REGISTRO = {}
+
+
+def job(nome, priorita=0, max_tentativi=None):
+    ''' Registra la funzione come job; gli argomenti devono essere serializzabili in JSON. '''
+    def decorator(func):
+        REGISTRO[nome] = func
+
+        def accoda_job(*args, unico=False, ritardo=None, **kwargs):
+            return accoda(nome, args, kwargs, priorita=priorita, max_tentativi=max_tentativi,
+                          unico=unico, ritardo=ritardo)
+        func.accoda = accoda_job
+        func.nome_job = nome
+        return func
+    return decorator
+
+
+def accoda(nome, args=(), kwargs=None, priorita=0, max_tentativi=None, unico=False, ritardo=None):
+    ''' Inserisce il job e ritorna subito. Con `unico` non accoda un doppione
+    di un job identico ancora in coda (es. "elabora i documenti in attesa").
+    '''
+    if nome not in REGISTRO:
+        raise KeyError('Job non registrato: {}'.format(nome))
+    argomenti = json.dumps({'args': list(args), 'kwargs': kwargs or {}}, sort_keys=True)
+    if unico:
+        esistente = Job.objects.filter(nome=nome, argomenti=argomenti, stato=Job.IN_CODA).first()
+        if esistente is not None:
+            return esistente
+    campi = {}
+    if max_tentativi is not None:
+        campi['max_tentativi'] = max_tentativi
+    if ritardo:
+        campi['eseguire_dopo'] = timezone.now() + timedelta(seconds=ritardo)
+    return Job.objects.create(nome=nome, argomenti=argomenti, priorita=priorita, **campi)
+
+
+def nome_worker():
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+def _candidati():
+    return (Job.objects
+            .filter(stato=Job.IN_CODA, eseguire_dopo__lte=timezone.now())
+            .order_by('-priorita', 'eseguire_dopo', 'pk'))
+
+
+@riprova_su_contesa('jobs.preleva')
+def preleva(worker=None, tentativi=5):
+    ''' Assegna al worker il prossimo job eseguibile (priorità più alta, poi
+    il più vecchio) e lo restituisce; None se la coda è vuota.
+    '''
+    worker = worker or nome_worker()
+    for _ in range(tentativi):
+        adesso = timezone.now()
+        assegna = {'stato': Job.IN_CORSO, 'iniziato_at': adesso, 'worker': worker,
+                   'tentativi': F('tentativi') + 1}
+        if connection.features.has_select_for_update_skip_locked:
+            with transaction.atomic():
+                candidato = _candidati().select_for_update(skip_locked=True).values_list('pk', flat=True).first()
+                if candidato is None:
+                    return None
+                Job.objects.filter(pk=candidato).update(**assegna)
+                return Job.objects.get(pk=candidato)
+        # un solo UPDATE con la scelta in sottoquery: su SQLite una SELECT
+        # seguita da un UPDATE nella stessa transazione fallisce subito con
+        # "database is locked" se un altro processo sta scrivendo
+        if not Job.objects.filter(pk=Subquery(_candidati().values('pk')[:1]), stato=Job.IN_CODA).update(**assegna):
+            if not _candidati().exists():
+                return None
+            continue
+        return Job.objects.filter(stato=Job.IN_CORSO, worker=worker, iniziato_at=adesso).latest('pk')
+    return None
+
+
+def esegui_funzione(nome, argomenti):
+    ''' Eseguita nel thread o nel processo del pool: restituisce None se il
+    job è riuscito, altrimenti il traceback come testo.
+    '''
+    try:
+        argomenti = json.loads(argomenti)
+        REGISTRO[nome](*argomenti['args'], **argomenti['kwargs'])
+    except Exception:
+        return traceback.format_exc()
+    finally:
+        # il thread o il processo del pool non deve tenere connessioni aperte
+        connection.close()
+    return None
+
+
+@riprova_su_contesa('jobs.registra_esito')
+def registra_esito(job, errore):
+    ''' Completa il job, oppure lo rimette in coda con attesa esponenziale
+    finché restano tentativi.
+    '''
+    adesso = timezone.now()
+    filtro = Job.objects.filter(pk=job.pk, stato=Job.IN_CORSO, worker=job.worker)
+    if errore is None:
+        filtro.update(stato=Job.COMPLETATO, completato_at=adesso, errore='')
+    elif job.tentativi < job.max_tentativi:
+        attesa = JOB_ATTESA_RIPROVA * 2 ** (job.tentativi - 1)
+        filtro.update(stato=Job.IN_CODA, eseguire_dopo=adesso + timedelta(seconds=attesa), errore=errore)
+    else:
+        filtro.update(stato=Job.FALLITO, completato_at=adesso, errore=errore)
+
+
+def recupera_persi():
+    ''' Job in corso da oltre JOB_TIMEOUT: il worker che li aveva presi è stato
+    terminato (es. memoria esaurita in un estrattore). Il tentativo è già
+    contato dal prelievo: tornano in coda finché restano tentativi, poi
+    falliscono, così un job che fa cadere il worker non viene ripreso
+    all'infinito. Restituisce (rimessi in coda, falliti).
+    '''
+    adesso = timezone.now()
+    persi = Job.objects.filter(stato=Job.IN_CORSO, iniziato_at__lt=adesso - timedelta(seconds=JOB_TIMEOUT))
+    errore = 'Worker terminato durante l\'esecuzione'
+    falliti = (persi.filter(tentativi__gte=F('max_tentativi'))
+               .update(stato=Job.FALLITO, completato_at=adesso, errore=errore))
+    rimessi = persi.filter(tentativi__lt=F('max_tentativi')).update(stato=Job.IN_CODA, worker='', errore=errore)
+    return rimessi, falliti
+
+
+def _voce_statistiche():
+    return {'in_coda': 0, 'in_corso': 0, 'falliti': 0, 'eta_massima': None,
+            'completati': 0, 'attesa_media': None, 'durata_media': None}
+
+
+def statistiche_coda(ore=24):
+    ''' Per nome: job in coda, in corso e falliti, età del più vecchio in coda
+    e, per i completati nelle ultime `ore`, attesa e durata medie.
+    '''
+    adesso = timezone.now()
+    statistiche = {}
+    for riga in (Job.objects.filter(stato__in=[Job.IN_CODA, Job.IN_CORSO, Job.FALLITO])
+                 .values('nome', 'stato').annotate(n=Count('pk'), primo=Min('creato_at'))):
+        voce = statistiche.setdefault(riga['nome'], _voce_statistiche())
+        if riga['stato'] == Job.IN_CODA:
+            voce['in_coda'] = riga['n']
+            voce['eta_massima'] = adesso - riga['primo']
+        elif riga['stato'] == Job.IN_CORSO:
+            voce['in_corso'] = riga['n']
+        else:
+            voce['falliti'] = riga['n']
+    completati = (Job.objects.filter(stato=Job.COMPLETATO, completato_at__gte=adesso - timedelta(hours=ore))
+                  .values_list('nome', 'creato_at', 'iniziato_at', 'completato_at'))
+    totali = {}
+    for nome, creato, iniziato, completato in completati.iterator():
+        attesa, durata = totali.get(nome, (timedelta(), timedelta()))
+        totali[nome] = (attesa + (iniziato - creato), durata + (completato - iniziato))
+        statistiche.setdefault(nome, _voce_statistiche())['completati'] += 1
+    for nome, (attesa, durata) in totali.items():
+        voce = statistiche[nome]
+        voce['attesa_media'] = attesa / voce['completati']
+        voce['durata_media'] = durata / voce['completati']
+    return statistiche
+
+
+# Job dell'applicazione
+
+@job('estrai_testi', priorita=-1)
+def estrai_testi():
+    ''' Testo di tutti i documenti in attesa; accodato dopo ogni upload. '''
+    while estrai_in_attesa():
+        pass
+
+
+@job('genera_anteprime', priorita=-1)
+def genera_anteprime():
+    while genera_in_attesa():
+        pass
+
+
+@job('rilascia_contenuto', priorita=-2)
+def rilascia_contenuto(nome):
+    ''' Elimina un file condiviso rimasto senza documenti, con le sue
+    anteprime; accodato con ritardo CONTENUTI_GRAZIA, vedi StorageContenuti.elimina.
+    '''
+    storage = Documento._meta.get_field('file').storage
+    esito = storage.elimina(nome, lambda: Documento.riferimenti_file(nome), CONTENUTI_GRAZIA)
+    if esito:
+        for derivato in nomi_anteprime(storage, nome).values():
+            storage.delete(derivato)
+    elif esito is None:
+        rilascia_contenuto.accoda(nome, unico=True, ritardo=CONTENUTI_GRAZIA)
+
+
+@job('sweep_scadenze', priorita=5)
+def sweep(data=None):
+    sweep_scadenze(datetime.strptime(data, '%Y-%m-%d').date() if data else None)
+
+
+@job('importa_libri', max_tentativi=1)
+def importa_libri(percorso, formato=None, batch=500):
+    ImportatoreLibri(batch=batch).importa(leggi_record(percorso, formato))
@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.test import Client
+from django.urls import reverse
+from core.contesa import azzera_metriche_contesa, metriche_contesa
+from core.models import Editore, Genere, Libro, Profilo, StatisticheBiblioteca
+
+
+class Command(BaseCommand):
+    help = ('Misura il throughput delle operazioni al banco (richiesta, consegna e restituzione '
+            'di un prestito) con più client concorrenti, su un database di test creato e '
+            'distrutto dal comando; riporta riprese e rinunce per lock occupati')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clienti', type=int, nargs='+', default=[1, 8, 32],
+                            help='Numero di client concorrenti per ogni misura')
+        parser.add_argument('--cicli', type=int, default=20,
+                            help='Cicli richiesta/consegna/restituzione per client')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        if min(options['clienti']) < 1 or options['cicli'] < 1:
+            raise CommandError('Clienti e cicli devono essere positivi.')
+        connection = connections[options['database']]
+        cartella = None
+        if connection.vendor == 'sqlite' and not connection.settings_dict['TEST'].get('NAME'):
+            # il database in memoria non è condiviso tra i thread come un file
+            cartella = tempfile.mkdtemp()
+            connection.settings_dict['TEST']['NAME'] = os.path.join(cartella, 'benchmark.sqlite3')
+        nome_originale = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            utente = User.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+            self.stdout.write('{:>8} {:>10} {:>10} {:>12} {:>8} {:>8}'.format(
+                'clienti', 'operazioni', 'op/s', 'p50 ms', 'riprese', 'rinunce'))
+            for clienti in options['clienti']:
+                self.misura(utente, clienti, options['cicli'])
+        finally:
+            connection.creation.destroy_test_db(nome_originale, verbosity=0)
+            if cartella:
+                shutil.rmtree(cartella, ignore_errors=True)
+
+    def prepara(self, clienti, cicli):
+        ''' Un libro per client e un profilo nuovo per ogni ciclo: una coppia
+        (profilo, libro) può avere un solo prestito.
+        '''
+        editore = Editore.objects.get_or_create(nome='Benchmark')[0]
+        genere = Genere.objects.get_or_create(nome='Benchmark')[0]
+        inizio = Libro.objects.count()
+        dati = []
+        for indice in range(inizio, inizio + clienti):
+            libro = Libro.objects.create(isbn='{:013d}'.format(indice), titolo='Libro {}'.format(indice),
+                                         editore=editore, genere=genere)
+            profili = []
+            for ciclo in range(cicli):
+                codice = '{}-{}'.format(indice, ciclo)
+                profili.append(Profilo.objects.create(
+                    nome='Profilo', cognome=codice, codfisc=codice, data_nascita=date(1980, 1, 1),
+                    telefono='0', email='profilo{}@example.com'.format(codice)).pk)
+            dati.append((libro.pk, profili))
+        StatisticheBiblioteca.ricalcola()
+        return dati
+
+    def misura(self, utente, clienti, cicli):
+        dati = self.prepara(clienti, cicli)
+        azzera_metriche_contesa()
+        partenza = threading.Barrier(clienti + 1)
+        latenze = []
+        errori = []
+
+        def cliente(libro_pk, profili):
+            client = Client()
+            client.force_login(utente)
+            partenza.wait()
+            try:
+                for profilo_pk in profili:
+                    inizio = time.monotonic()
+                    client.post(reverse('prestito_update_profilo', kwargs={'libro_pk': libro_pk}),
+                                {'profilo': profilo_pk})
+                    latenze.append(time.monotonic() - inizio)
+                    prestito_pk = Libro.objects.values_list('prestito_corrente', flat=True).get(pk=libro_pk)
+                    if prestito_pk is None:
+                        # richiesta rinunciata dopo i tentativi: il ciclo salta
+                        continue
+                    for nome in ('consegna_libro', 'restituzione_libro'):
+                        inizio = time.monotonic()
+                        client.post(reverse(nome, kwargs={'pk': prestito_pk}))
+                        latenze.append(time.monotonic() - inizio)
+            except Exception as err:
+                errori.append(err)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=cliente, args=coppia) for coppia in dati]
+        for thread in threads:
+            thread.start()
+        partenza.wait()
+        inizio = time.monotonic()
+        for thread in threads:
+            thread.join()
+        durata = time.monotonic() - inizio
+
+        metriche = metriche_contesa().values()
+        latenze.sort()
+        self.stdout.write('{:>8} {:>10} {:>10.1f} {:>12.1f} {:>8} {:>8}'.format(
+            clienti, len(latenze), len(latenze) / durata,
+            latenze[len(latenze) // 2] * 1000 if latenze else 0,
+            sum(m['riprese'] for m in metriche), sum(m['rinunce'] for m in metriche)))
+        for err in errori:
+            self.stderr.write('Client interrotto: {!r}'.format(err))
@@ -0,0 +1,151 @@
+import json
+import os
+import platform
+import shutil
+import tempfile
+from collections import OrderedDict
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from benchmarks.dati import crea_documenti
+from benchmarks.misure import BASELINE, confronta, misura
+from benchmarks.scenari import SCENARI, Contesto, ScenarioNonEseguibile, url_senza_scenario
+from core.dataset import GeneratoreDataset
+
+
+class Command(BaseCommand):
+    help = ('Misura latenza p50/p95, numero di query e picco di memoria di ogni vista con il '
+            'client di test, su un dataset sintetico in un database di test creato e distrutto '
+            'dal comando; confronta i risultati con la baseline (benchmarks/baseline.json)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenari', nargs='*', help='Nomi degli scenari (default tutti)')
+        parser.add_argument('--ripetizioni', type=int, default=20, help='Richieste misurate per scenario')
+        parser.add_argument('--riscaldamento', type=int, default=3,
+                            help='Richieste non misurate prima di ogni scenario')
+        parser.add_argument('--libri', type=int, default=20000)
+        parser.add_argument('--profili', type=int, default=2000)
+        parser.add_argument('--prestiti', type=int, default=100000)
+        parser.add_argument('--documenti', type=int, default=500)
+        parser.add_argument('--seme', type=int, default=0)
+        parser.add_argument('--output', help='File JSON in cui scrivere i risultati')
+        parser.add_argument('--baseline', default=BASELINE)
+        parser.add_argument('--aggiorna-baseline', action='store_true',
+                            help='Scrive i risultati come nuova baseline invece di confrontarli')
+        parser.add_argument('--tolleranza', type=float, default=0.3,
+                            help='Aumento relativo ammesso di latenza p95 e memoria')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        if options['ripetizioni'] < 1 or options['riscaldamento'] < 0:
+            raise CommandError('Le ripetizioni devono essere almeno una.')
+        scenari = SCENARI
+        if options['scenari']:
+            scenari = [s for s in SCENARI if s.nome in options['scenari']]
+            sconosciuti = set(options['scenari']) - {s.nome for s in scenari}
+            if sconosciuti:
+                raise CommandError('Scenari sconosciuti: {} (disponibili: {})'.format(
+                    ', '.join(sorted(sconosciuti)), ', '.join(s.nome for s in SCENARI)))
+        for nome in url_senza_scenario():
+            self.stderr.write('URL senza scenario: {}'.format(nome))
+        dataset = OrderedDict((chiave, options[chiave])
+                              for chiave in ('libri', 'profili', 'prestiti', 'documenti', 'seme'))
+        baseline = None
+        if not options['aggiorna_baseline']:
+            baseline = self.leggi_baseline(options['baseline'], dataset)
+
+        risultati = self.esegui(scenari, dataset, options)
+
+        if options['output']:
+            self.scrivi(options['output'], risultati)
+        if options['aggiorna_baseline']:
+            if options['scenari'] and os.path.exists(options['baseline']):
+                # misurati solo alcuni scenari: gli altri restano quelli della baseline
+                with open(options['baseline']) as file:
+                    precedenti = json.load(file, object_pairs_hook=OrderedDict)['scenari']
+                precedenti.update(risultati['scenari'])
+                risultati['scenari'] = OrderedDict(
+                    (s.nome, precedenti[s.nome]) for s in SCENARI if s.nome in precedenti)
+            self.scrivi(options['baseline'], risultati)
+            self.stdout.write(self.style.SUCCESS('Baseline scritta in {}.'.format(options['baseline'])))
+            return
+        regressioni = confronta(risultati, baseline, options['tolleranza'], options['tolleranza'])
+        if regressioni:
+            raise CommandError('Regressioni rispetto alla baseline:\n{}'.format('\n'.join(
+                '  {}: {} {} -> {}'.format(r.scenario, r.metrica, r.baseline, r.attuale)
+                for r in regressioni)))
+        self.stdout.write(self.style.SUCCESS('Nessuna regressione rispetto alla baseline.'))
+
+    def leggi_baseline(self, percorso, dataset):
+        if not os.path.exists(percorso):
+            raise CommandError('Baseline {} assente: creala con --aggiorna-baseline.'.format(percorso))
+        with open(percorso) as file:
+            baseline = json.load(file)
+        if baseline['dataset'] != dataset:
+            # con un altro dataset cambiano anche i numeri di query (es. le pagine)
+            raise CommandError('La baseline è stata misurata su un altro dataset ({}).'.format(
+                ', '.join('{}={}'.format(chiave, valore) for chiave, valore in baseline['dataset'].items())))
+        return baseline
+
+    def esegui(self, scenari, dataset, options):
+        connection = connections[options['database']]
+        cartella = tempfile.mkdtemp()
+        if connection.vendor == 'sqlite' and not connection.settings_dict['TEST'].get('NAME'):
+            # su file come in produzione, non in memoria
+            connection.settings_dict['TEST']['NAME'] = os.path.join(cartella, 'benchmark.sqlite3')
+        setup_test_environment()
+        nome_originale = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # cache e file privati: il benchmark non tocca quelli dell'installazione
+        isolamento = override_settings(
+            MEDIA_ROOT=os.path.join(cartella, 'media'),
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                'LOCATION': 'benchmark-viste'}})
+        isolamento.enable()
+        try:
+            self.stdout.write('Generazione del dataset ({})...'.format(
+                ', '.join('{}={}'.format(chiave, valore) for chiave, valore in dataset.items())))
+            GeneratoreDataset(dataset['libri'], dataset['profili'], dataset['prestiti'],
+                              seme=dataset['seme'], using=options['database']).genera()
+            utente = User.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+            crea_documenti(utente, dataset['documenti'])
+            client = Client()
+            client.force_login(utente)
+            contesto = Contesto(options['riscaldamento'] + options['ripetizioni'] + 1)
+
+            risultati = OrderedDict([
+                ('data', timezone.now().isoformat(timespec='seconds')),
+                ('python', platform.python_version()),
+                ('django', django.get_version()),
+                ('database', '{} {}'.format(
+                    connection.vendor, getattr(connection.Database, 'sqlite_version', '')).strip()),
+                ('dataset', dataset),
+                ('ripetizioni', options['ripetizioni']),
+                ('scenari', OrderedDict()),
+            ])
+            self.stdout.write('{:<34} {:>5} {:>10} {:>10} {:>7} {:>10}'.format(
+                'scenario', '', 'p50 ms', 'p95 ms', 'query', 'memoria KB'))
+            for scenario in scenari:
+                try:
+                    esito = misura(client, scenario, contesto, options['ripetizioni'],
+                                   options['riscaldamento'], options['database'])
+                except ScenarioNonEseguibile as err:
+                    raise CommandError('Scenario {}: {}'.format(scenario.nome, err))
+                risultati['scenari'][scenario.nome] = esito
+                self.stdout.write('{:<34} {:>5} {:>10.2f} {:>10.2f} {:>7} {:>10}'.format(
+                    scenario.nome, esito['metodo'], esito['p50_ms'], esito['p95_ms'],
+                    esito['query'], esito['memoria_picco_kb']))
+            return risultati
+        finally:
+            isolamento.disable()
+            connection.creation.destroy_test_db(nome_originale, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(cartella, ignore_errors=True)
+
+    def scrivi(self, percorso, risultati):
+        with open(percorso, 'w') as file:
+            json.dump(risultati, file, indent=2)
+            file.write('\n')
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from core.models import Documento
+
+
+class Command(BaseCommand):
+    help = ('Sposta i file dei documenti caricati prima dello storage per contenuto sotto '
+            "l'impronta SHA-256: i file con lo stesso contenuto sono salvati una volta sola "
+            'e i vecchi file non più usati vengono eliminati')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Mostra cosa verrebbe fatto senza modificare nulla')
+
+    def handle(self, *args, **options):
+        storage = Documento._meta.get_field('file').storage
+        spostati = eliminati = byte_liberati = 0
+        vecchi = (Documento.objects.exclude(file__startswith=storage.cartella + '/')
+                  .values_list('file', flat=True).distinct().order_by('file'))
+        for vecchio in vecchi.iterator():
+            if not storage.exists(vecchio):
+                self.stderr.write('File mancante: {}'.format(vecchio))
+                continue
+            with storage.open(vecchio) as content:
+                nuovo = storage.nome_contenuto(storage.impronta(content), vecchio)
+                if options['verbosity'] > 1:
+                    self.stdout.write('{} -> {}'.format(vecchio, nuovo))
+                if options['dry_run']:
+                    continue
+                if not storage.exists(nuovo):
+                    nuovo = storage.save(vecchio, content)
+                else:
+                    byte_liberati += storage.size(vecchio)
+            # update(): il contenuto non cambia, i segnali non servono
+            spostati += Documento.objects.filter(file=vecchio).update(file=nuovo)
+            storage.delete(vecchio)
+            eliminati += 1
+        if options['dry_run']:
+            return
+        self.stdout.write(self.style.SUCCESS(
+            '{} documenti aggiornati, {} vecchi file eliminati, {} KB liberati dai duplicati.'.format(
+                spostati, eliminati, byte_liberati // 1024)))
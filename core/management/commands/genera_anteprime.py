@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from core.anteprime import genera_in_attesa
+from core.models import Documento
+
+
+class Command(BaseCommand):
+    help = ('Genera in background anteprima della prima pagina e miniatura dei documenti '
+            'caricati; con --continuo resta in attesa di nuovi documenti')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processi', type=int, help='Processi del pool, di default uno per CPU')
+        parser.add_argument('--blocco', type=int, default=100, help='Documenti per ciclo')
+        parser.add_argument('--continuo', action='store_true',
+                            help='Non termina: controlla i nuovi documenti ogni --intervallo secondi')
+        parser.add_argument('--intervallo', type=float, default=10)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        stati = dict(Documento.STATI_ANTEPRIMA)
+        while True:
+            inizio = time.monotonic()
+            esiti = genera_in_attesa(options['blocco'], options['processi'], options['database'])
+            if esiti:
+                self.stdout.write('{} ({:.1f}s)'.format(
+                    ', '.join('{}: {}'.format(stati[stato], n) for stato, n in esiti.items()),
+                    time.monotonic() - inizio))
+            elif not options['continuo']:
+                break
+            else:
+                time.sleep(options['intervallo'])
+        self.stdout.write(self.style.SUCCESS('Nessun documento in attesa di anteprima.'))
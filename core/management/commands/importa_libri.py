@@ -0,0 +1,72 @@
+import json
+import os
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from core.importazione import ImportatoreLibri, leggi_record
+from core.jobs import importa_libri
+
+
+class Command(BaseCommand):
+    help = ('Importa libri da un file CSV (con intestazione) o JSONL con i campi isbn, titolo, '
+            'autori, editore, collana, genere, sottogeneri e descrizione; i valori multipli '
+            'nel CSV sono separati da ";"')
+
+    def add_arguments(self, parser):
+        parser.add_argument('file')
+        parser.add_argument('--formato', choices=['csv', 'jsonl'],
+                            help="Formato del file; di default dedotto dall'estensione")
+        parser.add_argument('--batch', type=int, default=500,
+                            help='Record per transazione')
+        parser.add_argument('--checkpoint',
+                            help='File di checkpoint: se esiste l\'import riprende da lì')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--in-coda', action='store_true',
+                            help="Accoda l'import per il worker (run_worker) invece di eseguirlo")
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['file']):
+            raise CommandError('File non trovato: {}'.format(options['file']))
+        if options['in_coda']:
+            job = importa_libri.accoda(os.path.abspath(options['file']), options['formato'], options['batch'])
+            self.stdout.write(self.style.SUCCESS('Import accodato ({}).'.format(job)))
+            return
+        salta = self.leggi_checkpoint(options['checkpoint'])
+        if salta:
+            self.stdout.write('Ripresa dal checkpoint: {} record già elaborati.'.format(salta))
+
+        def dopo_blocco(importatore):
+            if options['checkpoint']:
+                self.scrivi_checkpoint(options['checkpoint'], importatore.letti)
+            if options['verbosity'] > 1:
+                self.stdout.write('{} letti, {} importati ({:.0f} righe/s)'.format(
+                    importatore.letti, importatore.importati, importatore.righe_al_secondo))
+
+        importatore = ImportatoreLibri(using=options['database'], batch=options['batch'])
+        importatore.importa(leggi_record(options['file'], options['formato']),
+                            salta=salta, dopo_blocco=dopo_blocco)
+
+        for posizione, errore in importatore.scartati:
+            self.stderr.write('Record {} scartato: {}'.format(posizione, errore))
+        if options['checkpoint'] and os.path.exists(options['checkpoint']):
+            os.remove(options['checkpoint'])
+        self.stdout.write(self.style.SUCCESS(
+            '{} libri importati, {} già presenti, {} scartati ({:.0f} righe/s).'.format(
+                importatore.importati, importatore.esistenti, len(importatore.scartati),
+                importatore.righe_al_secondo)))
+        creati = ', '.join('{} {}'.format(m.creati, m.model._meta.verbose_name_plural.lower())
+                           for m in (importatore.autori, importatore.editori, importatore.collane,
+                                     importatore.generi, importatore.sottogeneri) if m.creati)
+        if creati:
+            self.stdout.write('Creati: {}.'.format(creati))
+
+    def leggi_checkpoint(self, percorso):
+        if not percorso or not os.path.exists(percorso):
+            return 0
+        with open(percorso) as f:
+            return json.load(f)['letti']
+
+    def scrivi_checkpoint(self, percorso, letti):
+        temporaneo = percorso + '.tmp'
+        with open(temporaneo, 'w') as f:
+            json.dump({'letti': letti}, f)
+        os.replace(temporaneo, percorso)
@@ -0,0 +1,32 @@
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from core.prefix_index import INDICI
+
+
+class Command(BaseCommand):
+    help = ("Costruisce gli indici in memoria dell'autocomplete e ne misura "
+            "costo di avvio, memoria e latenza delle ricerche")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ricerche', type=int, default=1000,
+                            help='Numero di ricerche per prefisso da cronometrare per indice')
+
+    def handle(self, *args, **options):
+        totale = 0.0
+        for model, indice in INDICI.items():
+            tracemalloc.start()
+            durata = indice.build()
+            memoria = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            totale += durata
+            righe, chiavi, _ = indice._dati
+            prefissi = [chiave[:2] for chiave in chiavi[::max(1, len(chiavi) // 50)]] or ['']
+            inizio = time.perf_counter()
+            for i in range(options['ricerche']):
+                risultati = indice.search(prefissi[i % len(prefissi)])
+                risultati[:10]
+            latenza = (time.perf_counter() - inizio) / options['ricerche']
+            self.stdout.write('{:<10} righe={:<8} chiavi={:<8} build={:8.1f} ms  memoria={:8.1f} KiB  ricerca={:7.1f} µs'.format(
+                model._meta.verbose_name, len(righe), len(chiavi), durata * 1000, memoria / 1024, latenza * 1e6))
+        self.stdout.write(self.style.SUCCESS('Avvio worker (build di tutti gli indici): {:.1f} ms'.format(totale * 1000)))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.contesa import EVENTI, azzera_metriche_contesa, metriche_condivise, metriche_contesa
+from core.settings import CONTESA_CACHE
+
+
+class Command(BaseCommand):
+    help = ('Mostra per vista le esecuzioni, le riprese dopo un lock occupato e le rinunce '
+            'registrate nella cache condivisa BIBLIOTECA_CONTESA_CACHE')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--azzera', action='store_true', help='Azzera i contatori dopo averli mostrati')
+
+    def handle(self, *args, **options):
+        if not metriche_condivise():
+            raise CommandError(
+                'La cache "{}" è nella memoria di ogni processo: i contatori delle viste non sono '
+                'visibili da qui. Impostare BIBLIOTECA_CONTESA_CACHE su una cache condivisa '
+                '(memcached, redis).'.format(CONTESA_CACHE))
+        metriche = metriche_contesa()
+        if not metriche:
+            self.stdout.write('Nessuna operazione registrata.')
+        else:
+            self.stdout.write('{:<36} {}'.format('vista', ' '.join('{:>10}'.format(e) for e in EVENTI)))
+            for nome, valori in metriche.items():
+                self.stdout.write('{:<36} {}'.format(nome, ' '.join('{:>10}'.format(valori[e]) for e in EVENTI)))
+        if options['azzera']:
+            azzera_metriche_contesa()
+            self.stdout.write(self.style.SUCCESS('Contatori azzerati.'))
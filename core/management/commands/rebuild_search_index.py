@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from core.search import get_backend, LIBRI, DOCUMENTI
+
+
+class Command(BaseCommand):
+    help = "Ricostruisce gli indici di ricerca full-text dei libri e dei documenti"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--indice', choices=[LIBRI, DOCUMENTI], action='append',
+                            help='Indice da ricostruire, di default tutti')
+
+    def handle(self, *args, **options):
+        for indice in options['indice'] or [LIBRI, DOCUMENTI]:
+            backend = get_backend(options['database'], indice)
+            inizio = time.monotonic()
+            totale = backend.rebuild()
+            if not backend.is_available():
+                self.stdout.write(self.style.WARNING(
+                    'Indice full-text non disponibile su questo database: la ricerca dei {} usa LIKE.'.format(
+                        indice)))
+                continue
+            self.stdout.write(self.style.SUCCESS('Indicizzati {} {} in {:.2f}s ({}).'.format(
+                totale, indice, time.monotonic() - inizio, backend.__class__.__name__)))
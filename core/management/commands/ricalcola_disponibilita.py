@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from core.models import Libro, Prestito
+
+
+class Command(BaseCommand):
+    help = 'Ricalcola disponibilità e prestito corrente di tutti i libri a partire dai prestiti'
+
+    def handle(self, *args, **options):
+        attivi = (Prestito.objects.filter(libro=OuterRef('pk'))
+                  .exclude(stato=Prestito.CONCLUSO)
+                  .order_by('-data_richiesta'))
+        with transaction.atomic():
+            # libri con prestito corrente o disponibilità sbagliati, 0 al posto di NULL
+            errati = (Libro.objects
+                      .annotate(atteso=Coalesce(Subquery(attivi.values('pk')[:1]), Value(0)),
+                                salvato=Coalesce('prestito_corrente', Value(0)))
+                      .filter(~Q(salvato=F('atteso')) | Q(disponibile=True, atteso__gt=0) |
+                              Q(disponibile=False, atteso=0))
+                      .count())
+            Libro.objects.update(prestito_corrente=Subquery(attivi.values('pk')[:1]))
+            resi_disponibili = (Libro.objects.filter(prestito_corrente__isnull=True, disponibile=False)
+                                .update(disponibile=True))
+            resi_non_disponibili = (Libro.objects.filter(prestito_corrente__isnull=False, disponibile=True)
+                                    .update(disponibile=False))
+        self.stdout.write(self.style.SUCCESS(
+            'Disponibilità ricalcolata: {} libri corretti ({} resi disponibili, {} non disponibili).'.format(
+                errati, resi_disponibili, resi_non_disponibili)))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from core.models import StatisticheBiblioteca
+
+
+class Command(BaseCommand):
+    help = 'Ricalcola da zero le statistiche della dashboard e riporta lo scostamento'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Mostra lo scostamento senza correggere le statistiche')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            statistiche = StatisticheBiblioteca.get()
+            reali = StatisticheBiblioteca.calcola()
+            scostamento = {campo: getattr(statistiche, campo) - valore for campo, valore in reali.items()}
+        else:
+            statistiche, scostamento = StatisticheBiblioteca.ricalcola()
+        for campo, delta in scostamento.items():
+            riga = '{:<20} {:>8} (scostamento {:+d})'.format(campo, getattr(statistiche, campo), delta)
+            self.stdout.write(self.style.WARNING(riga) if delta else riga)
+        if any(scostamento.values()):
+            self.stdout.write(self.style.WARNING('Statistiche non allineate{}.'.format(
+                '' if options['dry_run'] else ': corrette')))
+        else:
+            self.stdout.write(self.style.SUCCESS('Statistiche allineate.'))
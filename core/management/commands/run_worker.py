@@ -0,0 +1,98 @@
+import multiprocessing
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import django
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError
+from core.jobs import esegui_funzione, nome_worker, preleva, recupera_persi, registra_esito
+
+# ogni quanti secondi rimettere in coda i job dei worker terminati
+INTERVALLO_RECUPERO = 60
+
+
+class Command(BaseCommand):
+    help = ('Esegue i job in coda (core.jobs) su un pool di thread o di processi; '
+            'termina con Ctrl-C dopo aver completato i job in corso')
+
+    def add_arguments(self, parser):
+        pool = parser.add_mutually_exclusive_group()
+        pool.add_argument('--thread', type=int, help='Dimensione del pool di thread (default 4)')
+        pool.add_argument('--processi', type=int, help='Dimensione del pool di processi')
+        parser.add_argument('--intervallo', type=float, default=1.0,
+                            help='Secondi tra un controllo e l\'altro della coda vuota')
+        parser.add_argument('--una-volta', action='store_true',
+                            help='Termina quando la coda è vuota')
+
+    def get_pool(self, options):
+        if options['processi']:
+            # spawn: i processi non ereditano le connessioni aperte del worker
+            return options['processi'], ProcessPoolExecutor(
+                max_workers=options['processi'], mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup)
+        dimensione = options['thread'] or 4
+        return dimensione, ThreadPoolExecutor(max_workers=dimensione)
+
+    def handle(self, *args, **options):
+        worker = nome_worker()
+        dimensione, pool = self.get_pool(options)
+        self.stdout.write('Worker {} avviato ({} x {}).'.format(worker, dimensione, type(pool).__name__))
+        in_corso = {}
+        ultimo_recupero = 0
+        try:
+            while True:
+                if time.monotonic() - ultimo_recupero > INTERVALLO_RECUPERO:
+                    try:
+                        rimessi, falliti = recupera_persi()
+                    except DatabaseError as err:
+                        self.stderr.write('Recupero dei job persi non riuscito: {}'.format(err))
+                    else:
+                        if rimessi or falliti:
+                            self.stderr.write('Job di worker terminati: {} rimessi in coda, {} falliti '
+                                              'per tentativi esauriti.'.format(rimessi, falliti))
+                        ultimo_recupero = time.monotonic()
+                errore_prelievo = False
+                while len(in_corso) < dimensione:
+                    try:
+                        job = preleva(worker)
+                    except DatabaseError as err:
+                        # nessun job assegnato: si riprova al prossimo giro
+                        self.stderr.write('Prelievo non riuscito: {}'.format(err))
+                        errore_prelievo = True
+                        break
+                    if job is None:
+                        break
+                    in_corso[pool.submit(esegui_funzione, job.nome, job.argomenti)] = job
+                if not in_corso:
+                    if options['una_volta'] and not errore_prelievo:
+                        break
+                    time.sleep(options['intervallo'])
+                    continue
+                completati, _ = wait(in_corso, timeout=options['intervallo'], return_when=FIRST_COMPLETED)
+                for futuro in completati:
+                    self.completa(in_corso.pop(futuro), futuro)
+        except KeyboardInterrupt:
+            self.stdout.write('Arresto: attendo {} job in corso.'.format(len(in_corso)))
+            for futuro in wait(in_corso).done:
+                self.completa(in_corso.pop(futuro), futuro)
+        finally:
+            pool.shutdown()
+
+    def completa(self, job, futuro):
+        try:
+            errore = futuro.result()
+        except Exception:
+            # processo del pool terminato in modo anomalo
+            errore = traceback.format_exc()
+        try:
+            registra_esito(job, errore)
+        except DatabaseError as err:
+            # resta in corso: recupera_persi lo rimetterà in coda dopo JOB_TIMEOUT
+            self.stderr.write('Esito di {} non registrato: {}'.format(job, err))
+            return
+        durata = time.time() - job.iniziato_at.timestamp()
+        if errore is None:
+            self.stdout.write('{} completato in {:.1f}s'.format(job, durata))
+        else:
+            self.stderr.write('{} fallito (tentativo {} di {}):\n{}'.format(
+                job, job.tentativi, job.max_tentativi, errore))
@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.utils import timezone
+from core.models import Libro, Prestito
+from core.piani_query import QUERY_CALDE, spiega
+
+
+class Command(BaseCommand):
+    help = ('Mostra il piano di esecuzione delle query più frequenti e l\'indice che usano; '
+            'con --output scrive il report in Markdown (docs/piani_query.md)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('query', nargs='*', help='Nomi delle query (default tutte)')
+        parser.add_argument('--output', help='File Markdown in cui scrivere il report')
+        parser.add_argument('--analyze', action='store_true',
+                            help='Aggiorna prima le statistiche del planner (SQLite e PostgreSQL)')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        query = QUERY_CALDE
+        if options['query']:
+            query = [q for q in QUERY_CALDE if q.nome in options['query']]
+            sconosciute = set(options['query']) - {q.nome for q in query}
+            if sconosciute:
+                raise CommandError('Query sconosciute: {} (disponibili: {})'.format(
+                    ', '.join(sorted(sconosciute)), ', '.join(q.nome for q in QUERY_CALDE)))
+        connection = connections[options['database']]
+        if options['analyze'] and connection.vendor in ('sqlite', 'postgresql'):
+            # senza statistiche il planner non distingue un filtro selettivo da uno che non lo è
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        piani = spiega(options['database'], query)
+        for piano in piani:
+            esito = (self.style.SUCCESS('usa {}'.format(piano.indice)) if piano.indice
+                     else self.style.WARNING('nessun indice atteso ({})'.format(', '.join(piano.query.indici))))
+            self.stdout.write('{} - {}'.format(piano.query.nome, esito))
+            for riga in piano.righe:
+                self.stdout.write('    ' + riga)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(self.report(piani, connection))
+            self.stdout.write('Report scritto in {}.'.format(options['output']))
+        if not all(piano.indice for piano in piani):
+            raise CommandError('{} query senza l\'indice atteso.'.format(
+                sum(1 for piano in piani if not piano.indice)))
+
+    def report(self, piani, connection):
+        versione = getattr(connection.Database, 'sqlite_version', '')
+        righe = [
+            '# Piani di esecuzione delle query calde',
+            '',
+            'Generato da `python manage.py spiega_query` il {} su {} {}, con {} libri e {} prestiti.'.format(
+                timezone.now().date(), connection.vendor, versione,
+                Libro.objects.using(connection.alias).count(),
+                Prestito.objects.using(connection.alias).count()).replace(' ,', ','),
+            'I piani dipendono dalle statistiche del planner: vanno generati su un database '
+            'popolato, con `--analyze` o dopo un ANALYZE.',
+            '',
+            '| Query | Indice |',
+            '| --- | --- |',
+        ]
+        righe += ['| {} | {} |'.format(piano.query.descrizione, piano.indice or 'nessuno') for piano in piani]
+        righe.append('')
+        for piano in piani:
+            righe += [
+                '## {}'.format(piano.query.descrizione),
+                '',
+                '`{}` - indice: **{}**'.format(piano.query.nome, piano.indice or 'nessuno'),
+                '',
+                '```sql',
+                piano.sql,
+                '```',
+                '',
+                '```',
+            ] + piano.righe + ['```', '']
+        return '\n'.join(righe)
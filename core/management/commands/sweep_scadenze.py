@@ -0,0 +1,32 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from core.circolazione import sweep_scadenze
+from core.jobs import sweep
+
+
+class Command(BaseCommand):
+    help = ('Termina le sospensioni scadute, segnala per ritardo e sospende i profili con '
+            'prestiti scaduti; da pianificare una volta al giorno (es. cron)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data', help='Giorno di riferimento (AAAA-MM-GG), di default oggi')
+        parser.add_argument('--in-coda', action='store_true',
+                            help='Accoda lo sweep per il worker (run_worker) invece di eseguirlo')
+
+    def handle(self, *args, **options):
+        oggi = None
+        if options['data']:
+            try:
+                oggi = datetime.strptime(options['data'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Data non valida: {}'.format(options['data']))
+        if options['in_coda']:
+            job = sweep.accoda(options['data'], unico=True)
+            self.stdout.write(self.style.SUCCESS('Sweep scadenze accodato ({}).'.format(job)))
+            return
+        resoconto, durate = sweep_scadenze(oggi)
+        for voce, valore in resoconto.items():
+            self.stdout.write('{:<24} {:>6}'.format(voce, valore))
+        for fase, secondi in durate.items():
+            self.stdout.write('{:<24} {:>9.1f} ms'.format(fase, secondi * 1000))
+        self.stdout.write(self.style.SUCCESS('Sweep scadenze completato.'))
@@ -0,0 +1,35 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def ricalcola_disponibilita(apps, schema_editor):
+    Libro = apps.get_model('core', 'Libro')
+    Prestito = apps.get_model('core', 'Prestito')
+    attivi = (Prestito.objects.filter(libro=models.OuterRef('pk'))
+              .exclude(stato='CN')
+              .order_by('-data_richiesta'))
+    Libro.objects.update(prestito_corrente=models.Subquery(attivi.values('pk')[:1]))
+    Libro.objects.filter(prestito_corrente__isnull=False).update(disponibile=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_auto_20181205_1044'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='libro',
+            name='disponibile',
+            field=models.BooleanField(db_index=True, default=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='libro',
+            name='prestito_corrente',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.Prestito'),
+        ),
+        migrations.RunPython(ricalcola_disponibilita, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def crea_indice_ricerca(apps, schema_editor):
+    from core.search import get_backend
+    get_backend(schema_editor.connection.alias).rebuild()
+
+
+def elimina_indice_ricerca(apps, schema_editor):
+    from core.search import get_backend
+    get_backend(schema_editor.connection.alias).drop()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_libro_disponibilita'),
+    ]
+
+    operations = [
+        migrations.RunPython(crea_indice_ricerca, elimina_indice_ricerca),
+    ]
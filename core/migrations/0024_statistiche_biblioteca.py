@@ -0,0 +1,42 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:48
+
+from django.db import migrations, models
+
+
+def calcola_statistiche(apps, schema_editor):
+    StatisticheBiblioteca = apps.get_model('core', 'StatisticheBiblioteca')
+    Libro = apps.get_model('core', 'Libro')
+    Prestito = apps.get_model('core', 'Prestito')
+    StatisticheBiblioteca.objects.create(
+        pk=1,
+        prestiti_incorso=Prestito.objects.filter(stato='IC').count(),
+        prestiti_richiesti=Prestito.objects.filter(stato='RC').count(),
+        libri_disponibili=Libro.objects.filter(disponibile=True).count(),
+        libri_totali=Libro.objects.count(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_indice_ricerca_libri'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatisticheBiblioteca',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prestiti_incorso', models.IntegerField(default=0)),
+                ('prestiti_richiesti', models.IntegerField(default=0)),
+                ('libri_disponibili', models.IntegerField(default=0)),
+                ('libri_totali', models.IntegerField(default=0)),
+                ('data_riconciliazione', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Statistiche biblioteca',
+                'verbose_name_plural': 'Statistiche biblioteca',
+            },
+        ),
+        migrations.RunPython(calcola_statistiche, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_statistiche_biblioteca'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='libro',
+            name='versione',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='prestito',
+            name='versione',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
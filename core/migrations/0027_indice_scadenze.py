@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='prestito',
+            index=models.Index(fields=['stato', 'data_scadenza'], name='core_prestito_scadenza'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 2.2.28 on 2026-10-18 20:10
+
+import core.models
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_indice_scadenze'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='documento',
+            name='file',
+            field=models.FileField(db_index=True, help_text='Dimensione massima: 50 Kb', storage=core.storage.StorageContenuti(), upload_to='documenti/%Y/%m/', validators=[core.models.valida_documento]),
+        ),
+    ]
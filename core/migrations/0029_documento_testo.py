@@ -0,0 +1,34 @@
+# Generated by Django 2.2.28 on 2026-10-18 20:20
+
+from django.db import migrations, models
+
+
+def crea_indice_documenti(apps, schema_editor):
+    from core.search import get_backend, DOCUMENTI
+    get_backend(schema_editor.connection.alias, DOCUMENTI).rebuild()
+
+
+def elimina_indice_documenti(apps, schema_editor):
+    from core.search import get_backend, DOCUMENTI
+    get_backend(schema_editor.connection.alias, DOCUMENTI).drop()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_documento_contenuti'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documento',
+            name='stato_testo',
+            field=models.CharField(choices=[('AT', 'In attesa'), ('ES', 'Estratto'), ('NS', 'Formato non supportato'), ('ER', 'Errore')], db_index=True, default='AT', editable=False, max_length=2),
+        ),
+        migrations.AddField(
+            model_name='documento',
+            name='testo',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(crea_indice_documenti, elimina_indice_documenti),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 20:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_documento_testo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documento',
+            name='stato_anteprima',
+            field=models.CharField(choices=[('AT', 'In attesa'), ('GE', 'Generata'), ('ND', 'Non disponibile'), ('ER', 'Errore')], db_index=True, default='AT', editable=False, max_length=2),
+        ),
+    ]
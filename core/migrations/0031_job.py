@@ -0,0 +1,40 @@
+# Generated by Django 2.2.28 on 2026-10-18 20:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_documento_stato_anteprima'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=100)),
+                ('argomenti', models.TextField(default='{}')),
+                ('priorita', models.SmallIntegerField(default=0, verbose_name='Priorità')),
+                ('stato', models.CharField(choices=[('CO', 'In coda'), ('IC', 'In corso'), ('CM', 'Completato'), ('FA', 'Fallito')], default='CO', max_length=2)),
+                ('tentativi', models.PositiveSmallIntegerField(default=0)),
+                ('max_tentativi', models.PositiveSmallIntegerField(default=3)),
+                ('eseguire_dopo', models.DateTimeField(default=django.utils.timezone.now)),
+                ('creato_at', models.DateTimeField(auto_now_add=True)),
+                ('iniziato_at', models.DateTimeField(blank=True, null=True)),
+                ('completato_at', models.DateTimeField(blank=True, null=True)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('errore', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Job',
+                'ordering': ['-creato_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['stato', 'priorita', 'eseguire_dopo'], name='core_job_coda'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 2.2.28 on 2026-10-18 20:43
+
+from django.db import migrations, models
+
+# Indici parziali: il solo stato del modello non li descrive perché su MySQL
+# e Oracle non esistono (Django 2.2 emetterebbe comunque il WHERE).
+INDICI_PARZIALI = [
+    # prestito corrente del libro e Exists(in_prestito) del catalogo
+    ('prestito', models.Index(fields=['libro', 'data_richiesta'], name='core_prestito_attivi',
+                              condition=~models.Q(stato='CN'))),
+    # catalogo: solo i libri disponibili, nell'ordine della paginazione
+    ('libro', models.Index(fields=['titolo', 'id'], name='core_libro_disponibili',
+                           condition=models.Q(disponibile=True))),
+]
+
+
+def crea_indici_parziali(apps, schema_editor):
+    if not schema_editor.connection.features.supports_partial_indexes:
+        return
+    for modello, indice in INDICI_PARZIALI:
+        schema_editor.add_index(apps.get_model('core', modello), indice)
+
+
+def elimina_indici_parziali(apps, schema_editor):
+    if not schema_editor.connection.features.supports_partial_indexes:
+        return
+    for modello, indice in INDICI_PARZIALI:
+        schema_editor.remove_index(apps.get_model('core', modello), indice)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0031_job'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='documento',
+            index=models.Index(fields=['is_amministrazione', 'nome', 'id'], name='core_documento_visibili'),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['titolo', 'id'], name='core_libro_titolo'),
+        ),
+        migrations.AddIndex(
+            model_name='prestito',
+            index=models.Index(fields=['stato', 'data_richiesta', 'id'], name='core_prestito_stato'),
+        ),
+        migrations.AddIndex(
+            model_name='prestito',
+            index=models.Index(fields=['libro', 'data_richiesta'], name='core_prestito_libro'),
+        ),
+        migrations.AddIndex(
+            model_name='prestito',
+            index=models.Index(fields=['data_scadenza'], name='core_prestito_data_scadenza'),
+        ),
+        migrations.RunPython(crea_indici_parziali, elimina_indici_parziali),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 22:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_indici_prestiti_catalogo'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='documento',
+            name='is_amministrazione',
+            field=models.BooleanField(default=False, help_text='Documento visibile solo agli amministratori', verbose_name='Amministrazione'),
+        ),
+    ]
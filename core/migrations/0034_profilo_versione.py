@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 23:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0033_documento_is_amministrazione'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profilo',
+            name='versione',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
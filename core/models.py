@@ -1,13 +1,17 @@
+import os
 from datetime import timedelta, date
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
 from django.urls import reverse
+from django.utils import timezone
 from django.conf import settings
 from django.core.validators import MaxValueValidator
 from django.core.exceptions import ValidationError
+from .counts import invalida_conteggi, incrementa_versione
+from .storage import StorageContenuti
 from .settings import (GIORNI_PRESTITO, MAX_LIBRI_INPRESTITO, GIORNI_SOSPENSIONE,
-                      MAXKB_DOCUMENTO)
+                      MAXKB_DOCUMENTO, JOB_TENTATIVI)
 
 
 def valida_documento(documento):
@@ -37,14 +41,57 @@ class TrackProfilo(models.Model):
         else:
             return None
 
-
-class Profilo(TrackProfilo):
+    # Contatori aggiornati con un solo UPDATE condizionale: il numero di righe
+    # modificate dice se l'operazione è consentita, senza bloccare il profilo.
+    def _aggiorna_se(self, condizione, **valori):
+        return bool(type(self)._default_manager.filter(condizione, pk=self.pk).update(**valori))
+
+    def registra_richiesta(self):
+        non_sospeso = (models.Q(data_fine_sospensione__isnull=True) |
+                       models.Q(data_fine_sospensione__lte=date.today()))
+        return self._aggiorna_se(models.Q(tot_richieste__lt=MAX_LIBRI_INPRESTITO) & non_sospeso,
+                                 tot_richieste=models.F('tot_richieste') + 1)
+
+    def annulla_richiesta(self):
+        return self._aggiorna_se(models.Q(tot_richieste__gt=0),
+                                 tot_richieste=models.F('tot_richieste') - 1)
+
+    def registra_consegna(self):
+        return self._aggiorna_se(models.Q(tot_libri__lt=MAX_LIBRI_INPRESTITO, tot_richieste__gt=0),
+                                 tot_libri=models.F('tot_libri') + 1,
+                                 tot_richieste=models.F('tot_richieste') - 1)
+
+    def registra_restituzione(self):
+        return self._aggiorna_se(models.Q(tot_libri__gt=0),
+                                 tot_libri=models.F('tot_libri') - 1)
+
+
+class VersioneMixin:
+    ''' save() di un oggetto già salvato incrementa `versione` nello stesso
+    UPDATE; il nuovo valore viene riletto solo se serve.
+    '''
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+        self.versione = models.F('versione') + 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'versione'}
+        try:
+            super().save(*args, **kwargs)
+        finally:
+            del self.versione
+
+
+class Profilo(VersioneMixin, TrackProfilo):
     nome = models.CharField(max_length=50)
     cognome = models.CharField(max_length=50)
     codfisc = models.CharField(max_length=16, verbose_name=_('Codice fiscale'))
     data_nascita = models.DateField(verbose_name=_('Data di nascita'))
     telefono = models.CharField(max_length=20)
     email = models.EmailField()
+    # chiave delle righe in cache dei prestiti che mostrano il profilo
+    versione = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         verbose_name_plural = 'Profili'
@@ -79,7 +126,25 @@ class Segnalazione(models.Model):
         return self.tipo
 
 
-class Libro(models.Model):
+class VersioneQuerySet(models.QuerySet):
+
+    def incrementa_versione(self, **campi):
+        ''' update() che cambia anche la chiave dei frammenti in cache delle
+        righe coinvolte: da usare al posto di update() per i campi mostrati.
+        '''
+        return self.update(versione=models.F('versione') + 1, updated_at=timezone.now(), **campi)
+
+
+class LibroQuerySet(VersioneQuerySet):
+
+    def with_current_prestito(self):
+        ''' Carica prestito corrente e relativo profilo nella stessa query,
+        letti da get_current_prestito().
+        '''
+        return self.select_related('prestito_corrente__profilo')
+
+
+class Libro(VersioneMixin, models.Model):
     isbn = models.CharField(max_length=13, unique=True, verbose_name='ISBN')
     titolo = models.CharField(max_length=100)
     autori = models.ManyToManyField('Autore')
@@ -88,10 +153,24 @@ class Libro(models.Model):
     genere = models.ForeignKey('Genere', on_delete=models.PROTECT)
     sottogeneri = models.ManyToManyField('SottoGenere', blank=True)
     collana = models.ForeignKey('Collana', on_delete=models.SET_NULL, null=True, blank=True)
+    # stato denormalizzato, aggiornato dalle transizioni di prestito
+    disponibile = models.BooleanField(default=True, db_index=True, editable=False)
+    prestito_corrente = models.ForeignKey('Prestito', on_delete=models.SET_NULL,
+                                          null=True, blank=True, editable=False,
+                                          related_name='+')
+    # incrementata a ogni modifica del libro o dei dati mostrati nelle sue righe
+    versione = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = LibroQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = 'Libri'
         ordering = ['titolo']
+        indexes = [
+            # ordinamento e paginazione a cursore (titolo, pk)
+            models.Index(fields=['titolo', 'id'], name='core_libro_titolo'),
+        ]
         permissions = (
             ('view_dettaglio_libro', 'Accesso al dettaglio di un libro'),
             ('gestisci_prestito', 'Gestione richieste e prestiti'),
@@ -118,22 +197,61 @@ class Libro(models.Model):
         return self.prestito_set.all().exists()
 
     def is_disponibile(self):
-        if not self.has_prestiti():
-            return True
-        for p in self.prestito_set.all():
-            if not p.stato == p.CONCLUSO:
-                return False
-        return True
+        return self.disponibile
 
     def get_current_prestito(self):
-        if self.has_prestiti():
-            ultimo = self.prestito_set.all().latest()
-            if not ultimo.is_concluso():
-                return ultimo
-        return None
+        if self.prestito_corrente_id is None:
+            return None
+        return self.prestito_corrente
+
+    def set_prestito_corrente(self, prestito):
+        ''' Aggiorna lo stato di disponibilità con un singolo UPDATE.
+        Va chiamato all'interno della transazione che modifica il prestito.
+        '''
+        disponibile = prestito is None
+        campi = {'prestito_corrente': prestito,
+                 'versione': models.F('versione') + 1,
+                 'updated_at': timezone.now()}
+        cambiati = (Libro.objects.filter(pk=self.pk).exclude(disponibile=disponibile)
+                    .update(disponibile=disponibile, **campi))
+        if cambiati:
+            StatisticheBiblioteca.aggiorna(libri_disponibili=1 if disponibile else -1)
+            invalida_conteggi(Libro)
+        else:
+            Libro.objects.filter(pk=self.pk).update(**campi)
+        self.disponibile = disponibile
+        self.prestito_corrente = prestito
+
+    def prenota(self):
+        ''' Rende il libro non disponibile con un UPDATE condizionale;
+        False se era già in prestito.
+        '''
+        if not Libro.objects.filter(pk=self.pk, disponibile=True).incrementa_versione(disponibile=False):
+            return False
+        StatisticheBiblioteca.aggiorna(libri_disponibili=-1)
+        invalida_conteggi(Libro)
+        self.disponibile = False
+        return True
 
+    def calc_prestito_corrente(self):
+        return self.prestito_set.exclude(stato=Prestito.CONCLUSO).order_by('-data_richiesta').first()
 
-class Prestito(models.Model):
+    def aggiorna_disponibilita(self):
+        self.set_prestito_corrente(self.calc_prestito_corrente())
+
+    def riallinea_disponibilita(self):
+        ''' Come aggiorna_disponibilita(), ma scrive solo se lo stato salvato
+        non corrisponde ai prestiti; True se il libro è stato corretto.
+        '''
+        corrente = self.calc_prestito_corrente()
+        if (self.disponibile == (corrente is None)
+                and self.prestito_corrente_id == getattr(corrente, 'pk', None)):
+            return False
+        self.set_prestito_corrente(corrente)
+        return True
+
+
+class Prestito(VersioneMixin, models.Model):
     RICHIESTO = 'RC'
     INCORSO = 'IC'
     CONCLUSO = 'CN'
@@ -148,6 +266,10 @@ class Prestito(models.Model):
     data_scadenza = models.DateField(blank=True, null=True)
     profilo = models.ForeignKey(Profilo, on_delete=models.CASCADE)
     libro = models.ForeignKey(Libro, on_delete=models.CASCADE)
+    versione = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = VersioneQuerySet.as_manager()
 
     def __str__(self):
         return '{}-{}'.format(self.libro, self.profilo)
@@ -174,24 +296,161 @@ class Prestito(models.Model):
         else:
             return None
 
+    def _cambia_stato(self, da, **campi):
+        ''' UPDATE condizionato allo stato atteso; False se nel frattempo è cambiato. '''
+        if not Prestito.objects.filter(pk=self.pk, stato=da).incrementa_versione(**campi):
+            return False
+        for campo, valore in campi.items():
+            setattr(self, campo, valore)
+        invalida_conteggi(Prestito)
+        return True
+
+    def registra_consegna(self):
+        oggi = date.today()
+        return self._cambia_stato(self.RICHIESTO, stato=self.INCORSO, data_inizio=oggi,
+                                  data_scadenza=oggi + timedelta(days=GIORNI_PRESTITO))
+
+    def registra_restituzione(self):
+        return self._cambia_stato(self.INCORSO, stato=self.CONCLUSO)
+
     class Meta:
         verbose_name_plural = 'Prestiti'
         unique_together = ('profilo', 'libro')
         ordering = ('data_richiesta',)
         get_latest_by = ('data_richiesta',)
+        indexes = [
+            # prestiti scaduti: vedi circolazione.sweep_scadenze
+            models.Index(fields=['stato', 'data_scadenza'], name='core_prestito_scadenza'),
+            # conteggi per stato ed elenco filtrato per stato nell'ordinamento di default
+            models.Index(fields=['stato', 'data_richiesta', 'id'], name='core_prestito_stato'),
+            # ultimo prestito del libro (latest/get_latest_by)
+            models.Index(fields=['libro', 'data_richiesta'], name='core_prestito_libro'),
+            # filtro "scaduto" dell'elenco, senza condizione sullo stato
+            models.Index(fields=['data_scadenza'], name='core_prestito_data_scadenza'),
+        ]
+        # indici parziali sui prestiti attivi: vedi la migrazione 0032
+
+
+class StatisticheBiblioteca(models.Model):
+    ''' Contatori della dashboard, mantenuti con incrementi F() dalle
+    transizioni dei prestiti e riallineati dal comando riconcilia_statistiche.
+    Esiste una sola riga, con pk=1.
+    '''
+    prestiti_incorso = models.IntegerField(default=0)
+    prestiti_richiesti = models.IntegerField(default=0)
+    libri_disponibili = models.IntegerField(default=0)
+    libri_totali = models.IntegerField(default=0)
+    data_riconciliazione = models.DateTimeField(null=True, blank=True)
+
+    CAMPI_STATO = {
+        Prestito.RICHIESTO: 'prestiti_richiesti',
+        Prestito.INCORSO: 'prestiti_incorso',
+    }
+    # cambia a ogni aggiornamento: invalida i frammenti che mostrano i contatori
+    CHIAVE_VERSIONE = 'core:statistiche:versione'
+
+    class Meta:
+        verbose_name = 'Statistiche biblioteca'
+        verbose_name_plural = 'Statistiche biblioteca'
+
+    def __str__(self):
+        return 'Statistiche biblioteca'
+
+    @classmethod
+    def get(cls):
+        try:
+            return cls.objects.get(pk=1)
+        except cls.DoesNotExist:
+            return cls.ricalcola()[0]
+
+    @classmethod
+    def calcola(cls):
+        return {
+            'prestiti_incorso': Prestito.objects.filter(stato=Prestito.INCORSO).count(),
+            'prestiti_richiesti': Prestito.objects.filter(stato=Prestito.RICHIESTO).count(),
+            'libri_disponibili': Libro.objects.filter(disponibile=True).count(),
+            'libri_totali': Libro.objects.count(),
+        }
+
+    @classmethod
+    def ricalcola(cls):
+        ''' Ricalcola da zero; restituisce la riga e lo scostamento per campo. '''
+        reali = cls.calcola()
+        with transaction.atomic():
+            statistiche, _ = cls.objects.select_for_update().get_or_create(pk=1)
+            scostamento = {campo: getattr(statistiche, campo) - valore for campo, valore in reali.items()}
+            for campo, valore in reali.items():
+                setattr(statistiche, campo, valore)
+            statistiche.data_riconciliazione = timezone.now()
+            statistiche.save()
+        incrementa_versione(cls.CHIAVE_VERSIONE)
+        return statistiche, scostamento
+
+    @classmethod
+    def aggiorna(cls, **delta):
+        ''' Da chiamare dopo aver scritto la modifica, nella stessa transazione. '''
+        delta = {campo: valore for campo, valore in delta.items() if valore}
+        if not delta:
+            return
+        if cls.objects.filter(pk=1).update(
+                **{campo: models.F(campo) + valore for campo, valore in delta.items()}):
+            incrementa_versione(cls.CHIAVE_VERSIONE)
+        else:
+            cls.ricalcola()
+
+    @classmethod
+    def sposta_prestito(cls, da=None, a=None):
+        delta = {}
+        if da in cls.CAMPI_STATO:
+            delta[cls.CAMPI_STATO[da]] = -1
+        if a in cls.CAMPI_STATO:
+            delta[cls.CAMPI_STATO[a]] = delta.get(cls.CAMPI_STATO[a], 0) + 1
+        cls.aggiorna(**delta)
 
 
 class Documento(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     nome = models.CharField(max_length=100)
     descrizione = models.TextField(blank=True)
+    # file condiviso tra i documenti con lo stesso contenuto
     file = models.FileField(upload_to='documenti/%Y/%m/',
+                            storage=StorageContenuti(),
+                            db_index=True,
                             validators=[valida_documento],
                             help_text="Dimensione massima: {} Kb".format(MAXKB_DOCUMENTO))
     data_upload = models.DateTimeField(auto_now_add=True)
     is_amministrazione = models.BooleanField(default=False,
                                              verbose_name="Amministrazione",
                                              help_text="Documento visibile solo agli amministratori")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # testo estratto dal file in background per la ricerca, vedi core.estrazione
+    TESTO_IN_ATTESA = 'AT'
+    TESTO_ESTRATTO = 'ES'
+    TESTO_NON_SUPPORTATO = 'NS'
+    TESTO_ERRORE = 'ER'
+    STATI_TESTO = (
+        (TESTO_IN_ATTESA, 'In attesa'),
+        (TESTO_ESTRATTO, 'Estratto'),
+        (TESTO_NON_SUPPORTATO, 'Formato non supportato'),
+        (TESTO_ERRORE, 'Errore'),
+    )
+    testo = models.TextField(blank=True, editable=False)
+    stato_testo = models.CharField(max_length=2, choices=STATI_TESTO, default=TESTO_IN_ATTESA,
+                                   editable=False, db_index=True)
+    # anteprima della prima pagina e miniatura, vedi core.anteprime
+    ANTEPRIMA_IN_ATTESA = 'AT'
+    ANTEPRIMA_GENERATA = 'GE'
+    ANTEPRIMA_NON_DISPONIBILE = 'ND'
+    ANTEPRIMA_ERRORE = 'ER'
+    STATI_ANTEPRIMA = (
+        (ANTEPRIMA_IN_ATTESA, 'In attesa'),
+        (ANTEPRIMA_GENERATA, 'Generata'),
+        (ANTEPRIMA_NON_DISPONIBILE, 'Non disponibile'),
+        (ANTEPRIMA_ERRORE, 'Errore'),
+    )
+    FORMATI_ANTEPRIMA = ('anteprima', 'miniatura')
+    stato_anteprima = models.CharField(max_length=2, choices=STATI_ANTEPRIMA, default=ANTEPRIMA_IN_ATTESA,
+                                       editable=False, db_index=True)
 
     class Meta:
         verbose_name_plural = 'Documenti'
@@ -199,10 +458,72 @@ class Documento(models.Model):
             ('view_dettaglio_documento', 'Accesso al dettaglio del documento'),
         )
         ordering = ['nome']
+        indexes = [
+            # elenco per i non staff: is_amministrazione=False ordinato per nome
+            models.Index(fields=['is_amministrazione', 'nome', 'id'], name='core_documento_visibili'),
+        ]
 
     def __str__(self):
         return '"{}" - {}'.format(self.nome, self.data_upload.date())
 
+    def get_anteprima_url(self, formato):
+        if self.stato_anteprima != self.ANTEPRIMA_GENERATA:
+            return None
+        # il nome del file cambia con il contenuto: l'URL può restare in cache
+        return '{}?v={}'.format(reverse('anteprima_documento', kwargs={'pk': self.pk, 'formato': formato}),
+                                os.path.basename(self.file.name))
+
+    @property
+    def url_anteprima(self):
+        return self.get_anteprima_url('anteprima')
+
+    @property
+    def url_miniatura(self):
+        return self.get_anteprima_url('miniatura')
+
+    @classmethod
+    def riferimenti_file(cls, nome):
+        ''' Documenti che puntano al file: a zero il file può essere eliminato. '''
+        return cls.objects.filter(file=nome).count()
+
+
+class Job(models.Model):
+    ''' Lavoro da eseguire fuori dalla richiesta, vedi core.jobs. '''
+    IN_CODA = 'CO'
+    IN_CORSO = 'IC'
+    COMPLETATO = 'CM'
+    FALLITO = 'FA'
+    STATI_JOB = (
+        (IN_CODA, 'In coda'),
+        (IN_CORSO, 'In corso'),
+        (COMPLETATO, 'Completato'),
+        (FALLITO, 'Fallito'),
+    )
+    nome = models.CharField(max_length=100)
+    # JSON: {"args": [...], "kwargs": {...}}
+    argomenti = models.TextField(default='{}')
+    priorita = models.SmallIntegerField(default=0, verbose_name='Priorità')
+    stato = models.CharField(max_length=2, choices=STATI_JOB, default=IN_CODA)
+    tentativi = models.PositiveSmallIntegerField(default=0)
+    max_tentativi = models.PositiveSmallIntegerField(default=JOB_TENTATIVI)
+    eseguire_dopo = models.DateTimeField(default=timezone.now)
+    creato_at = models.DateTimeField(auto_now_add=True)
+    iniziato_at = models.DateTimeField(null=True, blank=True)
+    completato_at = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    errore = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name_plural = 'Job'
+        ordering = ['-creato_at']
+        indexes = [
+            # prelievo: stato in coda, priorità più alta, più vecchio
+            models.Index(fields=['stato', 'priorita', 'eseguire_dopo'], name='core_job_coda'),
+        ]
+
+    def __str__(self):
+        return '{} #{}'.format(self.nome, self.pk)
+
 
 class Bookmark(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -218,8 +539,23 @@ class Bookmark(models.Model):
     def __str__(self):
         return self.nome
 
+    # liste che hanno una vista di esportazione della ricerca
+    ESPORTAZIONI = {
+        'elenco_libri': 'esporta_libri',
+        'elenco_prestiti': 'esporta_prestiti',
+        'elenco_documenti': 'esporta_documenti',
+    }
+
+    def _con_parametri(self, url):
+        return "{}?{}".format(url, self.urlparams) if self.urlparams else url
+
     def get_bookmark_url(self):
-        return "{}?{}".format(reverse(self.urlname, args=self.args, kwargs=self.kwargs), self.urlparams)
+        return self._con_parametri(reverse(self.urlname, args=self.args, kwargs=self.kwargs))
+
+    def get_esporta_url(self):
+        if self.urlname not in self.ESPORTAZIONI:
+            return None
+        return self._con_parametri(reverse(self.ESPORTAZIONI[self.urlname]))
 
 
 class Genere(models.Model):
@@ -281,3 +617,8 @@ class Autore(models.Model):
 
     def nome_cognome(self):
         return '{} {}'.format(self.nome, self.cognome)
+
+
+def prefetch_autori(lookup='autori'):
+    ''' Prefetch degli autori ordinati, letto da Libro.get_autori_display(). '''
+    return models.Prefetch(lookup, queryset=Autore.objects.order_by('nome', 'cognome'))
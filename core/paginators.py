@@ -0,0 +1,131 @@
+import base64
+import json
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
+
+__all__ = ['InvalidCursor', 'KeysetPage', 'KeysetPaginator']
+
+SUCCESSIVA = 'n'
+PRECEDENTE = 'p'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    ''' Una pagina di risultati: espone i cursori per spostarsi avanti e
+    indietro invece del numero di pagina.
+    '''
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_url = None
+        self.previous_url = None
+
+    def __repr__(self):
+        return '<KeysetPage ({} elementi)>'.format(len(self.object_list))
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[-1], SUCCESSIVA)
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[0], PRECEDENTE)
+        return None
+
+
+class KeysetPaginator:
+    ''' Paginazione a cursore sull'ordinamento del queryset (o del modello)
+    più la pk: ogni pagina è un range sull'indice invece di un OFFSET, quindi
+    il costo non cresce con la profondità della pagina.
+    '''
+    def __init__(self, queryset, per_page, ordering=None):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        opts = queryset.model._meta
+        if ordering is None:
+            ordering = queryset.query.order_by or opts.ordering
+        ordering = [o for o in ordering if o.lstrip('-') not in ('pk', opts.pk.name)]
+        self.ordering = ordering + ['pk']
+        self.fields = []
+        for name in self.ordering:
+            if name.lstrip('-') in queryset.query.annotations:
+                # es. il rank della ricerca full-text: valore letto dall'istanza
+                self.fields.append((name.lstrip('-'), name.startswith('-'), None))
+                continue
+            field = opts.pk if name == 'pk' else opts.get_field(name.lstrip('-'))
+            if field.is_relation:
+                raise ImproperlyConfigured(
+                    "KeysetPaginator non supporta l'ordinamento per relazioni ({})".format(name))
+            self.fields.append((name.lstrip('-'), name.startswith('-'), field))
+
+    def encode_cursor(self, obj, direction):
+        values = [getattr(obj, field.attname if field else name) for name, _, field in self.fields]
+        payload = json.dumps([direction, values], default=_isoformat, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            if direction not in (SUCCESSIVA, PRECEDENTE) or len(values) != len(self.fields):
+                raise ValueError(cursor)
+            return direction, [field.to_python(v) if field else v
+                               for (_, _, field), v in zip(self.fields, values)]
+        except Exception as err:
+            raise InvalidCursor('Cursore non valido: {}'.format(cursor)) from err
+
+    def keyset_filter(self, values, reverse=False):
+        ''' (a, b, pk) > (va, vb, vpk) espanso in OR di uguaglianze sui prefissi. '''
+        q = Q()
+        for i, (name, desc, _) in enumerate(self.fields):
+            lookup = 'gt' if desc == reverse else 'lt'
+            cond = Q(**{'{}__{}'.format(name, lookup): values[i]})
+            for (prev_name, _, _), value in zip(self.fields[:i], values):
+                cond &= Q(**{prev_name: value})
+            q |= cond
+        return q
+
+    def get_page(self, cursor=None):
+        qs = self.queryset.order_by(*self.ordering)
+        direction, values = SUCCESSIVA, None
+        if cursor:
+            direction, values = self.decode_cursor(cursor)
+            qs = qs.filter(self.keyset_filter(values, reverse=direction == PRECEDENTE))
+        if direction == PRECEDENTE:
+            qs = qs.reverse()
+        rows = list(qs[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == PRECEDENTE:
+            rows.reverse()
+            return KeysetPage(rows, self, has_next=True, has_previous=has_more)
+        return KeysetPage(rows, self, has_next=has_more, has_previous=values is not None)
+
+
+def _isoformat(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
@@ -0,0 +1,103 @@
+''' Piani di esecuzione delle query più frequenti, per verificare che usino
+gli indici previsti (comando spiega_query, report in docs/piani_query.md).
+
+Ogni query è eseguita così come la eseguono le viste; il piano è chiesto
+al database per l'SQL effettivamente inviato.
+'''
+from collections import namedtuple
+from datetime import date
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.test.utils import CaptureQueriesContext
+from .models import Documento, Libro, Prestito
+from .paginators import KeysetPaginator
+from .settings import ELEMENTI_PER_PAGINA
+
+__all__ = ['QUERY_CALDE', 'Piano', 'spiega', 'spiega_sql']
+
+QueryCalda = namedtuple('QueryCalda', 'nome descrizione indici esegui')
+Piano = namedtuple('Piano', 'query sql righe indice')
+
+
+def _pagina(queryset):
+    return list(KeysetPaginator(queryset, ELEMENTI_PER_PAGINA).get_page())
+
+
+def _ultimo_prestito():
+    try:
+        Prestito.objects.filter(libro_id=1).latest()
+    except ObjectDoesNotExist:
+        pass
+
+
+# indici: quelli accettabili, nell'ordine di preferenza (il parziale manca
+# dove il database non lo supporta)
+QUERY_CALDE = [
+    QueryCalda('dashboard_incorso', 'Dashboard: conteggio dei prestiti in corso',
+               ('core_prestito_stato', 'core_prestito_scadenza'),
+               lambda: Prestito.objects.filter(stato=Prestito.INCORSO).count()),
+    QueryCalda('dashboard_richiesti', 'Dashboard: conteggio dei prestiti richiesti',
+               ('core_prestito_stato', 'core_prestito_scadenza'),
+               lambda: Prestito.objects.filter(stato=Prestito.RICHIESTO).count()),
+    QueryCalda('elenco_prestiti_stato', 'Elenco prestiti filtrato per stato',
+               ('core_prestito_stato',),
+               lambda: _pagina(Prestito.objects.filter(stato=Prestito.RICHIESTO))),
+    QueryCalda('prestito_corrente', 'Prestito corrente del libro (Libro.calc_prestito_corrente)',
+               ('core_prestito_attivi', 'core_prestito_libro'),
+               lambda: Libro(pk=1).calc_prestito_corrente()),
+    QueryCalda('ultimo_prestito', 'Ultimo prestito del libro (latest)',
+               ('core_prestito_libro',),
+               _ultimo_prestito),
+    QueryCalda('prestiti_scaduti', 'Elenco prestiti con il filtro "scaduto"',
+               ('core_prestito_data_scadenza',),
+               lambda: _pagina(Prestito.objects.filter(data_scadenza__lte=date.today()))),
+    QueryCalda('sweep_scadenze', 'Prestiti in corso scaduti (circolazione.sweep_scadenze)',
+               ('core_prestito_scadenza',),
+               lambda: list(Prestito.objects.filter(stato=Prestito.INCORSO, data_scadenza__lte=date.today())
+                            .order_by('profilo_id', 'data_scadenza')
+                            .values_list('profilo_id', 'libro__titolo', 'data_scadenza'))),
+    QueryCalda('catalogo', 'Catalogo: libri disponibili per titolo',
+               ('core_libro_disponibili', 'core_libro_titolo'),
+               lambda: _pagina(Libro.objects.filter(disponibile=True))),
+    QueryCalda('elenco_libri', 'Elenco libri per titolo',
+               ('core_libro_titolo',),
+               lambda: _pagina(Libro.objects.all())),
+    QueryCalda('elenco_documenti', 'Elenco documenti visibili ai non staff',
+               ('core_documento_visibili',),
+               lambda: _pagina(Documento.objects.filter(is_amministrazione=False))),
+]
+
+
+def spiega_sql(sql, using=DEFAULT_DB_ALIAS):
+    ''' Righe del piano di un SQL già completo di parametri. '''
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        cursor.execute('{} {}'.format(connection.ops.explain_query_prefix(), sql))
+        righe = cursor.fetchall()
+    if connection.vendor == 'sqlite':
+        # (id, padre, -, dettaglio): indentazione secondo l'albero del piano
+        livelli = {0: -1}
+        piano = []
+        for id_nodo, padre, _, dettaglio in righe:
+            livelli[id_nodo] = livelli.get(padre, -1) + 1
+            piano.append('  ' * livelli[id_nodo] + dettaglio)
+        return piano
+    return [' '.join(str(colonna) for colonna in riga) for riga in righe]
+
+
+def spiega(using=DEFAULT_DB_ALIAS, query=QUERY_CALDE):
+    ''' Esegue ogni query calda e restituisce il Piano della sua query
+    principale, con il primo degli indici attesi che vi compare (o None).
+    '''
+    connection = connections[using]
+    piani = []
+    for query_calda in query:
+        with CaptureQueriesContext(connection) as catturate:
+            query_calda.esegui()
+        # la paginazione a cursore può aggiungere query accessorie: vale la prima
+        sql = catturate.captured_queries[0]['sql']
+        righe = spiega_sql(sql, using)
+        testo = '\n'.join(righe)
+        indice = next((nome for nome in query_calda.indici if nome in testo), None)
+        piani.append(Piano(query_calda, sql, righe, indice))
+    return piani
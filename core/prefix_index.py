@@ -0,0 +1,144 @@
+import bisect
+import logging
+import threading
+import time
+import unicodedata
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from .models import Autore, Editore, Collana, Genere
+from .settings import INDICE_AUTOCOMPLETE_CACHE
+
+__all__ = ['fold', 'PrefixIndex', 'get_indice', 'invalida_indice', 'indice_condiviso']
+
+logger = logging.getLogger(__name__)
+
+
+def _cache():
+    return caches[INDICE_AUTOCOMPLETE_CACHE]
+
+
+def indice_condiviso():
+    ''' False se il contatore di generazione resta nella memoria di ogni
+    processo: gli indici degli altri processi non vedrebbero le modifiche.
+    '''
+    return not isinstance(_cache(), (LocMemCache, DummyCache))
+
+
+def fold(value):
+    ''' Normalizza per il confronto: minuscolo e senza accenti. '''
+    value = unicodedata.normalize('NFKD', value or '')
+    return ''.join(c for c in value if not unicodedata.combining(c)).casefold()
+
+
+class Risultati:
+    ''' Sequenza dei risultati: le istanze del modello vengono create solo per
+    la porzione richiesta (la pagina dell'autocomplete).
+    '''
+    def __init__(self, indice, righe, posizioni):
+        self.indice = indice
+        self.righe = righe
+        self.posizioni = posizioni
+
+    def __len__(self):
+        return len(self.posizioni)
+
+    def __iter__(self):
+        return (self.indice.istanza(self.righe[p]) for p in self.posizioni)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self.indice.istanza(self.righe[p]) for p in self.posizioni[key]]
+        return self.indice.istanza(self.righe[self.posizioni[key]])
+
+    def count(self):
+        return len(self)
+
+
+class PrefixIndex:
+    ''' Indice in memoria delle chiavi ricercabili, ordinato per la ricerca
+    per prefisso con bisect. Le righe sono nell'ordinamento del modello.
+    Viene ricostruito quando il contatore di generazione in cache cambia.
+    '''
+    def __init__(self, model, campi_ricerca, campi=None):
+        self.model = model
+        self.campi_ricerca = tuple(campi_ricerca)
+        self.campi = tuple(campi or campi_ricerca)
+        self.generazione = None
+        self.durata_build = None
+        self._dati = ((), (), ())
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<PrefixIndex {}>'.format(self.model._meta.label)
+
+    @property
+    def cache_key(self):
+        return 'core:indice_prefissi:{}'.format(self.model._meta.label_lower)
+
+    def build(self):
+        inizio = time.perf_counter()
+        righe = list(self.model.objects.values_list('pk', *self.campi))
+        colonne = [1 + self.campi.index(campo) for campo in self.campi_ricerca]
+        voci = sorted((fold(riga[c]), pos) for pos, riga in enumerate(righe) for c in colonne)
+        self._dati = (righe, [v[0] for v in voci], [v[1] for v in voci])
+        self.durata_build = time.perf_counter() - inizio
+        logger.info('Indice prefissi %s: %d righe, %d chiavi in %.1f ms',
+                    self.model._meta.label, len(righe), len(voci), self.durata_build * 1000)
+        return self.durata_build
+
+    def aggiorna(self):
+        generazione = _cache().get(self.cache_key, 0)
+        if generazione != self.generazione:
+            with self._lock:
+                if generazione != self.generazione:
+                    self.build()
+                    self.generazione = generazione
+
+    def invalida(self):
+        cache = _cache()
+        if not cache.add(self.cache_key, 1, None):
+            try:
+                cache.incr(self.cache_key)
+            except ValueError:
+                cache.set(self.cache_key, 1, None)
+        self.generazione = None
+
+    def istanza(self, riga):
+        obj = self.model(**dict(zip(('pk',) + self.campi, riga)))
+        obj._state.adding = False
+        return obj
+
+    def search(self, q=None, **filtri):
+        self.aggiorna()
+        righe, chiavi, posizioni = self._dati
+        if q:
+            prefisso = fold(q)
+            i = bisect.bisect_left(chiavi, prefisso)
+            trovate = set()
+            while i < len(chiavi) and chiavi[i].startswith(prefisso):
+                trovate.add(posizioni[i])
+                i += 1
+            risultato = sorted(trovate)
+        else:
+            risultato = list(range(len(righe)))
+        for campo, valore in filtri.items():
+            c = 1 + self.campi.index(campo)
+            risultato = [p for p in risultato if str(righe[p][c]) == str(valore)]
+        return Risultati(self, righe, risultato)
+
+
+INDICI = {
+    Autore: PrefixIndex(Autore, ('nome', 'cognome')),
+    Editore: PrefixIndex(Editore, ('nome',)),
+    Collana: PrefixIndex(Collana, ('nome',), campi=('nome', 'editore_id')),
+    Genere: PrefixIndex(Genere, ('nome',)),
+}
+
+
+def get_indice(model):
+    return INDICI[model]
+
+
+def invalida_indice(model):
+    INDICI[model].invalida()
@@ -0,0 +1,103 @@
+''' Anteprime dei documenti, generate nei processi del pool di core.anteprime:
+solo programmi e librerie locali, nessuna rete e nessun accesso a Django.
+Le dipendenze sono facoltative: Pillow per le immagini, pypdfium2 oppure il
+programma pdftoppm (poppler-utils) per i PDF.
+'''
+import os
+import shutil
+import subprocess
+import tempfile
+
+__all__ = ['GENERATA', 'NON_DISPONIBILE', 'ERRORE', 'genera_anteprime']
+
+GENERATA = 'generata'
+NON_DISPONIBILE = 'non_disponibile'
+ERRORE = 'errore'
+
+ESTENSIONI_IMMAGINE = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tif', '.tiff', '.webp')
+TIMEOUT_PDFTOPPM = 60
+
+
+class _NonDisponibile(Exception):
+    pass
+
+
+def _ridimensiona(immagine, lato, destinazione):
+    immagine = immagine.copy()
+    immagine.thumbnail((lato, lato))
+    if immagine.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        immagine = immagine.convert('RGBA')
+    immagine.save(destinazione, 'PNG', optimize=True)
+
+
+def _prima_pagina(percorso, lato, destinazione):
+    try:
+        import pypdfium2
+        import PIL  # per to_pil()
+    except ImportError:
+        pypdfium2 = None
+    if pypdfium2 is not None:
+        pdf = pypdfium2.PdfDocument(percorso)
+        try:
+            pagina = pdf[0]
+            scala = lato / max(pagina.get_size())
+            pagina.render(scale=scala).to_pil().save(destinazione, 'PNG', optimize=True)
+        finally:
+            pdf.close()
+        return
+    pdftoppm = shutil.which('pdftoppm')
+    if pdftoppm is None:
+        raise _NonDisponibile()
+    # pdftoppm aggiunge da sé l'estensione .png al prefisso
+    subprocess.run([pdftoppm, '-png', '-f', '1', '-l', '1', '-singlefile', '-scale-to', str(lato),
+                    percorso, destinazione[:-len('.png')]],
+                   check=True, timeout=TIMEOUT_PDFTOPPM,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _genera(percorso, anteprima, lato_anteprima, miniatura, lato_miniatura):
+    estensione = os.path.splitext(percorso)[1].lower()
+    if estensione == '.pdf':
+        _prima_pagina(percorso, lato_anteprima, anteprima)
+        sorgente = anteprima
+    elif estensione in ESTENSIONI_IMMAGINE:
+        sorgente = percorso
+    else:
+        raise _NonDisponibile()
+    try:
+        from PIL import Image
+    except ImportError:
+        if estensione != '.pdf':
+            raise _NonDisponibile()
+        _prima_pagina(percorso, lato_miniatura, miniatura)
+        return
+    with Image.open(sorgente) as immagine:
+        if sorgente != anteprima:
+            _ridimensiona(immagine, lato_anteprima, anteprima)
+        _ridimensiona(immagine, lato_miniatura, miniatura)
+
+
+def genera_anteprime(percorso, anteprima, lato_anteprima, miniatura, lato_miniatura):
+    ''' Scrive anteprima e miniatura PNG della prima pagina o dell'immagine.
+    Le scrive in file temporanei e le rinomina solo se riuscite entrambe.
+    Restituisce GENERATA, NON_DISPONIBILE o ERRORE.
+    '''
+    cartella = os.path.dirname(anteprima)
+    temporanei = []
+    try:
+        for _ in range(2):
+            descrittore, temporaneo = tempfile.mkstemp(suffix='.png', dir=cartella)
+            os.close(descrittore)
+            temporanei.append(temporaneo)
+        _genera(percorso, temporanei[0], lato_anteprima, temporanei[1], lato_miniatura)
+        os.replace(temporanei[0], anteprima)
+        os.replace(temporanei[1], miniatura)
+    except _NonDisponibile:
+        return NON_DISPONIBILE
+    except Exception:
+        return ERRORE
+    finally:
+        for temporaneo in temporanei:
+            if os.path.exists(temporaneo):
+                os.remove(temporaneo)
+    return GENERATA
@@ -0,0 +1,136 @@
+import hashlib
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from .esportazione import DIMENSIONE_BLOCCO
+from .settings import DOWNLOAD_OFFLOAD, DOWNLOAD_ACCEL_PREFIX
+
+__all__ = ['intervallo', 'content_disposition', 'etag_file', 'risposta_file', 'risposta_storage']
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def intervallo(header, dimensione):
+    ''' Byte (inizio, fine) inclusi di un header Range a intervallo singolo.
+    None se l'header manca o non è gestito (più intervalli, sintassi non
+    valida): si risponde con il file intero. False se non soddisfacibile.
+    '''
+    corrispondenza = _RANGE.match(header.strip()) if header else None
+    if not corrispondenza or not any(corrispondenza.groups()):
+        return None
+    inizio, fine = corrispondenza.groups()
+    if not inizio:
+        # bytes=-N: gli ultimi N byte
+        if not int(fine) or not dimensione:
+            return False
+        return max(0, dimensione - int(fine)), dimensione - 1
+    inizio = int(inizio)
+    if fine and int(fine) < inizio:
+        return None
+    if inizio >= dimensione:
+        return False
+    return inizio, min(int(fine), dimensione - 1) if fine else dimensione - 1
+
+
+def _if_range_valido(request, etag, ultima_modifica):
+    ''' Senza If-Range o con un validatore ancora corrente il Range vale. '''
+    valore = request.META.get('HTTP_IF_RANGE')
+    if not valore:
+        return True
+    if valore.startswith('"'):
+        return valore == etag
+    return ultima_modifica is not None and parse_http_date_safe(valore) == ultima_modifica
+
+
+def _blocchi(file, inizio, lunghezza):
+    try:
+        file.seek(inizio)
+        while lunghezza > 0:
+            blocco = file.read(min(DIMENSIONE_BLOCCO, lunghezza))
+            if not blocco:
+                break
+            lunghezza -= len(blocco)
+            yield blocco
+    finally:
+        file.close()
+
+
+def content_disposition(nome_file, allegato=True):
+    tipo = 'attachment' if allegato else 'inline'
+    try:
+        nome_file.encode('ascii')
+        return '{}; filename="{}"'.format(tipo, nome_file.replace('\\', '\\\\').replace('"', r'\"'))
+    except UnicodeEncodeError:
+        return "{}; filename*=utf-8''{}".format(tipo, quote(nome_file))
+
+
+def etag_file(storage, nome):
+    ''' Nello storage per contenuto il nome è già l'impronta del file. '''
+    if getattr(storage, 'is_contenuto', None) and storage.is_contenuto(nome):
+        return '"{}"'.format(os.path.splitext(os.path.basename(nome))[0])
+    impronta = '{}|{}|{}'.format(nome, storage.size(nome), storage.get_modified_time(nome).timestamp())
+    return '"{}"'.format(hashlib.md5(impronta.encode()).hexdigest())
+
+
+def risposta_file(request, file_field, nome_download, ultima_modifica=None, **kwargs):
+    return risposta_storage(request, file_field.storage, file_field.name, nome_download,
+                            ultima_modifica, **kwargs)
+
+
+def risposta_storage(request, storage, nome, nome_download, ultima_modifica=None, allegato=True, max_age=0):
+    ''' Risponde con il file già autorizzato dalla vista: GET condizionale
+    (ETag, Last-Modified), poi X-Sendfile/X-Accel-Redirect se configurato,
+    altrimenti FileResponse (sendfile del server WSGI) o un 206 per Range.
+    `ultima_modifica` è un timestamp in secondi; `max_age` > 0 solo per URL
+    che cambiano con il contenuto.
+    '''
+    try:
+        dimensione = storage.size(nome)
+        etag = etag_file(storage, nome)
+    except OSError:
+        raise Http404('File non trovato: {}'.format(nome))
+    response = get_conditional_response(request, etag=etag, last_modified=ultima_modifica)
+    if response is None:
+        content_type = mimetypes.guess_type(nome)[0] or 'application/octet-stream'
+        if DOWNLOAD_OFFLOAD == 'x-sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = storage.path(nome)
+        elif DOWNLOAD_OFFLOAD == 'x-accel-redirect':
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = DOWNLOAD_ACCEL_PREFIX + quote(nome)
+        else:
+            response = _risposta_diretta(request, storage, nome, dimensione, content_type,
+                                         etag, ultima_modifica)
+        response['Content-Disposition'] = content_disposition(nome_download, allegato)
+    response['ETag'] = etag
+    if ultima_modifica is not None:
+        response['Last-Modified'] = http_date(ultima_modifica)
+    if max_age:
+        patch_cache_control(response, private=True, max_age=max_age, immutable=True)
+    else:
+        patch_cache_control(response, private=True, max_age=0)
+    return response
+
+
+def _risposta_diretta(request, storage, nome, dimensione, content_type, etag, ultima_modifica):
+    byte = None
+    if _if_range_valido(request, etag, ultima_modifica):
+        byte = intervallo(request.META.get('HTTP_RANGE'), dimensione)
+    if byte is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */{}'.format(dimensione)
+    elif byte is None:
+        response = FileResponse(storage.open(nome, 'rb'), content_type=content_type)
+        response['Content-Length'] = dimensione
+    else:
+        inizio, fine = byte
+        response = StreamingHttpResponse(_blocchi(storage.open(nome, 'rb'), inizio, fine - inizio + 1),
+                                         status=206, content_type=content_type)
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(inizio, fine, dimensione)
+        response['Content-Length'] = fine - inizio + 1
+    response['Accept-Ranges'] = 'bytes'
+    return response
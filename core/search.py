@@ -0,0 +1,309 @@
+import re
+from django.db import connections, DEFAULT_DB_ALIAS, DatabaseError, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from .settings import RICERCA_CONFIG
+
+__all__ = ['get_backend', 'cerca_libri', 'cerca_documenti']
+
+TOKEN_RE = re.compile(r'\w+')
+CHUNK = 500
+
+# un documento per libro: isbn, titolo, descrizione e nomi degli autori
+DOCUMENTO_SQL = """
+SELECT l.id, l.isbn, l.titolo, l.descrizione,
+       COALESCE((SELECT {concat}
+                 FROM core_libro_autori la
+                 JOIN core_autore a ON a.id = la.autore_id
+                 WHERE la.libro_id = l.id), '')
+FROM core_libro l
+"""
+
+# un documento per Documento: nome, descrizione e testo estratto dal file
+DOCUMENTO_DOCUMENTI_SQL = """
+SELECT d.id, d.nome, d.descrizione, d.testo
+FROM core_documento d
+"""
+
+
+class BaseBackend:
+    ''' Nessun indice: ricerca con LIKE, come in origine. '''
+    campi_like = ('titolo', 'isbn')
+
+    def __init__(self, alias):
+        self.alias = alias
+        self._available = None
+
+    @property
+    def connection(self):
+        return connections[self.alias]
+
+    def is_available(self):
+        return False
+
+    def create(self):
+        pass
+
+    def drop(self):
+        pass
+
+    def index(self, pks):
+        pass
+
+    def remove(self, pks):
+        pass
+
+    def rebuild(self):
+        return 0
+
+    def search(self, queryset, query):
+        condizione = Q()
+        for campo in self.campi_like:
+            condizione |= Q(**{'{}__icontains'.format(campo): query})
+        return queryset.filter(condizione)
+
+    def _table_exists(self):
+        if self._available is None:
+            with self.connection.cursor() as cursor:
+                self._available = self.table in self.connection.introspection.table_names(cursor)
+        return self._available
+
+    def _chunks(self, pks):
+        pks = list(pks)
+        for i in range(0, len(pks), CHUNK):
+            yield pks[i:i + CHUNK]
+
+
+class SqliteBackend(BaseBackend):
+    ''' Tabella virtuale FTS5, rowid = pk del libro, ordinamento bm25. '''
+    table = 'core_libro_fts'
+    # alias della tabella sorgente nella SELECT dell'indice
+    alias_sql = 'l'
+    colonne = ('isbn', 'titolo', 'descrizione', 'autori')
+    concat = "group_concat(a.nome || ' ' || a.cognome, ' ')"
+    # pesi bm25 per colonna: isbn, titolo, descrizione, autori
+    pesi = (10.0, 10.0, 1.0, 5.0)
+
+    def is_available(self):
+        return self._table_exists()
+
+    def create(self):
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute(
+                    'CREATE VIRTUAL TABLE IF NOT EXISTS {} '
+                    'USING fts5({})'.format(self.table, ', '.join(self.colonne)))
+            self._available = True
+        except DatabaseError:
+            # SQLite compilato senza FTS5: resta la ricerca con LIKE
+            self._available = False
+
+    def drop(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS {}'.format(self.table))
+        self._available = False
+
+    def remove(self, pks):
+        if not self.is_available():
+            return
+        with self.connection.cursor() as cursor:
+            for chunk in self._chunks(pks):
+                cursor.execute('DELETE FROM {} WHERE rowid IN ({})'.format(
+                    self.table, ', '.join(['%s'] * len(chunk))), chunk)
+
+    def index(self, pks):
+        if not self.is_available():
+            return
+        self.remove(pks)
+        with self.connection.cursor() as cursor:
+            for chunk in self._chunks(pks):
+                cursor.execute(self._insert_sql() + ' WHERE {}.id IN ({})'.format(
+                    self.alias_sql, ', '.join(['%s'] * len(chunk))), chunk)
+
+    def rebuild(self):
+        self.create()
+        if not self.is_available():
+            return 0
+        with transaction.atomic(using=self.alias), self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {}'.format(self.table))
+            cursor.execute(self._insert_sql())
+            return cursor.rowcount
+
+    def _insert_sql(self):
+        return 'INSERT INTO {} (rowid, {}) {}'.format(
+            self.table, ', '.join(self.colonne), DOCUMENTO_SQL.format(concat=self.concat))
+
+    def parse_query(self, query):
+        return ' '.join('"{}"*'.format(t) for t in TOKEN_RE.findall(query))
+
+    def search(self, queryset, query):
+        if not self.is_available():
+            return super().search(queryset, query)
+        match = self.parse_query(query)
+        if not match:
+            return queryset
+        pk = '"{}"."{}"'.format(queryset.model._meta.db_table, queryset.model._meta.pk.column)
+        rank = RawSQL(
+            'SELECT bm25({t}, {pesi}) FROM {t} WHERE {t} MATCH %s AND rowid = {pk}'.format(
+                t=self.table, pesi=', '.join(str(p) for p in self.pesi), pk=pk),
+            (match,))
+        # extra(): RawSQL in un lookup __in verrebbe racchiuso in doppie parentesi
+        return (queryset
+                .extra(where=['{pk} IN (SELECT rowid FROM {t} WHERE {t} MATCH %s)'.format(pk=pk, t=self.table)],
+                       params=[match])
+                .annotate(rank=rank)
+                .order_by('rank'))
+
+
+class PostgresBackend(BaseBackend):
+    ''' Tabella con tsvector pesato e indice GIN. '''
+    table = 'core_libro_ricerca'
+    chiave = 'libro_id'
+    riferimento = 'core_libro'
+    concat = "string_agg(a.nome || ' ' || a.cognome, ' ')"
+
+    def is_available(self):
+        return self._table_exists()
+
+    def create(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TABLE IF NOT EXISTS {t} ('
+                '{k} integer PRIMARY KEY REFERENCES {r} (id) '
+                'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+                'documento tsvector NOT NULL)'.format(t=self.table, k=self.chiave, r=self.riferimento))
+            cursor.execute('CREATE INDEX IF NOT EXISTS {t}_documento ON {t} USING GIN (documento)'.format(
+                t=self.table))
+        self._available = True
+
+    def drop(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS {}'.format(self.table))
+        self._available = False
+
+    def remove(self, pks):
+        if not self.is_available():
+            return
+        with self.connection.cursor() as cursor:
+            for chunk in self._chunks(pks):
+                cursor.execute('DELETE FROM {} WHERE {} = ANY(%s)'.format(self.table, self.chiave), [chunk])
+
+    def index(self, pks):
+        if not self.is_available():
+            return
+        with self.connection.cursor() as cursor:
+            for chunk in self._chunks(pks):
+                cursor.execute(self._insert_sql() + ' WHERE d.id = ANY(%s) '
+                               'ON CONFLICT ({}) DO UPDATE SET documento = EXCLUDED.documento'.format(self.chiave),
+                               self._insert_params() + [chunk])
+
+    def rebuild(self):
+        self.create()
+        with transaction.atomic(using=self.alias), self.connection.cursor() as cursor:
+            cursor.execute('TRUNCATE {}'.format(self.table))
+            cursor.execute(self._insert_sql(), self._insert_params())
+            return cursor.rowcount
+
+    def _insert_sql(self):
+        return (
+            "INSERT INTO {t} (libro_id, documento) "
+            "SELECT d.id, setweight(to_tsvector('simple', d.isbn), 'A') "
+            "|| setweight(to_tsvector(%s::regconfig, d.titolo), 'A') "
+            "|| setweight(to_tsvector(%s::regconfig, d.autori), 'B') "
+            "|| setweight(to_tsvector(%s::regconfig, d.descrizione), 'C') "
+            "FROM ({documento}) AS d (id, isbn, titolo, descrizione, autori)"
+        ).format(t=self.table, documento=DOCUMENTO_SQL.format(concat=self.concat))
+
+    def _insert_params(self):
+        return [RICERCA_CONFIG] * 3
+
+    def parse_query(self, query):
+        return ' & '.join('{}:*'.format(t) for t in TOKEN_RE.findall(query))
+
+    def search(self, queryset, query):
+        if not self.is_available():
+            return super().search(queryset, query)
+        tsquery = self.parse_query(query)
+        if not tsquery:
+            return queryset
+        pk = '"{}"."{}"'.format(queryset.model._meta.db_table, queryset.model._meta.pk.column)
+        # segno invertito: come bm25, valori più bassi sono più rilevanti
+        rank = RawSQL(
+            'SELECT -ts_rank(documento, to_tsquery(%s::regconfig, %s)) FROM {t} WHERE {k} = {pk}'.format(
+                t=self.table, k=self.chiave, pk=pk),
+            (RICERCA_CONFIG, tsquery))
+        match = '{pk} IN (SELECT {k} FROM {t} WHERE documento @@ to_tsquery(%s::regconfig, %s))'.format(
+            pk=pk, k=self.chiave, t=self.table)
+        return (queryset
+                .extra(where=[match], params=[RICERCA_CONFIG, tsquery])
+                .annotate(rank=rank)
+                .order_by('rank'))
+
+
+class BaseDocumentiBackend(BaseBackend):
+    campi_like = ('nome', 'descrizione', 'testo')
+
+
+class SqliteDocumentiBackend(SqliteBackend):
+    ''' Indice dei documenti: rowid = pk del Documento. '''
+    table = 'core_documento_fts'
+    alias_sql = 'd'
+    colonne = ('nome', 'descrizione', 'testo')
+    campi_like = BaseDocumentiBackend.campi_like
+    pesi = (10.0, 5.0, 1.0)
+
+    def _insert_sql(self):
+        return 'INSERT INTO {} (rowid, {}) {}'.format(
+            self.table, ', '.join(self.colonne), DOCUMENTO_DOCUMENTI_SQL)
+
+
+class PostgresDocumentiBackend(PostgresBackend):
+    table = 'core_documento_ricerca'
+    chiave = 'documento_id'
+    riferimento = 'core_documento'
+    campi_like = BaseDocumentiBackend.campi_like
+
+    def _insert_sql(self):
+        return (
+            "INSERT INTO {t} (documento_id, documento) "
+            "SELECT d.id, setweight(to_tsvector(%s::regconfig, d.nome), 'A') "
+            "|| setweight(to_tsvector(%s::regconfig, d.descrizione), 'B') "
+            "|| setweight(to_tsvector(%s::regconfig, d.testo), 'C') "
+            "FROM ({documento}) AS d (id, nome, descrizione, testo)"
+        ).format(t=self.table, documento=DOCUMENTO_DOCUMENTI_SQL)
+
+
+LIBRI = 'libri'
+DOCUMENTI = 'documenti'
+
+BACKENDS = {
+    LIBRI: {
+        'sqlite': SqliteBackend,
+        'postgresql': PostgresBackend,
+    },
+    DOCUMENTI: {
+        'sqlite': SqliteDocumentiBackend,
+        'postgresql': PostgresDocumentiBackend,
+    },
+}
+BACKEND_BASE = {
+    LIBRI: BaseBackend,
+    DOCUMENTI: BaseDocumentiBackend,
+}
+
+_backends = {}
+
+
+def get_backend(using=DEFAULT_DB_ALIAS, indice=LIBRI):
+    if (indice, using) not in _backends:
+        backend = BACKENDS[indice].get(connections[using].vendor, BACKEND_BASE[indice])
+        _backends[indice, using] = backend(using)
+    return _backends[indice, using]
+
+
+def cerca_libri(queryset, query):
+    return get_backend(queryset.db).search(queryset, query)
+
+
+def cerca_documenti(queryset, query):
+    return get_backend(queryset.db, DOCUMENTI).search(queryset, query)
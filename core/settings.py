@@ -23,3 +23,148 @@ MAXKB_DOCUMENTO = getattr(
     'BIBLIOTECA_MAXKB_DOCUMENTO',
     50
 )
+
+ELEMENTI_PER_PAGINA = getattr(
+    settings,
+    'BIBLIOTECA_ELEMENTI_PER_PAGINA',
+    50
+)
+
+RICERCA_CONFIG = getattr(
+    settings,
+    'BIBLIOTECA_RICERCA_CONFIG',
+    'italian'
+)
+
+INDICE_AUTOCOMPLETE = getattr(
+    settings,
+    'BIBLIOTECA_INDICE_AUTOCOMPLETE',
+    False
+)
+
+# alias in CACHES del contatore di generazione degli indici dell'autocomplete:
+# ogni processo ha i suoi indici, e una modifica fatta in un processo arriva
+# agli altri solo se la cache è condivisa (memcached, redis), vedi core.checks
+INDICE_AUTOCOMPLETE_CACHE = getattr(
+    settings,
+    'BIBLIOTECA_INDICE_AUTOCOMPLETE_CACHE',
+    'default'
+)
+
+CONTEGGI_TIMEOUT = getattr(
+    settings,
+    'BIBLIOTECA_CONTEGGI_TIMEOUT',
+    300
+)
+
+# None: conteggi sempre esatti; altrimenti le tabelle senza filtri con almeno
+# questo numero di righe mostrano una stima
+STIMA_CONTEGGI_SOGLIA = getattr(
+    settings,
+    'BIBLIOTECA_STIMA_CONTEGGI_SOGLIA',
+    None
+)
+
+NAVIGAZIONE_TIMEOUT = getattr(
+    settings,
+    'BIBLIOTECA_NAVIGAZIONE_TIMEOUT',
+    3600
+)
+
+# le chiavi dei frammenti delle righe includono la versione dell'oggetto
+RIGHE_TIMEOUT = getattr(
+    settings,
+    'BIBLIOTECA_RIGHE_TIMEOUT',
+    24 * 3600
+)
+
+# da cambiare dopo un aggiornamento dei template: invalida gli ETag già emessi
+ETAG_SALT = getattr(
+    settings,
+    'BIBLIOTECA_ETAG_SALT',
+    ''
+)
+
+# errori di lock (nowait, "database is locked"): tentativi complessivi e attese
+# in secondi del back-off esponenziale con jitter, vedi core.contesa
+CONTESA_TENTATIVI = getattr(
+    settings,
+    'BIBLIOTECA_CONTESA_TENTATIVI',
+    5
+)
+
+CONTESA_ATTESA_BASE = getattr(
+    settings,
+    'BIBLIOTECA_CONTESA_ATTESA_BASE',
+    0.05
+)
+
+CONTESA_ATTESA_MAX = getattr(
+    settings,
+    'BIBLIOTECA_CONTESA_ATTESA_MAX',
+    1.0
+)
+
+# alias in CACHES dei contatori di riprese e rinunce: perché metriche_contesa
+# li veda deve essere condivisa tra i processi (memcached, redis)
+CONTESA_CACHE = getattr(
+    settings,
+    'BIBLIOTECA_CONTESA_CACHE',
+    'default'
+)
+
+# download dei documenti: None (servito da Django), 'x-sendfile' (Apache,
+# lighttpd) o 'x-accel-redirect' (nginx, con la location interna sotto)
+DOWNLOAD_OFFLOAD = getattr(
+    settings,
+    'BIBLIOTECA_DOWNLOAD_OFFLOAD',
+    None
+)
+
+DOWNLOAD_ACCEL_PREFIX = getattr(
+    settings,
+    'BIBLIOTECA_DOWNLOAD_ACCEL_PREFIX',
+    '/protetti/'
+)
+
+# secondi dall'ultimo riuso prima di eliminare un contenuto rimasto senza
+# documenti: copre le transazioni di upload non ancora confermate
+CONTENUTI_GRAZIA = getattr(
+    settings,
+    'BIBLIOTECA_CONTENUTI_GRAZIA',
+    3600
+)
+
+# lato maggiore in pixel delle immagini generate dai documenti
+ANTEPRIMA_LATO = getattr(
+    settings,
+    'BIBLIOTECA_ANTEPRIMA_LATO',
+    1024
+)
+
+MINIATURA_LATO = getattr(
+    settings,
+    'BIBLIOTECA_MINIATURA_LATO',
+    160
+)
+
+# coda dei job in background, vedi core.jobs e il comando run_worker
+JOB_TENTATIVI = getattr(
+    settings,
+    'BIBLIOTECA_JOB_TENTATIVI',
+    3
+)
+
+# secondi prima del primo nuovo tentativo, poi raddoppia
+JOB_ATTESA_RIPROVA = getattr(
+    settings,
+    'BIBLIOTECA_JOB_ATTESA_RIPROVA',
+    30
+)
+
+# un job in corso da più di così si considera perso (worker terminato) e torna in coda
+JOB_TIMEOUT = getattr(
+    settings,
+    'BIBLIOTECA_JOB_TIMEOUT',
+    3600
+)
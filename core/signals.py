@@ -1,13 +1,263 @@
-from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import (pre_save, post_save, post_delete, pre_delete,
+                                      m2m_changed)
 from django.dispatch import receiver
-from .models import Profilo
+from .models import (Libro, Autore, Editore, Collana, Genere,
+                     StatisticheBiblioteca, Prestito, Documento, Bookmark)
+from .context_processors import chiave_bookmark
+from .counts import invalida_conteggi, incrementa_versione
+from .search import get_backend, DOCUMENTI
+from .prefix_index import invalida_indice
+from .jobs import estrai_testi, genera_anteprime, rilascia_contenuto
+from .settings import CONTENUTI_GRAZIA
 
-@receiver(post_save, sender=User)
-def crea_profilo_utente(sender, instance, created, **kwargs):
-    if created:
-        Profilo.objects.create(utente=instance)
 
-@receiver(post_save, sender=User)
-def salva_profilo_utente(sender, instance, **kwargs):
-    instance.profilo.save()
+# Indice di ricerca full-text dei libri
+@receiver(post_save, sender=Libro)
+def indicizza_libro(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_backend(instance._state.db).index([instance.pk])
+
+
+@receiver(post_delete, sender=Libro)
+def rimuovi_libro_da_indice(sender, instance, **kwargs):
+    get_backend(instance._state.db).remove([instance.pk])
+
+
+@receiver(m2m_changed, sender=Libro.autori.through)
+def indicizza_autori_libro(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            get_backend(instance._state.db).index([instance.pk])
+    elif action == 'pre_clear':
+        instance._libri_da_indicizzare = list(instance.libro_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        get_backend(instance._state.db).index(getattr(instance, '_libri_da_indicizzare', []))
+    elif action in ('post_add', 'post_remove'):
+        get_backend(instance._state.db).index(pk_set)
+
+
+@receiver(post_save, sender=Autore)
+def indicizza_libri_autore(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        get_backend(instance._state.db).index(instance.libro_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Autore)
+def memorizza_libri_autore(sender, instance, **kwargs):
+    instance._libri_da_indicizzare = list(instance.libro_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Autore)
+def reindicizza_libri_autore(sender, instance, **kwargs):
+    get_backend(instance._state.db).index(getattr(instance, '_libri_da_indicizzare', []))
+
+
+# Indici in memoria per l'autocomplete
+@receiver(post_save, sender=Autore)
+@receiver(post_save, sender=Editore)
+@receiver(post_save, sender=Collana)
+@receiver(post_save, sender=Genere)
+@receiver(post_delete, sender=Autore)
+@receiver(post_delete, sender=Editore)
+@receiver(post_delete, sender=Collana)
+@receiver(post_delete, sender=Genere)
+def invalida_indice_autocomplete(sender, **kwargs):
+    invalida_indice(sender)
+
+
+# Statistiche della dashboard
+@receiver(post_save, sender=Libro)
+def conta_libro_aggiunto(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        StatisticheBiblioteca.aggiorna(libri_totali=1, libri_disponibili=int(instance.disponibile))
+
+
+@receiver(post_delete, sender=Libro)
+def conta_libro_eliminato(sender, instance, **kwargs):
+    StatisticheBiblioteca.aggiorna(libri_totali=-1, libri_disponibili=-int(instance.disponibile))
+
+
+# i prestiti creati, modificati dall'admin o eliminati (anche in cascata da
+# Libro e Profilo); le transizioni delle viste sono UPDATE e si contano da sé
+@receiver(pre_save, sender=Prestito)
+def memorizza_stato_prestito(sender, instance, raw=False, **kwargs):
+    instance._stato_precedente = None
+    if instance.pk and not raw:
+        instance._stato_precedente = sender.objects.filter(pk=instance.pk).values_list('stato', flat=True).first()
+
+
+@receiver(post_save, sender=Prestito)
+def conta_prestito_salvato(sender, instance, raw=False, **kwargs):
+    precedente = getattr(instance, '_stato_precedente', None)
+    if not raw and precedente != instance.stato:
+        StatisticheBiblioteca.sposta_prestito(da=precedente, a=instance.stato)
+
+
+@receiver(post_delete, sender=Prestito)
+def conta_prestito_eliminato(sender, instance, **kwargs):
+    StatisticheBiblioteca.sposta_prestito(da=instance.stato)
+
+
+# Disponibilità dei libri: le viste dei prestiti la aggiornano nella loro
+# transazione; le modifiche dall'admin, le cancellazioni in cascata e i
+# delete() sui queryset sono riallineati dopo il commit
+def _riallinea_libro(libro_id):
+    libro = Libro.objects.filter(pk=libro_id).first()
+    if libro is not None:
+        with transaction.atomic():
+            libro.riallinea_disponibilita()
+
+
+@receiver(post_save, sender=Prestito)
+@receiver(post_delete, sender=Prestito)
+def riallinea_libro_prestito(sender, instance, raw=False, **kwargs):
+    if not raw:
+        libro_id = instance.libro_id
+        transaction.on_commit(lambda: _riallinea_libro(libro_id))
+
+
+# Versione dei conteggi in cache degli elenchi
+@receiver(post_save, sender=Libro)
+@receiver(post_save, sender=Prestito)
+@receiver(post_save, sender=Documento)
+@receiver(post_save, sender=Autore)
+@receiver(post_save, sender=Editore)
+@receiver(post_save, sender=Collana)
+@receiver(post_save, sender=Genere)
+@receiver(post_delete, sender=Libro)
+@receiver(post_delete, sender=Prestito)
+@receiver(post_delete, sender=Documento)
+@receiver(post_delete, sender=Autore)
+@receiver(post_delete, sender=Editore)
+@receiver(post_delete, sender=Collana)
+@receiver(post_delete, sender=Genere)
+def invalida_conteggi_elenco(sender, **kwargs):
+    invalida_conteggi(sender)
+    if sender is Autore:
+        # la ricerca dei libri include i nomi degli autori
+        invalida_conteggi(Libro)
+
+
+@receiver(m2m_changed, sender=Libro.autori.through)
+@receiver(m2m_changed, sender=Libro.sottogeneri.through)
+def invalida_conteggi_libri(sender, action, **kwargs):
+    if action.startswith('post_'):
+        invalida_conteggi(Libro)
+
+
+@receiver(post_save, sender=Bookmark)
+@receiver(post_delete, sender=Bookmark)
+def invalida_menu_bookmark(sender, instance, **kwargs):
+    incrementa_versione(chiave_bookmark(instance.user_id))
+
+
+# Versione delle righe in cache degli elenchi: la propria la incrementa
+# save(), qui solo quella delle righe di altri modelli che mostrano l'oggetto
+@receiver(m2m_changed, sender=Libro.autori.through)
+def tocca_libri_autori(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        Libro.objects.filter(pk=instance.pk).incrementa_versione()
+    elif pk_set is not None:
+        Libro.objects.filter(pk__in=pk_set).incrementa_versione()
+    else:
+        Libro.objects.filter(autori=instance).incrementa_versione()
+
+
+@receiver(post_save, sender=Autore)
+@receiver(pre_delete, sender=Autore)
+def tocca_libri_autore(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Libro.objects.filter(autori=instance).incrementa_versione()
+
+
+@receiver(post_save, sender=Editore)
+def tocca_libri_editore(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Libro.objects.filter(editore=instance).incrementa_versione()
+
+
+@receiver(post_save, sender=Collana)
+@receiver(pre_delete, sender=Collana)
+def tocca_libri_collana(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Libro.objects.filter(collana=instance).incrementa_versione()
+
+
+@receiver(post_save, sender=Genere)
+def tocca_libri_genere(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Libro.objects.filter(genere=instance).incrementa_versione()
+
+
+@receiver(post_save, sender=Prestito)
+def tocca_prestito(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Libro.objects.filter(pk=instance.libro_id).incrementa_versione()
+
+
+@receiver(post_delete, sender=Prestito)
+def tocca_libro_prestito(sender, instance, **kwargs):
+    Libro.objects.filter(pk=instance.libro_id).incrementa_versione()
+
+
+def _accoda_elaborazione_documenti():
+    # un job per tipo elabora tutti i documenti in attesa: non servono doppioni
+    estrai_testi.accoda(unico=True)
+    genera_anteprime.accoda(unico=True)
+
+
+# Indice di ricerca dei documenti: nome e descrizione subito; testo e
+# anteprime del file sono generati in background (core.estrazione, core.anteprime)
+@receiver(post_save, sender=Documento)
+def indicizza_documento(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    precedente = getattr(instance, '_file_precedente', None)
+    if created or precedente != instance.file.name:
+        transaction.on_commit(_accoda_elaborazione_documenti)
+    if not created and precedente != instance.file.name:
+        in_attesa = {
+            'testo': '',
+            'stato_testo': Documento.TESTO_IN_ATTESA,
+            'stato_anteprima': Documento.ANTEPRIMA_IN_ATTESA,
+        }
+        sender.objects.filter(pk=instance.pk).update(**in_attesa)
+        for campo, valore in in_attesa.items():
+            setattr(instance, campo, valore)
+    get_backend(instance._state.db, DOCUMENTI).index([instance.pk])
+
+
+@receiver(post_delete, sender=Documento)
+def rimuovi_documento_da_indice(sender, instance, **kwargs):
+    get_backend(instance._state.db, DOCUMENTI).remove([instance.pk])
+
+
+# Contenuti dei documenti: il file, condiviso tra i documenti con lo stesso
+# contenuto, è eliminato da un job quando nessun documento lo usa più da
+# CONTENUTI_GRAZIA secondi (un upload concorrente può non aver ancora confermato)
+def _rilascia_file(storage, nome):
+    if nome and storage.is_contenuto(nome) and not Documento.riferimenti_file(nome):
+        rilascia_contenuto.accoda(nome, unico=True, ritardo=CONTENUTI_GRAZIA)
+
+
+@receiver(pre_save, sender=Documento)
+def memorizza_file_documento(sender, instance, raw=False, **kwargs):
+    instance._file_precedente = None
+    if instance.pk and not raw:
+        instance._file_precedente = sender.objects.filter(pk=instance.pk).values_list('file', flat=True).first()
+
+
+@receiver(post_save, sender=Documento)
+def rilascia_file_sostituito(sender, instance, raw=False, **kwargs):
+    precedente = getattr(instance, '_file_precedente', None)
+    if precedente and precedente != instance.file.name:
+        transaction.on_commit(lambda: _rilascia_file(instance.file.storage, precedente))
+
+
+@receiver(post_delete, sender=Documento)
+def rilascia_file_documento(sender, instance, **kwargs):
+    nome = instance.file.name
+    transaction.on_commit(lambda: _rilascia_file(instance.file.storage, nome))
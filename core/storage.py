@@ -0,0 +1,117 @@
+import hashlib
+import os
+import time
+import uuid
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+__all__ = ['StorageContenuti']
+
+
+@deconstructible
+class StorageContenuti(FileSystemStorage):
+    ''' Salva ogni file una volta sola, sotto l'impronta SHA-256 del contenuto
+    (es. documenti/contenuti/3f/3fa2...e1.pdf). Il nome proposto da upload_to
+    serve solo per l'estensione; un contenuto già presente non viene riscritto
+    e più Documento possono puntare allo stesso file, vedi
+    Documento.riferimenti_file.
+
+    Il riuso di un contenuto riscrive il file e ne aggiorna la data di
+    modifica: elimina() la controlla dopo aver spostato il file, così un
+    upload concorrente dello stesso contenuto non resta senza file.
+    '''
+    algoritmo = 'sha256'
+
+    def __init__(self, cartella='documenti/contenuti', **kwargs):
+        super().__init__(**kwargs)
+        self.cartella = cartella
+
+    def impronta(self, content):
+        ''' Legge il contenuto a blocchi (dalla memoria o dal file temporaneo
+        dell'upload), senza scrivere nulla.
+        '''
+        h = hashlib.new(self.algoritmo)
+        for blocco in content.chunks():
+            h.update(blocco)
+        return h.hexdigest()
+
+    def nome_contenuto(self, impronta, name):
+        estensione = os.path.splitext(name)[1].lower()[:10]
+        return '/'.join([self.cartella, impronta[:2], impronta + estensione])
+
+    def nome_derivato(self, name, tipo, estensione='.png'):
+        ''' File generato dal contenuto (es. un'anteprima), salvato accanto:
+        cambia nome, e va rigenerato, solo se cambia il contenuto.
+        '''
+        return '{}.{}{}'.format(name, tipo, estensione)
+
+    def is_contenuto(self, name):
+        return name.startswith(self.cartella + '/')
+
+    def save(self, name, content, max_length=None):
+        ''' Scrive il contenuto in un file temporaneo nella cartella dei
+        contenuti calcolandone intanto l'impronta, poi lo sposta sul nome
+        definitivo: l'upload viene letto una volta sola e un contenuto già
+        presente viene sostituito da uno identico, con la data aggiornata.
+        '''
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        self._crea_cartella(self.path(self.cartella))
+        temporaneo = self.path('{}/{}.caricando'.format(self.cartella, uuid.uuid4().hex))
+        try:
+            h = hashlib.new(self.algoritmo)
+            fd = os.open(temporaneo, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+            with os.fdopen(fd, 'wb') as file:
+                for blocco in content.chunks():
+                    h.update(blocco)
+                    file.write(blocco)
+            if self.file_permissions_mode is not None:
+                os.chmod(temporaneo, self.file_permissions_mode)
+            name = self.nome_contenuto(h.hexdigest(), name)
+            percorso = self.path(name)
+            self._crea_cartella(os.path.dirname(percorso))
+            # atomico: chi legge, o elimina() che l'ha appena spostato, trova
+            # sempre un file completo sotto il nome dell'impronta
+            os.replace(temporaneo, percorso)
+        except BaseException:
+            try:
+                os.remove(temporaneo)
+            except FileNotFoundError:
+                pass
+            raise
+        return name
+
+    def _crea_cartella(self, cartella):
+        if self.directory_permissions_mode is None:
+            os.makedirs(cartella, exist_ok=True)
+            return
+        umask = os.umask(0)
+        try:
+            os.makedirs(cartella, self.directory_permissions_mode, exist_ok=True)
+        finally:
+            os.umask(umask)
+
+    def elimina(self, name, riferimenti, grazia):
+        ''' Elimina il contenuto se `riferimenti()` è zero e nessuno l'ha
+        riusato negli ultimi `grazia` secondi. Il file viene prima spostato:
+        un upload che lo riusa dopo lo spostamento lo riscrive, uno che l'ha
+        riusato prima ne ha aggiornato la data. True se eliminato, False se
+        ancora usato, None se riusato di recente (da riprovare più tardi).
+        '''
+        percorso = self.path(name)
+        spostato = '{}.{}.eliminando'.format(percorso, os.getpid())
+        try:
+            os.rename(percorso, spostato)
+        except FileNotFoundError:
+            return True
+        in_uso = bool(riferimenti())
+        recente = os.stat(spostato).st_mtime > time.time() - grazia
+        if in_uso or recente:
+            # rimesso al suo posto: se nel frattempo è stato riscritto il contenuto è lo stesso
+            os.replace(spostato, percorso)
+            return False if in_uso else None
+        os.remove(spostato)
+        return True
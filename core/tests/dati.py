@@ -0,0 +1,21 @@
+''' Oggetti minimi per i test. '''
+from datetime import date
+from core.models import Autore, Editore, Genere, Libro, Profilo
+
+
+def crea_libro(titolo='Il nome della rosa', isbn='9788845292613', autori=(), **campi):
+    editore = Editore.objects.get_or_create(nome='Bompiani')[0]
+    genere = Genere.objects.get_or_create(nome='Narrativa')[0]
+    libro = Libro.objects.create(isbn=isbn, titolo=titolo, editore=editore, genere=genere, **campi)
+    libro.autori.add(*autori)
+    return libro
+
+
+def crea_autore(nome='Umberto', cognome='Eco'):
+    return Autore.objects.create(nome=nome, cognome=cognome)
+
+
+def crea_profilo(cognome='Rossi', codfisc='RSSMRA80A01H501U'):
+    return Profilo.objects.create(nome='Mario', cognome=cognome, codfisc=codfisc,
+                                  data_nascita=date(1980, 1, 1), telefono='0',
+                                  email='{}@example.com'.format(cognome.lower()))
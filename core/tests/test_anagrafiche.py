@@ -0,0 +1,16 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from core.models import Genere, SottoGenere
+
+
+class ModificaSottoGenereTest(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        self.sottogenere = SottoGenere.objects.create(nome='Giallo', padre=Genere.objects.create(nome='Narrativa'))
+
+    def test_pagina_modifica(self):
+        risposta = self.client.get(reverse('modifica_sottogenere', kwargs={'pk': self.sottogenere.pk}))
+        self.assertEqual(risposta.status_code, 200)
+        self.assertContains(risposta, 'Giallo')
@@ -0,0 +1,52 @@
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from core.checks import controlla_indice_autocomplete
+from core.models import Autore
+from .dati import crea_autore
+
+
+@mock.patch('core.views.autocomplete.INDICE_AUTOCOMPLETE', True)
+class IndiceAutocompleteTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        crea_autore()
+
+    def cerca(self, q):
+        risposta = self.client.get(reverse('autore_dal'), {'q': q})
+        return [risultato['text'] for risultato in risposta.json()['results']]
+
+    def test_autore_aggiunto(self):
+        self.assertEqual(self.cerca('cal'), [])
+        crea_autore('Italo', 'Calvino')
+        self.assertEqual(self.cerca('cal'), [str(Autore.objects.get(cognome='Calvino'))])
+
+    def test_autore_rinominato(self):
+        self.assertEqual(len(self.cerca('eco')), 1)
+        autore = Autore.objects.get(cognome='Eco')
+        autore.cognome = 'Calvino'
+        autore.save()
+        self.assertEqual(self.cerca('eco'), [])
+        self.assertEqual(len(self.cerca('cal')), 1)
+
+    def test_autore_eliminato(self):
+        self.assertEqual(len(self.cerca('eco')), 1)
+        Autore.objects.get(cognome='Eco').delete()
+        self.assertEqual(self.cerca('eco'), [])
+
+
+@mock.patch('core.checks.INDICE_AUTOCOMPLETE', True)
+class ControlloCacheIndiceTest(SimpleTestCase):
+
+    def test_cache_locale_rifiutata(self):
+        with mock.patch('core.checks.indice_condiviso', return_value=False):
+            errori = controlla_indice_autocomplete(None)
+        self.assertEqual([errore.id for errore in errori], ['core.E001'])
+
+    def test_cache_condivisa(self):
+        with mock.patch('core.checks.indice_condiviso', return_value=True):
+            self.assertEqual(controlla_indice_autocomplete(None), [])
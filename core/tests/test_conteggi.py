@@ -0,0 +1,36 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from core.counts import conta
+from core.models import Libro
+from .dati import crea_autore, crea_libro
+
+
+class ConteggiTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.libro = crea_libro()
+        crea_libro(titolo='Il pendolo di Foucault', isbn='9788845292606')
+
+    def test_conta_dopo_eliminazione(self):
+        self.assertEqual(conta(Libro.objects.all(), stima=False), 2)
+        self.libro.delete()
+        self.assertEqual(conta(Libro.objects.all(), stima=False), 1)
+
+    def test_conta_ricerca_dopo_modifica_autore(self):
+        autore = crea_autore()
+        self.libro.autori.add(autore)
+        self.assertEqual(conta(Libro.objects.filter(autori__cognome='Calvino'), stima=False), 0)
+        autore.cognome = 'Calvino'
+        autore.save()
+        self.assertEqual(conta(Libro.objects.filter(autori__cognome='Calvino'), stima=False), 1)
+
+    def test_elenco_libri_dopo_eliminazione(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        risposta = self.client.get(reverse('elenco_libri'))
+        self.assertEqual(risposta.context['objects_count'], '(2)')
+        self.libro.delete()
+        risposta = self.client.get(reverse('elenco_libri'))
+        self.assertEqual(risposta.context['objects_count'], '(1)')
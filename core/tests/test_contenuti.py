@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from core.jobs import rilascia_contenuto
+from core.models import Documento, Job
+from core.storage import StorageContenuti
+
+
+class ContenutiTest(TransactionTestCase):
+
+    def setUp(self):
+        self.cartella = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cartella)
+        impostazioni = override_settings(MEDIA_ROOT=self.cartella)
+        impostazioni.enable()
+        self.addCleanup(impostazioni.disable)
+        self.storage = Documento._meta.get_field('file').storage
+        self.utente = User.objects.create_user('bibliotecario')
+
+    def documento(self, contenuto):
+        return Documento.objects.create(user=self.utente, nome='Verbale',
+                                        file=ContentFile(contenuto, name='verbale.pdf'))
+
+    def rilasci_in_coda(self):
+        return sorted(Job.objects.filter(nome='rilascia_contenuto').values_list('argomenti', flat=True))
+
+    @mock.patch('core.jobs.CONTENUTI_GRAZIA', 0)
+    def test_file_eliminato_senza_documenti(self):
+        primo = self.documento(b'uno')
+        secondo = self.documento(b'uno')
+        self.assertEqual(primo.file.name, secondo.file.name)
+        vecchio = primo.file.name
+        primo.file = ContentFile(b'due', name='verbale.pdf')
+        primo.save()
+        # il vecchio contenuto è ancora usato dal secondo documento
+        self.assertEqual(self.rilasci_in_coda(), [])
+        nuovo = primo.file.name
+        primo.delete()
+        secondo.delete()
+        self.assertEqual(len(self.rilasci_in_coda()), 2)
+        self.assertTrue(self.storage.exists(vecchio))
+        rilascia_contenuto(vecchio)
+        rilascia_contenuto(nuovo)
+        self.assertFalse(self.storage.exists(vecchio))
+        self.assertFalse(self.storage.exists(nuovo))
+
+    def test_upload_letto_una_volta(self):
+        contenuto = ContentFile(b'uno', name='verbale.pdf')
+        with mock.patch.object(contenuto, 'chunks', wraps=contenuto.chunks) as chunks:
+            nome = self.storage.save('verbale.pdf', contenuto)
+        self.assertEqual(chunks.call_count, 1)
+        self.assertEqual(self.storage.save('verbale.pdf', ContentFile(b'uno')), nome)
+        cartella, file = self.storage.listdir(os.path.dirname(nome))
+        self.assertEqual(file, [os.path.basename(nome)])
+        # nessun file temporaneo rimasto nella cartella dei contenuti
+        self.assertEqual(self.storage.listdir(self.storage.cartella)[1], [])
+
+    def test_file_riusato_non_eliminato(self):
+        documento = self.documento(b'uno')
+        nome = documento.file.name
+        Documento.objects.filter(pk=documento.pk).delete()
+        # riuso recente: si riprova dopo la grazia
+        self.assertIsNone(self.storage.elimina(nome, lambda: 0, grazia=60))
+        self.assertTrue(self.storage.exists(nome))
+        # riuso durante l'eliminazione: l'upload non ancora confermato trova
+        # il file spostato e lo riscrive
+        storage = StorageContenuti()
+
+        def upload_concorrente():
+            self.assertEqual(storage.save('verbale.pdf', ContentFile(b'uno')), nome)
+            return 0
+
+        self.assertTrue(self.storage.elimina(nome, upload_concorrente, grazia=0))
+        self.assertTrue(self.storage.exists(nome))
+        with self.storage.open(nome) as file:
+            self.assertEqual(file.read(), b'uno')
+
+
+class CaricamentoDocumentiTest(TransactionTestCase):
+
+    def setUp(self):
+        self.cartella = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cartella)
+        impostazioni = override_settings(MEDIA_ROOT=self.cartella)
+        impostazioni.enable()
+        self.addCleanup(impostazioni.disable)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+
+    def carica(self, url, contenuto):
+        return self.client.post(url, {
+            'nome': 'Verbale', 'descrizione': '',
+            'file': SimpleUploadedFile('verbale.pdf', contenuto, content_type='application/pdf')})
+
+    def job_in_coda(self):
+        return sorted(Job.objects.filter(stato=Job.IN_CODA).values_list('nome', flat=True))
+
+    def test_caricamento_accoda_elaborazione(self):
+        risposta = self.carica(reverse('aggiungi_documento'), b'uno')
+        self.assertRedirects(risposta, reverse('elenco_documenti'))
+        self.assertEqual(self.job_in_coda(), ['estrai_testi', 'genera_anteprime'])
+        # un job per tipo basta per tutti i documenti in attesa
+        self.carica(reverse('aggiungi_documento'), b'due')
+        self.assertEqual(self.job_in_coda(), ['estrai_testi', 'genera_anteprime'])
+
+    def test_sostituzione_file(self):
+        self.carica(reverse('aggiungi_documento'), b'uno')
+        documento = Documento.objects.get()
+        Job.objects.all().delete()
+        self.carica(reverse('modifica_documento', kwargs={'pk': documento.pk}), b'due')
+        documento.refresh_from_db()
+        self.assertEqual(documento.stato_testo, Documento.TESTO_IN_ATTESA)
+        self.assertEqual(self.job_in_coda(), ['estrai_testi', 'genera_anteprime', 'rilascia_contenuto'])
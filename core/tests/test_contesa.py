@@ -0,0 +1,30 @@
+from unittest import mock
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError
+from django.test import SimpleTestCase
+from core.contesa import azzera_metriche_contesa, metriche_contesa, riprova_su_contesa
+
+
+class RiprovaSuContesaTest(SimpleTestCase):
+
+    def setUp(self):
+        azzera_metriche_contesa()
+
+    @mock.patch('core.contesa.time.sleep')
+    def test_riprende_dopo_un_lock(self, sleep):
+        esiti = [OperationalError('database is locked'), 'fatto']
+
+        @riprova_su_contesa('prova')
+        def operazione():
+            esito = esiti.pop(0)
+            if isinstance(esito, Exception):
+                raise esito
+            return esito
+
+        self.assertEqual(operazione(), 'fatto')
+        self.assertEqual(metriche_contesa()['prova'], {'tentativi': 2, 'riprese': 1, 'rinunce': 0})
+
+    def test_metriche_in_cache_locale_rifiutate(self):
+        with self.assertRaisesMessage(CommandError, 'BIBLIOTECA_CONTESA_CACHE'):
+            call_command('metriche_contesa')
@@ -0,0 +1,45 @@
+from io import StringIO
+from django.core.management import call_command
+from django.test import TransactionTestCase
+from core.models import Libro, Prestito
+from .dati import crea_libro, crea_profilo
+
+
+class DisponibilitaTest(TransactionTestCase):
+    ''' Lo stato salvato sul libro segue i prestiti anche fuori dalle viste. '''
+
+    def setUp(self):
+        self.libro = crea_libro()
+        self.profilo = crea_profilo()
+        self.prestito = Prestito.objects.create(profilo=self.profilo, libro=self.libro, stato=Prestito.INCORSO)
+
+    def assertDisponibile(self, prestito_corrente=None):
+        libro = Libro.objects.get(pk=self.libro.pk)
+        self.assertEqual(libro.disponibile, prestito_corrente is None)
+        self.assertEqual(libro.prestito_corrente_id, prestito_corrente)
+
+    def test_prestito_creato(self):
+        self.assertDisponibile(self.prestito.pk)
+
+    def test_prestito_concluso_dall_admin(self):
+        self.prestito.stato = Prestito.CONCLUSO
+        self.prestito.save()
+        self.assertDisponibile()
+
+    def test_delete_queryset(self):
+        Prestito.objects.filter(pk=self.prestito.pk).delete()
+        self.assertDisponibile()
+
+    def test_profilo_eliminato(self):
+        self.profilo.delete()
+        self.assertDisponibile()
+
+    def test_ricalcola_solo_prestito_corrente(self):
+        concluso = Prestito.objects.create(profilo=crea_profilo('Bianchi', 'BNCMRA80A01H501U'),
+                                           libro=self.libro, stato=Prestito.CONCLUSO)
+        # disponibilità giusta, prestito corrente sbagliato
+        Libro.objects.filter(pk=self.libro.pk).update(prestito_corrente=concluso)
+        output = StringIO()
+        call_command('ricalcola_disponibilita', stdout=output)
+        self.assertIn('1 libri corretti', output.getvalue())
+        self.assertDisponibile(self.prestito.pk)
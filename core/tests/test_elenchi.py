@@ -0,0 +1,67 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from core.models import Libro, Prestito
+from .dati import crea_autore, crea_libro, crea_profilo
+
+
+class RigheElencoLibriTest(TestCase):
+    ''' Le righe dell'elenco sono frammenti in cache per versione del libro. '''
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        self.autore = crea_autore()
+        self.libro = crea_libro(autori=[self.autore])
+
+    def test_titolo_modificato(self):
+        self.assertContains(self.client.get(reverse('elenco_libri')), 'Il nome della rosa')
+        self.libro.titolo = 'Il pendolo di Foucault'
+        self.libro.save()
+        risposta = self.client.get(reverse('elenco_libri'))
+        self.assertContains(risposta, 'Il pendolo di Foucault')
+        self.assertNotContains(risposta, 'Il nome della rosa')
+
+    def test_salvataggio_un_update(self):
+        libro = Libro.objects.get(pk=self.libro.pk)
+        versione = libro.versione
+        with CaptureQueriesContext(connection) as query:
+            libro.save()
+        aggiornamenti = [q for q in query if q['sql'].startswith('UPDATE "core_libro"')]
+        self.assertEqual(len(aggiornamenti), 1)
+        self.assertEqual(libro.versione, versione + 1)
+
+    def test_autore_rinominato(self):
+        self.assertContains(self.client.get(reverse('elenco_libri')), 'Eco')
+        self.autore.cognome = 'Calvino'
+        self.autore.save()
+        risposta = self.client.get(reverse('elenco_libri'))
+        self.assertContains(risposta, 'Calvino')
+        self.assertNotContains(risposta, 'Eco')
+
+    def test_disponibilita_salvata(self):
+        self.libro.prenota()
+        with CaptureQueriesContext(connection) as query:
+            risposta = self.client.get(reverse('elenco_libri'))
+        self.assertContains(risposta, 'Non disponibile')
+        self.assertFalse([q for q in query if 'EXISTS' in q['sql']])
+
+
+class RigheElencoPrestitiTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        self.profilo = crea_profilo()
+        Prestito.objects.create(profilo=self.profilo, libro=crea_libro(), stato=Prestito.RICHIESTO)
+
+    def test_profilo_rinominato(self):
+        self.assertContains(self.client.get(reverse('elenco_prestiti')), 'Mario Rossi')
+        self.profilo.cognome = 'Bianchi'
+        self.profilo.save()
+        risposta = self.client.get(reverse('elenco_prestiti'))
+        self.assertContains(risposta, 'Mario Bianchi')
+        self.assertNotContains(risposta, 'Mario Rossi')
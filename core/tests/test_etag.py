@@ -0,0 +1,51 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from core.models import Libro
+from .dati import crea_autore, crea_libro
+
+
+class CatalogoEtagTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.autore = crea_autore()
+        self.libro = crea_libro(autori=[self.autore])
+        crea_libro(titolo='Il pendolo di Foucault', isbn='9788845292606', autori=[self.autore])
+
+    def test_senza_modifiche_304(self):
+        etag = self.client.get(reverse('catalogo'))['ETag']
+        risposta = self.client.get(reverse('catalogo'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(risposta.status_code, 304)
+
+    def test_validatori_senza_conteggio(self):
+        etag = self.client.get(reverse('catalogo'))['ETag']
+        with CaptureQueriesContext(connection) as query:
+            self.client.get(reverse('catalogo'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(len(query), 1)
+        self.assertNotIn('COUNT', query[0]['sql'])
+
+    def test_autore_rinominato_200(self):
+        etag = self.client.get(reverse('catalogo'))['ETag']
+        self.autore.cognome = 'Calvino'
+        self.autore.save()
+        risposta = self.client.get(reverse('catalogo'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(risposta.status_code, 200)
+        self.assertContains(risposta, 'Calvino')
+
+    def test_editore_rinominato_200(self):
+        etag = self.client.get(reverse('catalogo'))['ETag']
+        editore = self.libro.editore
+        editore.nome = 'Einaudi'
+        editore.save()
+        risposta = self.client.get(reverse('catalogo'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(risposta.status_code, 200)
+
+    def test_libro_eliminato_200(self):
+        etag = self.client.get(reverse('catalogo'))['ETag']
+        Libro.objects.get(pk=self.libro.pk).delete()
+        risposta = self.client.get(reverse('catalogo'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(risposta.status_code, 200)
+        self.assertNotContains(risposta, 'Il nome della rosa')
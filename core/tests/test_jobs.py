@@ -0,0 +1,61 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import TestCase
+from django.utils import timezone
+from core.jobs import estrai_testi, preleva, recupera_persi, sweep
+from core.models import Job
+
+
+class PrelievoTest(TestCase):
+
+    def test_priorita_poi_ordine(self):
+        estrai = estrai_testi.accoda()
+        scadenze = sweep.accoda()
+        self.assertEqual(preleva('w').pk, scadenze.pk)
+        job = preleva('w')
+        self.assertEqual(job.pk, estrai.pk)
+        self.assertEqual((job.stato, job.worker, job.tentativi), (Job.IN_CORSO, 'w', 1))
+        self.assertIsNone(preleva('w'))
+
+    def test_job_gia_assegnato_non_riassegnato(self):
+        job = estrai_testi.accoda()
+        Job.objects.filter(pk=job.pk).update(stato=Job.IN_CORSO, worker='altro')
+        self.assertIsNone(preleva('w'))
+
+
+class RecuperoPersiTest(TestCase):
+
+    def perso(self, tentativi):
+        job = estrai_testi.accoda()
+        # prelevato `tentativi` volte, l'ultima da un worker terminato
+        Job.objects.filter(pk=job.pk).update(stato=Job.IN_CORSO, worker='w', tentativi=tentativi,
+                                             iniziato_at=timezone.now() - timedelta(days=1))
+        return job
+
+    def test_rimesso_in_coda_finche_restano_tentativi(self):
+        job = self.perso(tentativi=1)
+        self.assertEqual(recupera_persi(), (1, 0))
+        job.refresh_from_db()
+        self.assertEqual((job.stato, job.worker), (Job.IN_CODA, ''))
+        self.assertEqual(preleva('w').tentativi, 2)
+
+    def test_fallito_a_tentativi_esauriti(self):
+        job = self.perso(tentativi=Job._meta.get_field('max_tentativi').default)
+        self.assertEqual(recupera_persi(), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual(job.stato, Job.FALLITO)
+        self.assertIsNone(preleva('w'))
+
+
+class RunWorkerTest(TestCase):
+
+    @mock.patch('core.management.commands.run_worker.preleva',
+                side_effect=[OperationalError('database is locked'), None])
+    def test_errore_di_prelievo_non_ferma_il_worker(self, preleva):
+        errori = StringIO()
+        call_command('run_worker', una_volta=True, intervallo=0, stdout=StringIO(), stderr=errori)
+        self.assertEqual(preleva.call_count, 2)
+        self.assertIn('database is locked', errori.getvalue())
@@ -0,0 +1,46 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from core.models import Bookmark
+
+
+class MenuBookmarkTest(TestCase):
+    ''' Il menu dei bookmark è un frammento in cache per versione dell'utente. '''
+
+    def setUp(self):
+        cache.clear()
+        self.utente = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(self.utente)
+
+    def test_bookmark_aggiunto(self):
+        self.assertNotContains(self.client.get(reverse('elenco_libri')), 'Prestiti in corso')
+        risposta = self.client.post(reverse('aggiungi_bookmark'), {
+            'nome': 'Prestiti in corso', 'urlname': 'elenco_prestiti', 'urlparams': 'stato=IC'})
+        self.assertRedirects(risposta, reverse('elenco_libri'))
+        self.assertContains(self.client.get(reverse('elenco_libri')), 'Prestiti in corso')
+
+    def test_bookmark_eliminato(self):
+        bookmark = Bookmark.objects.create(user=self.utente, nome='Prestiti in corso',
+                                           urlname='elenco_prestiti', urlparams='stato=IC')
+        self.assertContains(self.client.get(reverse('elenco_libri')), 'Prestiti in corso')
+        bookmark.delete()
+        self.assertNotContains(self.client.get(reverse('elenco_libri')), 'Prestiti in corso')
+
+
+class BookmarkUrlTest(TestCase):
+
+    def setUp(self):
+        self.utente = User.objects.create_user('bibliotecario')
+
+    def test_senza_parametri(self):
+        for urlparams in (None, ''):
+            bookmark = Bookmark(user=self.utente, nome='Prestiti', urlname='elenco_prestiti',
+                                urlparams=urlparams)
+            self.assertEqual(bookmark.get_bookmark_url(), reverse('elenco_prestiti'))
+            self.assertEqual(bookmark.get_esporta_url(), reverse('esporta_prestiti'))
+
+    def test_con_parametri(self):
+        bookmark = Bookmark(user=self.utente, nome='Prestiti in corso', urlname='elenco_prestiti',
+                            urlparams='stato=IC')
+        self.assertEqual(bookmark.get_esporta_url(), reverse('esporta_prestiti') + '?stato=IC')
@@ -0,0 +1,60 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from core.models import Documento, Libro
+from core.search import DOCUMENTI, LIBRI, cerca_documenti, cerca_libri, get_backend
+from .dati import crea_autore, crea_libro
+
+
+class IndiceSqliteTest(TestCase):
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('backend SQLite')
+
+    def backend(self, indice):
+        backend = get_backend(connection.alias, indice)
+        if not backend.is_available():
+            self.skipTest('SQLite senza FTS5')
+        return backend
+
+    def test_index_libri(self):
+        libro = crea_libro()
+        Libro.objects.filter(pk=libro.pk).update(titolo='Il pendolo di Foucault')
+        self.backend(LIBRI).index([libro.pk])
+        trovati = cerca_libri(Libro.objects.all(), 'pendolo')
+        self.assertEqual(list(trovati.values_list('pk', flat=True)), [libro.pk])
+
+    def test_index_documenti(self):
+        utente = User.objects.create_user('bibliotecario')
+        documento = Documento.objects.create(user=utente, nome='Verbale', file='documenti/verbale.pdf')
+        Documento.objects.filter(pk=documento.pk).update(testo='assemblea dei soci')
+        self.backend(DOCUMENTI).index([documento.pk])
+        trovati = cerca_documenti(Documento.objects.all(), 'assemblea')
+        self.assertEqual(list(trovati.values_list('pk', flat=True)), [documento.pk])
+
+
+class RicercaLibriTest(TestCase):
+    ''' L'indice segue le modifiche fatte con l'ORM (core.signals). '''
+
+    def cerca(self, query):
+        return list(cerca_libri(Libro.objects.all(), query).values_list('titolo', flat=True))
+
+    def test_libro_creato(self):
+        crea_libro(autori=[crea_autore()])
+        self.assertEqual(self.cerca('rosa'), ['Il nome della rosa'])
+        self.assertEqual(self.cerca('eco'), ['Il nome della rosa'])
+
+    def test_libro_modificato(self):
+        libro = crea_libro()
+        libro.titolo = 'Il pendolo di Foucault'
+        libro.save()
+        self.assertEqual(self.cerca('pendolo'), ['Il pendolo di Foucault'])
+        self.assertEqual(self.cerca('rosa'), [])
+
+    def test_autore_rinominato(self):
+        autore = crea_autore()
+        crea_libro(autori=[autore])
+        autore.cognome = 'Calvino'
+        autore.save()
+        self.assertEqual(self.cerca('calvino'), ['Il nome della rosa'])
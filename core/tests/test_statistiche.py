@@ -0,0 +1,68 @@
+from django.test import TestCase
+from core.models import Prestito, StatisticheBiblioteca
+from .dati import crea_libro, crea_profilo
+
+
+class AllineamentoMixin:
+
+    def assertAllineate(self):
+        statistiche = StatisticheBiblioteca.get()
+        for campo, valore in StatisticheBiblioteca.calcola().items():
+            self.assertEqual(getattr(statistiche, campo), valore, campo)
+
+
+class StatisticheLibriTest(AllineamentoMixin, TestCase):
+
+    def setUp(self):
+        crea_libro()
+        StatisticheBiblioteca.ricalcola()
+
+    def test_libro_aggiunto(self):
+        crea_libro(titolo='Il pendolo di Foucault', isbn='9788845292606')
+        self.assertEqual(StatisticheBiblioteca.get().libri_totali, 2)
+        self.assertAllineate()
+
+    def test_libro_eliminato(self):
+        libro = crea_libro(titolo='Il pendolo di Foucault', isbn='9788845292606')
+        libro.delete()
+        self.assertEqual(StatisticheBiblioteca.get().libri_totali, 1)
+        self.assertAllineate()
+
+
+class StatistichePrestitiTest(AllineamentoMixin, TestCase):
+
+    def setUp(self):
+        self.libro = crea_libro()
+        self.profilo = crea_profilo()
+        StatisticheBiblioteca.ricalcola()
+
+    def presta(self, stato):
+        # come la vista di richiesta: libro prenotato, prestito creato
+        self.libro.prenota()
+        prestito = Prestito.objects.create(profilo=self.profilo, libro=self.libro, stato=stato)
+        self.libro.set_prestito_corrente(prestito)
+        return prestito
+
+    def test_prestito_creato(self):
+        self.presta(Prestito.RICHIESTO)
+        self.assertEqual(StatisticheBiblioteca.get().prestiti_richiesti, 1)
+        self.assertAllineate()
+
+    def test_libro_eliminato_con_prestito_in_corso(self):
+        self.presta(Prestito.INCORSO)
+        self.assertEqual(StatisticheBiblioteca.get().prestiti_incorso, 1)
+        self.libro.delete()
+        self.assertEqual(StatisticheBiblioteca.get().prestiti_incorso, 0)
+        self.assertAllineate()
+
+    def test_profilo_eliminato_con_richiesta(self):
+        self.presta(Prestito.RICHIESTO)
+        self.profilo.delete()
+        self.assertEqual(StatisticheBiblioteca.get().prestiti_richiesti, 0)
+
+    def test_stato_modificato_dall_admin(self):
+        prestito = self.presta(Prestito.RICHIESTO)
+        prestito.stato = Prestito.INCORSO
+        prestito.save()
+        statistiche = StatisticheBiblioteca.get()
+        self.assertEqual((statistiche.prestiti_richiesti, statistiche.prestiti_incorso), (0, 1))
@@ -7,6 +7,9 @@ urlpatterns = [
     path('elenco-prestiti/',
          views.ElencoPrestitiView.as_view(),
          name='elenco_prestiti'),
+    path('elenco-prestiti/esporta/',
+         views.EsportaPrestitiView.as_view(),
+         name='esporta_prestiti'),
     path('dettaglio-prestito/<int:pk>/',
          views.DettaglioPrestitoView.as_view(),
          name='dettaglio_prestito'),
@@ -25,6 +28,9 @@ urlpatterns = [
     path('dettaglio-prestito/<int:pk>/restituzione-libro/',
          views.RestituzioneLibroPrestitoView.as_view(),
          name='restituzione_libro'),
+    path('elenco-prestiti/operazioni/',
+         views.OperazioniPrestitiView.as_view(),
+         name='operazioni_prestiti'),
     path('dettaglio-prestito/sospensione-prestito/<int:profilo_pk>',
          views.SegnalaProfiloView.as_view(),
          name='segnala_profilo'),
@@ -32,6 +38,9 @@ urlpatterns = [
     path('elenco-libri/',
          views.ElencoLibriView.as_view(),
          name='elenco_libri'),
+    path('elenco-libri/esporta/',
+         views.EsportaLibriView.as_view(),
+         name='esporta_libri'),
     path('elenco-libri/<int:pk>/',
          views.DettaglioLibroView.as_view(),
          name='dettaglio_libro'),
@@ -48,12 +57,21 @@ urlpatterns = [
     path('elenco-documenti/',
          views.ElencoDocumentiView.as_view(),
          name='elenco_documenti'),
+    path('elenco-documenti/esporta/',
+         views.EsportaDocumentiView.as_view(),
+         name='esporta_documenti'),
     path('elenco-documenti/aggiungi-documento/',
          views.AggiungiDocumentoView.as_view(),
          name='aggiungi_documento'),
     path('elenco-documenti/<int:pk>/dettaglio-documento/',
          views.DettaglioDocumentoView.as_view(),
          name='dettaglio_documento'),
+    path('elenco-documenti/<int:pk>/scarica-documento/',
+         views.ScaricaDocumentoView.as_view(),
+         name='scarica_documento'),
+    path('elenco-documenti/<int:pk>/anteprima/<str:formato>/',
+         views.AnteprimaDocumentoView.as_view(),
+         name='anteprima_documento'),
     path('elenco-documenti/<int:pk>/modifica-documento/',
          views.ModificaDocumentoView.as_view(),
          name='modifica_documento'),
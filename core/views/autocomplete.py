@@ -3,12 +3,17 @@ import logging
 from django.db.models import Q
 from dal import autocomplete
 from ..models import Autore, Editore, Collana, Genere, Profilo
+from ..settings import INDICE_AUTOCOMPLETE
+from ..prefix_index import get_indice
 
 logger = logging.getLogger(__name__)
 
 class AutoreDalView(autocomplete.Select2QuerySetView):
 
     def get_queryset(self):
+        if INDICE_AUTOCOMPLETE:
+            return get_indice(Autore).search(self.q)
+
         qs = Autore.objects.all()
 
         if self.q:
@@ -20,6 +25,9 @@ class AutoreDalView(autocomplete.Select2QuerySetView):
 class EditoreDalView(autocomplete.Select2QuerySetView):
 
     def get_queryset(self):
+        if INDICE_AUTOCOMPLETE:
+            return get_indice(Editore).search(self.q)
+
         qs = Editore.objects.all()
 
         if self.q:
@@ -31,10 +39,14 @@ class EditoreDalView(autocomplete.Select2QuerySetView):
 class CollanaDalView(autocomplete.Select2QuerySetView):
 
     def get_queryset(self):
-        qs = Collana.objects.all()
-
         editore_id = self.forwarded.get('editore', None)
 
+        if INDICE_AUTOCOMPLETE:
+            filtri = {'editore_id': editore_id} if editore_id else {}
+            return get_indice(Collana).search(self.q, **filtri)
+
+        qs = Collana.objects.all()
+
         if editore_id:
             logger.debug("editore id: {}".format(editore_id))
             qs = qs.filter(editore_id=editore_id)
@@ -48,6 +60,9 @@ class CollanaDalView(autocomplete.Select2QuerySetView):
 class GenereDalView(autocomplete.Select2QuerySetView):
 
     def get_queryset(self):
+        if INDICE_AUTOCOMPLETE:
+            return get_indice(Genere).search(self.q)
+
         qs = Genere.objects.all()
 
         if self.q:
@@ -1,37 +1,63 @@
+import os
+from calendar import timegm
 from django.urls import reverse
 from django.contrib import messages
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect
 from django.contrib.auth.mixins import (PermissionRequiredMixin,
                                         LoginRequiredMixin, UserPassesTestMixin)
 from django.views.generic import (ListView, DetailView, CreateView, UpdateView,
                                   FormView)
+from ..settings import ELEMENTI_PER_PAGINA
 from ..models import Documento
 from ..forms import DocumentoForm
-from .mixins import FilteredQuerysetMixin
+from ..scaricamento import risposta_file, risposta_storage
+from ..anteprime import nomi_anteprime
+from ..estrazione import testi_in_attesa
+from .mixins import ConditionalGetMixin, EsportaMixin, FilteredQuerysetMixin, ListMixin
 from .filters import DocumentoFilter
 
 
-class ElencoDocumentiView(PermissionRequiredMixin, LoginRequiredMixin, FilteredQuerysetMixin, ListView):
+class DocumentiVisibiliMixin:
+    ''' I documenti dell'amministrazione sono visibili solo allo staff. '''
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        if not self.request.user.is_staff:
+            qs = qs.filter(is_amministrazione=False)
+        return qs
+
+
+class ElencoDocumentiView(PermissionRequiredMixin, LoginRequiredMixin, DocumentiVisibiliMixin, ConditionalGetMixin,
+                          ListMixin, FilteredQuerysetMixin, ListView):
     permission_required = 'core.view_documento'
     template_name = 'core/elenco_documenti.html'
     model = Documento
     filter_class = DocumentoFilter
+    keyset_paginate_by = ELEMENTI_PER_PAGINA
+    list_select_related = ('user',)
+    esporta_url_name = 'esporta_documenti'
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
         context['titolo'] = 'Elenco Documenti'
-        context['sottotitolo'] = '({})'.format(self.get_queryset().count())
-        # FilteredQuerysetMixin overridden
-        filters = self.get_filter_obj()
-        if filters is not None:
-            kwargs['object_list'] = filters.qs
-            if not self.request.user.is_staff:
-                context['object_list'] = filters.qs.filter(is_amministrazione=False)
-            kwargs['filter'] = filters
+        context['sottotitolo'] = context[self.count_context_name]
+        context['testi_in_attesa'] = testi_in_attesa()
         return context
 
+
+class EsportaDocumentiView(EsportaMixin, ElencoDocumentiView):
+    nome_file = 'documenti'
+    colonne = (
+        ('Nome', 'nome'),
+        ('Descrizione', 'descrizione'),
+        ('File', 'file'),
+        ('Caricato da', 'user__username'),
+        ('Data caricamento', 'data_upload'),
+        ('Amministrazione', 'is_amministrazione'),
+    )
+
 # Documenti
-class DettaglioDocumentoView(PermissionRequiredMixin, LoginRequiredMixin, DetailView):
+class DettaglioDocumentoView(PermissionRequiredMixin, LoginRequiredMixin, DocumentiVisibiliMixin, DetailView):
     permission_required = 'core.view_dettaglio_documento'
     template_name = 'core/dettaglio_documento.html'
     model = Documento
@@ -43,6 +69,40 @@ class DettaglioDocumentoView(PermissionRequiredMixin, LoginRequiredMixin, Detail
         return context
 
 
+class ScaricaDocumentoView(PermissionRequiredMixin, LoginRequiredMixin, DocumentiVisibiliMixin, DetailView):
+    ''' Download con gli stessi permessi del dettaglio; il trasferimento è
+    delegato al web server se BIBLIOTECA_DOWNLOAD_OFFLOAD è impostato.
+    '''
+    permission_required = 'core.view_dettaglio_documento'
+    model = Documento
+
+    def get_nome_download(self):
+        estensione = os.path.splitext(self.object.file.name)[1]
+        return '{}{}'.format(self.object.nome, estensione)
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        return risposta_file(request, self.object.file, self.get_nome_download(),
+                             timegm(self.object.updated_at.utctimetuple()))
+
+
+class AnteprimaDocumentoView(ScaricaDocumentoView):
+    ''' Anteprima o miniatura già generata; l'URL include il nome del file,
+    che cambia con il contenuto, quindi il browser la tiene in cache a lungo.
+    '''
+    max_age = 365 * 24 * 3600
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        formato = self.kwargs['formato']
+        if formato not in Documento.FORMATI_ANTEPRIMA or self.object.stato_anteprima != Documento.ANTEPRIMA_GENERATA:
+            raise Http404('Anteprima non disponibile')
+        storage = self.object.file.storage
+        nome = nomi_anteprime(storage, self.object.file.name)[formato]
+        return risposta_storage(request, storage, nome, '{}.png'.format(self.object.nome),
+                                allegato=False, max_age=self.max_age)
+
+
 class AggiungiDocumentoView(PermissionRequiredMixin, LoginRequiredMixin, CreateView):
     permission_required = 'core.add_documento'
     template_name = 'core/documento_form.html'
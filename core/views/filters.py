@@ -1,10 +1,13 @@
+import re
 from datetime import date
-from django.db.models import Q
 from django.forms import CheckboxInput
 import django_filters
 from dal import autocomplete
 from ..models import (Libro, Autore, Genere, SottoGenere, Editore, Collana,
                       Profilo, Prestito, Documento)
+from ..search import cerca_libri, cerca_documenti
+
+ISBN_RE = re.compile(r'^(\d{9}[\dX]|\d{13})$')
 
 
 class LibroFilter(django_filters.FilterSet):
@@ -46,7 +49,12 @@ class LibroFilter(django_filters.FilterSet):
                   'genere', 'collana']
 
     def cerca_titolo_isbn(self, queryset, name, value):
-        return queryset.filter(Q(titolo__icontains=value) | Q(isbn__icontains=value))
+        isbn = re.sub(r'[\s-]', '', value).upper()
+        if ISBN_RE.match(isbn):
+            esatto = queryset.filter(isbn=isbn)
+            if esatto.exists():
+                return esatto
+        return cerca_libri(queryset, value)
 
 
 class PrestitoFilter(django_filters.FilterSet):
@@ -87,10 +95,17 @@ class DocumentoFilter(django_filters.FilterSet):
         label="Nome file",
         lookup_expr='icontains',
     )
+    contenuto = django_filters.CharFilter(
+        label="Contenuto",
+        method="cerca_contenuto"
+    )
 
     class Meta:
         model = Documento
-        fields = ['is_amministrazione', 'nome', 'user', 'data_upload']
+        fields = ['is_amministrazione', 'nome', 'contenuto', 'user', 'data_upload']
+
+    def cerca_contenuto(self, queryset, name, value):
+        return cerca_documenti(queryset, value)
 
     def cerca_documento_amministrazione(self, queryset, name, value):
         if value:
@@ -1,21 +1,25 @@
 import logging
+from collections import defaultdict
 from datetime import date
 from django.shortcuts import render
 from django.urls import reverse, resolve
 from django.contrib import messages
 from django.http import HttpResponseRedirect, HttpResponseNotAllowed
 from django.db import transaction
-from django.db.models import Q
+from django.db.models import Q, Max, Prefetch
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth.mixins import PermissionRequiredMixin, LoginRequiredMixin
 from django.views.generic import (TemplateView, ListView, DetailView,
                                   CreateView, UpdateView, FormView)
 from ..models import (Libro, Autore, Genere, SottoGenere, Editore, Collana,
-                      Bookmark, Prestito)
+                      Bookmark, Prestito, StatisticheBiblioteca, prefetch_autori)
 from ..forms import (LibroForm, AutoreForm, GenereForm, SottoGenereForm,
                      EditoreForm, CollanaForm, BookmarkForm)
+from ..context_processors import Navigazione
+from ..esportazione import a_blocchi
+from ..settings import ELEMENTI_PER_PAGINA, ETAG_SALT
 from .filters import LibroFilter
-from .mixins import FilteredQuerysetMixin
+from .mixins import ConditionalGetMixin, EsportaMixin, FilteredQuerysetMixin, ListMixin
 
 logger = logging.getLogger(__name__)
 
@@ -26,28 +30,25 @@ class DashboardView(LoginRequiredMixin, TemplateView):
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
         context['titolo'] = 'Dashboard'
-        libri_disp = Libro.objects.all()
-        for lib in libri_disp:
-            if not lib.is_disponibile():
-                libri_disp = libri_disp.exclude(pk=lib.pk)
-        context['tot_libri_disponibili'] = libri_disp.count()
-        context['tot_libri'] = Libro.objects.all().count()
-        context['tot_prestiti_incorso'] = Prestito.objects.filter(stato=Prestito.INCORSO).count()
-        context['tot_prestiti_richiesti'] = Prestito.objects.filter(stato=Prestito.RICHIESTO).count()
+        statistiche = StatisticheBiblioteca.get()
+        context['tot_libri_disponibili'] = statistiche.libri_disponibili
+        context['tot_libri'] = statistiche.libri_totali
+        context['tot_prestiti_incorso'] = statistiche.prestiti_incorso
+        context['tot_prestiti_richiesti'] = statistiche.prestiti_richiesti
         return context
 
 
-class CatalogoView(FilteredQuerysetMixin, ListView):
+class CatalogoView(ConditionalGetMixin, FilteredQuerysetMixin, ListView):
     template_name = 'core/catalogo.html'
     model = Libro
     filter_class = LibroFilter
+    keyset_paginate_by = ELEMENTI_PER_PAGINA
+    list_select_related = ('editore', 'collana', 'genere')
+    list_prefetch_related = (prefetch_autori(),)
+    validatore_dipendenze = (Autore, Editore, Collana, Genere)
 
     def get_queryset(self):
-        qs = Libro.objects.all()
-        for lib in qs:
-            if not lib.is_disponibile():
-                qs = qs.exclude(pk=lib.pk)
-        return qs
+        return Libro.objects.filter(disponibile=True)
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
@@ -55,30 +56,96 @@ class CatalogoView(FilteredQuerysetMixin, ListView):
         return context
 
 
-class ElencoLibriView(PermissionRequiredMixin, FilteredQuerysetMixin, LoginRequiredMixin, ListView):
+class ElencoLibriView(PermissionRequiredMixin, LoginRequiredMixin, ConditionalGetMixin, ListMixin,
+                      FilteredQuerysetMixin, ListView):
     permission_required = 'core.view_libro'
     template_name = 'core/elenco_libri.html'
     model = Libro
     filter_class = LibroFilter
+    keyset_paginate_by = ELEMENTI_PER_PAGINA
+    list_select_related = ('editore', 'collana', 'genere')
+    list_prefetch_related = (prefetch_autori(),)
+    validatore_dipendenze = (Autore, Editore, Collana, Genere)
+    esporta_url_name = 'esporta_libri'
+
+    def get_parti_etag(self):
+        return super().get_parti_etag() + [Navigazione(self.request.user).chiave_bookmark]
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
         context['titolo'] = 'Elenco Libri'
+        context['sottotitolo'] = context[self.count_context_name]
         match = resolve(self.request.path)
         bm_form = BookmarkForm(initial={ 'urlname': match.url_name,
                                          'args': match.args,
                                          'kwargs': match.kwargs,
-                                         'urlparams': self.request.GET.urlencode()})
+                                         'urlparams': self.get_filter_urlparams()})
         context['bookmark_form'] = bm_form
         return context
 
 
-class DettaglioLibroView(PermissionRequiredMixin, LoginRequiredMixin, DetailView):
+def autori_per_libro(pks):
+    autori = defaultdict(list)
+    righe = (Libro.autori.through.objects.filter(libro_id__in=pks)
+             .order_by('autore__nome', 'autore__cognome')
+             .values_list('libro_id', 'autore__nome', 'autore__cognome'))
+    for libro_id, nome, cognome in righe:
+        autori[libro_id].append('{} {}'.format(nome, cognome))
+    return {pk: ', '.join(nomi) for pk, nomi in autori.items()}
+
+
+class EsportaLibriView(EsportaMixin, ElencoLibriView):
+    nome_file = 'libri'
+    colonne = (
+        ('ISBN', 'isbn'),
+        ('Titolo', 'titolo'),
+        ('Autori', 'autori'),
+        ('Editore', 'editore__nome'),
+        ('Collana', 'collana__nome'),
+        ('Genere', 'genere__nome'),
+        ('Disponibile', 'disponibile'),
+    )
+    # libri per query degli autori
+    blocco_autori = 500
+
+    def get_queryset(self):
+        return Libro.objects.all()
+
+    def get_righe(self, queryset):
+        campi = [campo for _, campo in self.colonne]
+        posizione = campi.index('autori')
+        campi.remove('autori')
+        righe = queryset.values_list('pk', *campi).iterator(chunk_size=self.chunk_size)
+        for blocco in a_blocchi(righe, self.blocco_autori):
+            autori = autori_per_libro([riga[0] for riga in blocco])
+            for pk, *valori in blocco:
+                valori.insert(posizione, autori.get(pk, ''))
+                yield valori
+
+
+class DettaglioLibroView(PermissionRequiredMixin, LoginRequiredMixin, ConditionalGetMixin, DetailView):
     permission_required = 'core.view_dettaglio_libro'
     template_name = 'core/dettaglio_libro.html'
     model = Libro
     context_object_name = 'libro'
 
+    def get_queryset(self):
+        storico = Prestito.objects.select_related('profilo')
+        return (Libro.objects.with_current_prestito()
+                .prefetch_related(Prefetch('prestito_set', queryset=storico)))
+
+    def get_ultima_modifica(self):
+        timbri = (Libro.objects.filter(pk=self.kwargs['pk'])
+                  .annotate(ultimo_prestito=Max('prestito__updated_at'))
+                  .values_list('updated_at', 'ultimo_prestito').first())
+        if timbri is None:
+            return None
+        return max(t for t in timbri if t is not None)
+
+    def get_parti_etag(self):
+        user = self.request.user
+        return [ETAG_SALT, user.pk, user.is_staff]
+
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
         context['titolo'] = '"{}"'.format(self.object.get_titolo_autori_display())
@@ -142,15 +209,16 @@ class AggiungiBookmarkView(PermissionRequiredMixin, LoginRequiredMixin, CreateVi
 
 
 # Autori
-class ElencoAutoriView(PermissionRequiredMixin, LoginRequiredMixin, ListView):
+class ElencoAutoriView(PermissionRequiredMixin, LoginRequiredMixin, ListMixin, FilteredQuerysetMixin, ListView):
     permission_required = 'core.view_autore'
     template_name = 'core/elenco_autori.html'
     model = Autore
+    keyset_paginate_by = ELEMENTI_PER_PAGINA
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
         context['titolo'] = 'Elenco Autori'
-        context['sottotitolo'] = '({})'.format(Autore.objects.all().count())
+        context['sottotitolo'] = context[self.count_context_name]
         return context
 
 
@@ -257,7 +325,7 @@ class ModificaSottoGenereView(PermissionRequiredMixin, LoginRequiredMixin, Updat
     permission_required = 'core.change_sottogenere'
     template_name = 'core/sottogenere_form.html'
     model = SottoGenere
-    form_class = SottoGenere
+    form_class = SottoGenereForm
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
@@ -1,22 +1,196 @@
+import hashlib
+from calendar import timegm
+from datetime import date
+from django.contrib import messages
+from django.db.models import Max
+from django.http import Http404, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from ..counts import conta, versione_conteggi
+from ..esportazione import righe_csv, raggruppa, comprimi_gzip
+from ..paginators import KeysetPaginator, InvalidCursor
+from ..settings import RIGHE_TIMEOUT, ETAG_SALT
+
+
 class FilteredQuerysetMixin:
     filter_class = None
+    keyset_paginate_by = None
+    cursor_kwarg = 'cursore'
+    # piano di rendering: relazioni lette dal template per ogni riga
+    list_select_related = ()
+    list_prefetch_related = ()
+    # durata in cache dei frammenti delle righe, vedi {% cache %} nei template
+    righe_timeout = RIGHE_TIMEOUT
+    # vista che esporta la ricerca corrente, vedi EsportaMixin
+    esporta_url_name = None
 
     def get_filter_obj(self, initial=None):
         if initial is None:
-            initial = self.request.GET
+            # un solo filtro per richiesta, sul queryset già calcolato dalla ListView
+            if not hasattr(self, '_filter_obj'):
+                self._filter_obj = self.get_filter_obj(self.request.GET)
+            return self._filter_obj
         if self.filter_class is not None:
-            return self.filter_class(initial, queryset=self.get_queryset())
+            queryset = getattr(self, 'object_list', None)
+            if queryset is None:
+                queryset = self.get_queryset()
+            return self.filter_class(initial, queryset=queryset)
         else:
             return None
 
+    def apply_render_plan(self, queryset):
+        if self.list_select_related:
+            queryset = queryset.select_related(*self.list_select_related)
+        if self.list_prefetch_related:
+            queryset = queryset.prefetch_related(*self.list_prefetch_related)
+        return queryset
+
+    def get_filter_urlparams(self):
+        ''' Parametri della ricerca corrente senza cursore, es. per i bookmark. '''
+        params = self.request.GET.copy()
+        params.pop(self.cursor_kwarg, None)
+        return params.urlencode()
+
+    def get_esporta_urls(self):
+        if self.esporta_url_name is None:
+            return []
+        urls = []
+        for formato, etichetta in EsportaMixin.FORMATI:
+            params = self.request.GET.copy()
+            params.pop(self.cursor_kwarg, None)
+            params['formato'] = formato
+            urls.append((etichetta, '{}?{}'.format(reverse(self.esporta_url_name), params.urlencode())))
+        return urls
+
+    def get_cursor_url(self, cursor):
+        params = self.request.GET.copy()
+        params[self.cursor_kwarg] = cursor
+        return '?{}'.format(params.urlencode())
+
+    def paginate_keyset(self, queryset):
+        paginator = KeysetPaginator(queryset, self.keyset_paginate_by)
+        try:
+            page = paginator.get_page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor as err:
+            raise Http404(err)
+        if page.has_next():
+            page.next_url = self.get_cursor_url(page.next_cursor)
+        if page.has_previous():
+            page.previous_url = self.get_cursor_url(page.previous_cursor)
+        return paginator, page
+
     def get_context_data(self, **kwargs):
         filters = self.get_filter_obj()
         if filters is not None:
             kwargs['object_list'] = filters.qs
             kwargs['filter'] = filters
+        self.filtered_queryset = kwargs.get('object_list')
+        if self.filtered_queryset is None:
+            self.filtered_queryset = self.object_list
+        kwargs['object_list'] = self.apply_render_plan(self.filtered_queryset)
+        if self.keyset_paginate_by:
+            paginator, page = self.paginate_keyset(kwargs['object_list'])
+            kwargs.update({
+                'object_list': page.object_list,
+                'paginator': paginator,
+                'page_obj': page,
+                'is_paginated': page.has_other_pages(),
+            })
+        kwargs['righe_timeout'] = self.righe_timeout
+        kwargs['esporta_urls'] = self.get_esporta_urls()
         return super().get_context_data(**kwargs)
 
 
+class EsportaMixin:
+    ''' Esporta in CSV il queryset filtrato di una lista, in streaming su
+    values_list().iterator(): la memoria non cresce con le righe.
+    Da combinare con la vista della lista, di cui riusa permessi,
+    get_queryset() e filtro.
+    '''
+    FORMATI = (
+        ('csv', 'CSV'),
+        ('csv.gz', 'CSV compresso (gzip)'),
+    )
+    # coppie (intestazione, campo di values_list)
+    colonne = ()
+    nome_file = 'esportazione'
+    chunk_size = 2000
+
+    def get_righe(self, queryset):
+        campi = [campo for _, campo in self.colonne]
+        return queryset.values_list(*campi).iterator(chunk_size=self.chunk_size)
+
+    def get(self, request, *args, **kwargs):
+        formato = request.GET.get('formato', 'csv')
+        if formato not in dict(self.FORMATI):
+            raise Http404('Formato non supportato: {}'.format(formato))
+        self.object_list = self.get_queryset()
+        filtro = self.get_filter_obj()
+        queryset = self.object_list if filtro is None else filtro.qs
+        contenuto = raggruppa(righe_csv([intestazione for intestazione, _ in self.colonne],
+                                        self.get_righe(queryset)))
+        if formato == 'csv.gz':
+            response = StreamingHttpResponse(comprimi_gzip(contenuto), content_type='application/gzip')
+        else:
+            response = StreamingHttpResponse(contenuto, content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="{}-{}.{}"'.format(
+            self.nome_file, date.today().isoformat(), formato)
+        return response
+
+
+class ConditionalGetMixin:
+    ''' GET condizionale: ETag e Last-Modified calcolati dal timbro di modifica
+    più recente, senza eseguire il queryset principale; se il client ha già
+    la versione corrente la risposta è un 304.
+    '''
+    validatore_model = None
+    # modelli mostrati nelle righe accanto al principale (es. gli autori dei
+    # libri): le loro modifiche non spostano il timbro del modello principale
+    validatore_dipendenze = ()
+
+    def get_ultima_modifica(self):
+        model = self.validatore_model or self.model
+        return model._default_manager.aggregate(ultima=Max('updated_at'))['ultima']
+
+    def get_parti_etag(self):
+        ''' Tutto ciò da cui dipende la pagina oltre al timbro di modifica. '''
+        model = self.validatore_model or self.model
+        user = self.request.user
+        return [
+            ETAG_SALT,
+            # versioni dei conteggi: cambiano anche con le eliminazioni, che non
+            # spostano il timbro massimo, e costano una lettura dalla cache
+            [versione_conteggi(m) for m in (model,) + tuple(self.validatore_dipendenze)],
+            user.pk, user.is_staff,
+            self.request.GET.urlencode(),
+        ]
+
+    def get_validatori(self):
+        if len(messages.get_messages(self.request)):
+            # messaggi in attesa: la pagina va generata per mostrarli
+            return None, None
+        ultima_modifica = self.get_ultima_modifica()
+        if ultima_modifica is None:
+            return None, None
+        parti = [ultima_modifica.isoformat()] + self.get_parti_etag()
+        etag = '"{}"'.format(hashlib.md5(repr(parti).encode()).hexdigest())
+        return etag, timegm(ultima_modifica.utctimetuple())
+
+    def get(self, request, *args, **kwargs):
+        etag, ultima_modifica = self.get_validatori()
+        if etag is None:
+            return super().get(request, *args, **kwargs)
+        response = get_conditional_response(request, etag=etag, last_modified=ultima_modifica)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(ultima_modifica)
+        # il browser riconvalida a ogni caricamento, la pagina resta privata
+        patch_cache_control(response, private=True, max_age=0)
+        return response
+
+
 class BreadcrumbsMixin:
 
     def get_context_data(self, **kwargs):
@@ -47,16 +221,16 @@ class BasePageMixin:
 
 class ListMixin:
     count_context_name = 'objects_count'
+    count_estimate = True
 
     def get_objects_count(self, object_list=None, **kwargs):
-        if object_list is not None:
-            count = object_list.count()
-        else:
-            count = self.object_list.count()
-        return count
+        if object_list is None:
+            # con FilteredQuerysetMixin: il queryset filtrato, non la pagina
+            object_list = getattr(self, 'filtered_queryset', self.object_list)
+        return conta(object_list, stima=self.count_estimate)
 
     def get_objects_count_display(self, **kwargs):
-        return '[{}]'.format(self.get_objects_count(**kwargs))
+        return '({})'.format(self.get_objects_count(**kwargs))
 
     def get_context_data(self, object_list=None, **context):
         context = super().get_context_data(object_list=object_list, **context)
@@ -1,34 +1,77 @@
 from datetime import date
 from django.urls import reverse
 from django.contrib import messages
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, HttpResponseNotAllowed, JsonResponse
 from django.db import transaction
 from django.db.models import Q
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth.mixins import (PermissionRequiredMixin,
                                         LoginRequiredMixin)
 from django.views.generic import (ListView, DetailView, CreateView, UpdateView,
-                                  FormView)
-from ..settings import MAX_LIBRI_INPRESTITO
-from ..models import (Libro, Profilo, Prestito)
+                                  FormView, TemplateView)
+from ..settings import MAX_LIBRI_INPRESTITO, ELEMENTI_PER_PAGINA
+from ..models import (Libro, Profilo, Prestito, StatisticheBiblioteca,
+                      prefetch_autori)
 from ..forms import (ProfiloForm, PrestitoForm, SegnalazioneForm)
-from .mixins import FilteredQuerysetMixin
+from ..circolazione import consegna_prestiti, restituisci_prestiti
+from ..contesa import RiprovaSuContesaMixin
+from .mixins import EsportaMixin, FilteredQuerysetMixin, ListMixin
 from .filters import PrestitoFilter
 
 
-class ElencoPrestitiView(PermissionRequiredMixin, LoginRequiredMixin, FilteredQuerysetMixin, ListView):
+class _OperazioneNegata(Exception):
+    ''' Annulla la transazione; il messaggio è mostrato tornando a `url`. '''
+    def __init__(self, messaggio, url):
+        super().__init__(messaggio)
+        self.url = url
+
+
+def _motivo_richiesta_negata(profilo):
+    profilo.refresh_from_db(fields=['tot_richieste', 'data_fine_sospensione'])
+    if profilo.is_sospeso:
+        return "ATTENZIONE: questo profilo è sospeso fino al {}".format(profilo.data_fine_sospensione)
+    return "E' possibile richiede al massimo {} libri alla volta".format(MAX_LIBRI_INPRESTITO)
+
+
+class ElencoPrestitiView(PermissionRequiredMixin, LoginRequiredMixin, ListMixin, FilteredQuerysetMixin, ListView):
     permission_required = 'core.view_prestito'
     template_name = 'core/elenco_prestiti.html'
     model = Prestito
     filter_class = PrestitoFilter
+    keyset_paginate_by = ELEMENTI_PER_PAGINA
+    list_select_related = ('libro', 'profilo')
+    list_prefetch_related = (prefetch_autori('libro__autori'),)
+    esporta_url_name = 'esporta_prestiti'
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
         context['titolo'] = 'Elenco Prestiti'
-        context['sottotitolo'] = '({})'.format(self.get_queryset().count())
+        context['sottotitolo'] = context[self.count_context_name]
         return context
 
 
+class EsportaPrestitiView(EsportaMixin, ElencoPrestitiView):
+    nome_file = 'prestiti'
+    colonne = (
+        ('ISBN', 'libro__isbn'),
+        ('Libro', 'libro__titolo'),
+        ('Nome', 'profilo__nome'),
+        ('Cognome', 'profilo__cognome'),
+        ('Stato', 'stato'),
+        ('Data richiesta', 'data_richiesta'),
+        ('Data consegna', 'data_inizio'),
+        ('Data scadenza', 'data_scadenza'),
+    )
+
+    def get_righe(self, queryset):
+        stati = dict(Prestito.STATI_PRESTITO)
+        posizione = [campo for _, campo in self.colonne].index('stato')
+        for riga in super().get_righe(queryset):
+            riga = list(riga)
+            riga[posizione] = stati.get(riga[posizione], riga[posizione])
+            yield riga
+
+
 class DettaglioPrestitoView(PermissionRequiredMixin, LoginRequiredMixin, DetailView):
     permission_required = 'core.view_dettaglio_prestito'
     template_name = 'core/dettaglio_prestito.html'
@@ -42,8 +85,9 @@ class DettaglioPrestitoView(PermissionRequiredMixin, LoginRequiredMixin, DetailV
         return context
 
 
-class PrestitoUpdateProfiloView(CreateView):
+class PrestitoUpdateProfiloView(RiprovaSuContesaMixin, CreateView):
     template_name = 'core/prestito_update_profilo.html'
+    url_contesa = 'catalogo'
     model = Prestito
     form_class = PrestitoForm
 
@@ -64,28 +108,29 @@ class PrestitoUpdateProfiloView(CreateView):
         try:
             with transaction.atomic():
                 libro = Libro.objects.get(pk=self.kwargs['libro_pk'])
-                profilo = Profilo.objects.select_for_update(nowait=True).get(pk=prestito.profilo.pk)
-                if profilo.tot_richieste >= MAX_LIBRI_INPRESTITO:
-                    messages.error(self.request, "E' possibile richiede al massimo {} libri alla volta".format(MAX_LIBRI_INPRESTITO))
-                    return HttpResponseRedirect(redirect_to=reverse('catalogo'))
-                if profilo.is_sospeso:
-                    messages.error(self.request, "ATTENZIONE: questo profilo è sospeso fino al {}".format(profilo.data_fine_sospensione))
-                    return HttpResponseRedirect(redirect_to=reverse('catalogo'))
-                profilo.tot_richieste += 1
-                profilo.save()
+                # UPDATE condizionali al posto dei lock: se una condizione non
+                # vale nessuna riga cambia e la transazione viene annullata
+                if not libro.prenota():
+                    raise _OperazioneNegata("Questo libro non è disponibile per il prestito.", reverse('catalogo'))
+                if not prestito.profilo.registra_richiesta():
+                    raise _OperazioneNegata(_motivo_richiesta_negata(prestito.profilo), reverse('catalogo'))
                 prestito.libro = libro
                 prestito.stato = Prestito.RICHIESTO
                 prestito.save()
-                messages.success(self.request, "Richiesta prestito registrata con successo!")
-
+                libro.set_prestito_corrente(prestito)
+            messages.success(self.request, "Richiesta prestito registrata con successo!")
+        except _OperazioneNegata as err:
+            messages.error(self.request, str(err))
+            return HttpResponseRedirect(redirect_to=err.url)
         except ObjectDoesNotExist as err:
             messages.error(self.request, err)
         return super().form_valid(form)
 
 
-class PrestitoCreateProfiloView(FormView):
+class PrestitoCreateProfiloView(RiprovaSuContesaMixin, FormView):
     template_name = 'core/prestito_create_profilo.html'
     form_class = ProfiloForm
+    url_contesa = 'catalogo'
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
@@ -102,6 +147,9 @@ class PrestitoCreateProfiloView(FormView):
         try:
             with transaction.atomic():
                 libro = Libro.objects.get(pk=self.kwargs['libro_pk'])
+                if not libro.prenota():
+                    raise _OperazioneNegata("Questo libro non è disponibile per il prestito.", reverse('catalogo'))
+                # profilo appena creato: nessuna concorrenza sui contatori
                 profilo.tot_richieste += 1
                 profilo.save()
                 prestito_dict = {
@@ -110,97 +158,129 @@ class PrestitoCreateProfiloView(FormView):
                     'stato': Prestito.RICHIESTO
                 }
                 prestito = Prestito.objects.create(**prestito_dict)
-                prestito.save()
-                messages.success(self.request, "Richiesta prestito registrata con successo!")
-
+                libro.set_prestito_corrente(prestito)
+            messages.success(self.request, "Richiesta prestito registrata con successo!")
+        except _OperazioneNegata as err:
+            messages.error(self.request, str(err))
+            return HttpResponseRedirect(redirect_to=err.url)
         except ObjectDoesNotExist as err:
             messages.error(self.request, err)
         return super().form_valid(form)
 
 
-class ConsegnaLibroPrestitoView(PermissionRequiredMixin, LoginRequiredMixin, DetailView):
+class ConsegnaLibroPrestitoView(PermissionRequiredMixin, LoginRequiredMixin, RiprovaSuContesaMixin, DetailView):
     permission_required = 'core.gestisci_prestito'
+    url_contesa = 'elenco_prestiti'
     model = Prestito
 
     def post(self, request, *args, **kwargs):
+        dettaglio = reverse('dettaglio_prestito', kwargs={'pk': self.kwargs['pk']})
         try:
             with transaction.atomic():
-                prestito = Prestito.objects.select_for_update(nowait=True).get(pk=self.kwargs['pk'])
-                profilo = Profilo.objects.select_for_update(nowait=True).get(pk=prestito.profilo.pk)
-                if prestito.is_incorso():
-                    messages.error(self.request, "Questo prestito è già in corso.")
-                    return HttpResponseRedirect(redirect_to=reverse('dettaglio_prestito', kwargs={'pk': prestito.pk}))
-                if profilo.tot_libri >= MAX_LIBRI_INPRESTITO:
-                    messages.error(self.request, "E' possibile avere in prestito al massimo {} libri alla volta".format(MAX_LIBRI_INPRESTITO))
-                    return HttpResponseRedirect(redirect_to=reverse('dettaglio_prestito', kwargs={'pk': prestito.pk}))
-                if profilo.tot_richieste == 0:
-                    messages.error(self.request, "Questo profilo non ha richieste in atto.")
-                    return HttpResponseRedirect(redirect_to=reverse('elenco_prestiti'))
-                profilo.tot_libri += 1
-                profilo.tot_richieste -= 1
-                profilo.save()
-                prestito.stato = Prestito.INCORSO
-                prestito.data_inizio = date.today()
-                prestito.save()
-                prestito.data_scadenza = prestito.calc_data_scadenza()
-                prestito.save()
-                messages.success(self.request, "Consegna libro registrata con successo.")
-        except ObjectDoesNotExist:
-            messages.error(self.request)
-        return HttpResponseRedirect(redirect_to=reverse('dettaglio_prestito', kwargs={'pk': prestito.pk}))
+                prestito = Prestito.objects.select_related('libro', 'profilo').get(pk=self.kwargs['pk'])
+                if not prestito.registra_consegna():
+                    raise _OperazioneNegata("Questo prestito non è in attesa di consegna.", dettaglio)
+                profilo = prestito.profilo
+                if not profilo.registra_consegna():
+                    profilo.refresh_from_db(fields=['tot_libri', 'tot_richieste'])
+                    if profilo.tot_richieste == 0:
+                        raise _OperazioneNegata("Questo profilo non ha richieste in atto.", reverse('elenco_prestiti'))
+                    raise _OperazioneNegata("E' possibile avere in prestito al massimo {} libri alla volta".format(MAX_LIBRI_INPRESTITO), dettaglio)
+                StatisticheBiblioteca.sposta_prestito(da=Prestito.RICHIESTO, a=Prestito.INCORSO)
+                prestito.libro.aggiorna_disponibilita()
+            messages.success(self.request, "Consegna libro registrata con successo.")
+        except _OperazioneNegata as err:
+            messages.error(self.request, str(err))
+            return HttpResponseRedirect(redirect_to=err.url)
+        except ObjectDoesNotExist as err:
+            messages.error(self.request, err)
+            return HttpResponseRedirect(redirect_to=reverse('elenco_prestiti'))
+        return HttpResponseRedirect(redirect_to=dettaglio)
 
 
-class RifiutaRichiestaPrestitoView(PermissionRequiredMixin, LoginRequiredMixin, DetailView):
+class RifiutaRichiestaPrestitoView(PermissionRequiredMixin, LoginRequiredMixin, RiprovaSuContesaMixin, DetailView):
     permission_required = 'core.gestisci_prestito'
+    url_contesa = 'elenco_prestiti'
     model = Prestito
 
     def post(self, request, *args, **kwargs):
         try:
             with transaction.atomic():
-                prestito = Prestito.objects.select_for_update(nowait=True).get(pk=self.kwargs['pk'])
-                profilo = Profilo.objects.select_for_update(nowait=True).get(pk=prestito.profilo.pk)
-                if profilo.tot_richieste == 0:
-                    messages.error(self.request, "Questo profilo non ha richieste di prestito")
-                    return HttpResponseRedirect(redirect_to=reverse('elenco_prestiti'))
-                profilo.tot_richieste -= 1
-                profilo.save()
-                prestito.delete()
-                messages.success(self.request, "Richiesta prestito rifiutata.")
-
+                prestito = Prestito.objects.select_related('libro', 'profilo').get(pk=self.kwargs['pk'])
+                # la cancellazione stessa è condizionata allo stato
+                if not Prestito.objects.filter(pk=prestito.pk, stato=Prestito.RICHIESTO).delete()[0]:
+                    raise _OperazioneNegata("Questa richiesta non è più in attesa.", reverse('elenco_prestiti'))
+                if not prestito.profilo.annulla_richiesta():
+                    raise _OperazioneNegata("Questo profilo non ha richieste di prestito", reverse('elenco_prestiti'))
+                prestito.libro.aggiorna_disponibilita()
+            messages.success(self.request, "Richiesta prestito rifiutata.")
+        except _OperazioneNegata as err:
+            messages.error(self.request, str(err))
+            return HttpResponseRedirect(redirect_to=err.url)
         except ObjectDoesNotExist as err:
             messages.error(self.request, err)
         return HttpResponseRedirect(redirect_to=reverse('elenco_prestiti'))
 
 
-class RestituzioneLibroPrestitoView(PermissionRequiredMixin, LoginRequiredMixin, DetailView):
+class RestituzioneLibroPrestitoView(PermissionRequiredMixin, LoginRequiredMixin, RiprovaSuContesaMixin, DetailView):
     permission_required = 'core.gestisci_prestito'
+    url_contesa = 'elenco_prestiti'
     model = Prestito
 
     def post(self, request, *args, **kwargs):
         try:
             with transaction.atomic():
-                prestito = Prestito.objects.select_for_update(nowait=True).get(pk=self.kwargs['pk'])
-                profilo = Profilo.objects.select_for_update(nowait=True).get(pk=prestito.profilo.pk)
-                if prestito.is_richiesto():
-                    messages.error(self.request, "Questo prestito non è ancora stato consegnato.")
-                    return HttpResponseRedirect(redirect_to=reverse('dettaglio_prestito', kwargs={'pk': prestito.pk}))
-                if profilo.tot_libri == 0:
-                    messages.error(self.request, "Questo profilo non ha prestiti")
-                    return HttpResponseRedirect(redirect_to=reverse('elenco_prestiti'))
-
-                prestito.stato = Prestito.CONCLUSO
-                profilo.tot_libri -= 1
-                profilo.save()
-                prestito.save()
-                messages.success(self.request, "Restituzione libro registrata con successo!")
-
+                prestito = Prestito.objects.select_related('libro', 'profilo').get(pk=self.kwargs['pk'])
+                if not prestito.registra_restituzione():
+                    messaggio = ("Questo prestito non è in corso." if prestito.is_concluso()
+                                 else "Questo prestito non è ancora stato consegnato.")
+                    raise _OperazioneNegata(messaggio, reverse('dettaglio_prestito', kwargs={'pk': prestito.pk}))
+                if not prestito.profilo.registra_restituzione():
+                    raise _OperazioneNegata("Questo profilo non ha prestiti", reverse('elenco_prestiti'))
+                StatisticheBiblioteca.sposta_prestito(da=Prestito.INCORSO, a=Prestito.CONCLUSO)
+                prestito.libro.aggiorna_disponibilita()
+            messages.success(self.request, "Restituzione libro registrata con successo!")
+        except _OperazioneNegata as err:
+            messages.error(self.request, str(err))
+            return HttpResponseRedirect(redirect_to=err.url)
         except ObjectDoesNotExist as err:
             messages.error(self.request, err)
         return HttpResponseRedirect(redirect_to=reverse('elenco_prestiti'))
 
 
-class SegnalaProfiloView(PermissionRequiredMixin, LoginRequiredMixin, CreateView):
+class OperazioniPrestitiView(PermissionRequiredMixin, LoginRequiredMixin, RiprovaSuContesaMixin, TemplateView):
+    ''' Consegna o restituzione di più prestiti selezionati nell'elenco. '''
+    permission_required = 'core.gestisci_prestito'
+    url_contesa = 'elenco_prestiti'
+    messaggio_contesa = "Alcuni profili sono impegnati in un'altra operazione, riprovare."
+    template_name = 'core/esito_operazioni_prestiti.html'
+    operazioni = {
+        'consegna': ('Consegna libri', consegna_prestiti),
+        'restituzione': ('Restituzione libri', restituisci_prestiti),
+    }
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponseNotAllowed(['POST'])
+
+    def post(self, request, *args, **kwargs):
+        if request.POST.get('azione') not in self.operazioni:
+            messages.error(self.request, "Operazione non valida.")
+            return HttpResponseRedirect(redirect_to=reverse('elenco_prestiti'))
+        titolo, operazione = self.operazioni[request.POST['azione']]
+        esiti = operazione(request.POST.getlist('prestiti'))
+        if request.is_ajax():
+            return JsonResponse({'esiti': [
+                {'prestito': esito.pk, 'riuscito': esito.riuscito, 'messaggio': esito.messaggio}
+                for esito in esiti]})
+        context = self.get_context_data(esiti=esiti)
+        context['titolo'] = titolo
+        context['sottotitolo'] = '({} su {})'.format(sum(esito.riuscito for esito in esiti), len(esiti))
+        return self.render_to_response(context)
+
+
+class SegnalaProfiloView(PermissionRequiredMixin, LoginRequiredMixin, RiprovaSuContesaMixin, CreateView):
     permission_required = 'core.sospendi_profilo'
+    url_contesa = 'elenco_prestiti'
     template_name = 'core/segnalazione_form.html'
     form_class = SegnalazioneForm
 
@@ -215,20 +295,20 @@ class SegnalaProfiloView(PermissionRequiredMixin, LoginRequiredMixin, CreateView
         return reverse('elenco_prestiti')
 
     def form_valid(self, form):
-        segnalazione = form.save()
-        print(segnalazione)
         try:
             with transaction.atomic():
+                # nella transazione: un tentativo ripetuto non duplica la segnalazione
+                segnalazione = form.save()
                 profilo = Profilo.objects.select_for_update(nowait=True).get(pk=self.kwargs['profilo_pk'])
                 if form.cleaned_data['sospendi']:
                     profilo.data_inizio_sospensione = date.today()
                     profilo.save()
                     profilo.data_fine_sospensione = profilo.calculate_fine_sospensione()
-                    messages.success(self.request, "Sospensione profilo avviata con successo")
-                #segnalazione = form.save()
                 profilo.segnalazioni.add(segnalazione)
                 profilo.save()
-                messages.success(self.request, "Segnalazione effettuata con successo.")
+            if form.cleaned_data['sospendi']:
+                messages.success(self.request, "Sospensione profilo avviata con successo")
+            messages.success(self.request, "Segnalazione effettuata con successo.")
         except ObjectDoesNotExist as err:
             messages.error(self.request, err)
         return super().form_valid(form)